@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark der HTML-Text-Extraktion von fetch_url_content.
+
+Vergleicht die frühere Vollparse-Variante (BeautifulSoup mit html.parser, find_all pro Tag, Kürzung erst am Ende)
+mit der Streaming-Extraktion (StreamingTextExtractor mit Byte-Budget und vorzeitigem Abbruch) über einen
+Korpus gespeicherter HTML-Seiten. Gemessen werden Laufzeit, Spitzen-Speicher (tracemalloc) und gelesene Bytes.
+
+Aufruf (aus dem Projektverzeichnis):
+    python benchmarks/bench_html_extraction.py [KORPUS_VERZEICHNIS] [--repeat N]
+
+Gespeicherte Seiten (*.html, *.htm) einfach in das Korpus-Verzeichnis legen (Standard: benchmarks/html_corpus).
+Ist das Verzeichnis leer, werden synthetische Seiten in verschiedenen Größen erzeugt.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_tools  # noqa: E402
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "html_corpus")
+LEGACY_TAGS_TO_REMOVE = ['script', 'style', 'nav', 'header', 'footer', 'aside', 'form',
+                         'button', 'select', 'textarea', 'input', 'label',
+                         'img', 'svg', 'noscript', 'iframe', 'link', 'meta',
+                         'figure', 'figcaption']
+
+def legacy_extract(html_bytes: bytes) -> str:
+    """Frühere Extraktion aus fetch_url_content (vollständiger Parse, eine Suche pro Tag)."""
+    soup = BeautifulSoup(html_bytes, 'html.parser')
+    for tag_name in LEGACY_TAGS_TO_REMOVE:
+        for tag in soup.find_all(tag_name):
+            tag.decompose()
+    main_content = soup.find('main') or soup.find('article')
+    target_element = main_content if main_content else (soup.body if soup.body else soup)
+    text = target_element.get_text(separator='\n', strip=True) if target_element else ""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    cleaned_text = '\n'.join(chunk for chunk in chunks if chunk)
+    return cleaned_text[:workflow_tools.MAX_CONTENT_LENGTH]
+
+def streaming_extract(html_bytes: bytes) -> tuple[str, int]:
+    """Neue Extraktion: Blöcke wie beim Download einspeisen, bis genug Text oder das Byte-Budget erreicht ist."""
+    extractor = workflow_tools.StreamingTextExtractor(workflow_tools.MAX_CONTENT_LENGTH)
+    budget = min(len(html_bytes), workflow_tools.MAX_HTML_BYTES)
+    bytes_read = 0
+    while bytes_read < budget:
+        chunk = html_bytes[bytes_read:min(bytes_read + workflow_tools.HTTP_CHUNK_SIZE, budget)]
+        bytes_read += len(chunk)
+        if extractor.feed(chunk):
+            break
+    return extractor.get_text()[:workflow_tools.MAX_CONTENT_LENGTH], bytes_read
+
+def generate_synthetic_corpus(directory: str) -> None:
+    """Erzeugt Seiten mit typischem Ballast (Navigation, Skripte, Styles, Footer) von ca. 20 KB bis 8 MB."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(42)
+    words = "daten agent workflow modell analyse ergebnis quelle suche text seite inhalt python code test".split()
+    for target_kb, with_main in [(20, True), (200, True), (800, False), (2000, True), (8000, False)]:
+        parts = ["<!DOCTYPE html><html><head><meta charset='utf-8'><title>Seite</title>",
+                 "<style>" + "body{margin:0}" * 200 + "</style></head><body>",
+                 "<header><nav>" + "".join(f"<a href='/{i}'>Link {i}</a>" for i in range(200)) + "</nav></header>"]
+        body = ["<main>" if with_main else "<div>"]
+        while sum(len(p) for p in parts + body) < target_kb * 1024:
+            body.append("<p>" + " ".join(rng.choice(words) for _ in range(60)) + "</p>")
+            if rng.random() < 0.1:
+                body.append("<script>var x = '" + "a" * 2000 + "';</script>")
+            if rng.random() < 0.05:
+                body.append("<figure><img src='x.png'><figcaption>Bild</figcaption></figure>")
+        body.append("</main>" if with_main else "</div>")
+        parts += body + ["<footer>Impressum</footer></body></html>"]
+        with open(os.path.join(directory, f"synthetic_{target_kb}kb.html"), "w", encoding="utf-8") as f:
+            f.write("".join(parts))
+
+def measure(func, html_bytes: bytes, repeat: int) -> tuple[float, int, Any]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html_bytes)
+        durations.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(html_bytes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(durations), peak, result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if not os.path.isdir(args.corpus) or not any(name.endswith((".html", ".htm")) for name in os.listdir(args.corpus)):
+        print(f"Keine HTML-Dateien in '{args.corpus}' gefunden – erzeuge synthetischen Korpus.")
+        generate_synthetic_corpus(args.corpus)
+    print(f"Parser: {'lxml' if workflow_tools.lxml_etree is not None else 'html.parser'} | Byte-Budget: {workflow_tools.MAX_HTML_BYTES // 1024} KB")
+    print(f"{'Datei':<32}{'KB':>8}{'alt ms':>10}{'neu ms':>10}{'alt MB':>9}{'neu MB':>9}{'gelesen KB':>12}  Text gleich")
+    totals = [0.0, 0.0]
+    for name in sorted(os.listdir(args.corpus)):
+        if not name.endswith((".html", ".htm")):
+            continue
+        with open(os.path.join(args.corpus, name), "rb") as f:
+            html_bytes = f.read()
+        new_time, new_peak, (new_text, bytes_read) = measure(streaming_extract, html_bytes, args.repeat)
+        totals[1] += new_time
+        if BeautifulSoup is not None:
+            old_time, old_peak, old_text = measure(legacy_extract, html_bytes, args.repeat)
+            totals[0] += old_time
+            old_columns = f"{old_time * 1000:>10.1f}{new_time * 1000:>10.1f}{old_peak / 2**20:>9.1f}{new_peak / 2**20:>9.1f}"
+            same_text = "ja" if old_text == new_text else "nein"
+        else:
+            old_columns = f"{'-':>10}{new_time * 1000:>10.1f}{'-':>9}{new_peak / 2**20:>9.1f}"
+            same_text = "-"
+        print(f"{name[:31]:<32}{len(html_bytes) // 1024:>8}{old_columns}{bytes_read // 1024:>12}  {same_text}")
+    if BeautifulSoup is not None and totals[1]:
+        print(f"Gesamt: alt {totals[0] * 1000:.0f} ms, neu {totals[1] * 1000:.0f} ms (Faktor {totals[0] / totals[1]:.1f}x)")
+    else:
+        print(f"Gesamt: neu {totals[1] * 1000:.0f} ms (beautifulsoup4 für den Vergleich nicht installiert)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-End-Benchmark der Workflow-Engine mit dem Offline-Mock-Backend (keine API-Aufrufe, kein Netzwerk).
+
+Führt jede mitgelieferte Konfiguration (agents_config_*.json, research_agent_config.json,
+plugin_developer_config.json) für mehrere Aufgaben gleichzeitig aus und misst Durchsatz, p50/p95-Latenz pro Aufgabe,
+Wartezeit im Rate-Limiter und Spitzen-Speicher (tracemalloc); '--json' enthält zusätzlich die über alle Aufgaben
+summierte Zeitleiste je Kategorie (Modell, Tools, Limiter, Prompt, ...). Mit '--latency fixed:0' bleibt nur der Eigenaufwand
+des Runners (Prompt-Aufbau, Scheduler, Tool-Loop, Limiter) übrig.
+
+Aufruf (aus dem Projektverzeichnis):
+    python benchmarks/bench_workflows.py [--tasks 8] [--concurrency 4] [--latency lognormal:0.3,0.5] [--rpm 600]
+    python benchmarks/bench_workflows.py --error-rate 0.05 --rate-limit-rate 0.05 --json ergebnisse.json
+    python benchmarks/bench_workflows.py --unavailable-models "*flash*" --fallback-model mock-backup
+    python benchmarks/bench_workflows.py --model-policy fast --model-latency-factors "*lite*=0.5" "*pro*=3"
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_context  # noqa: E402
+import workflow_engine  # noqa: E402
+from mock_model_backend import MockModelBackend  # noqa: E402
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def bundled_configs() -> List[str]:
+    """Alle mitgelieferten Workflow-Konfigurationen (ohne Generator-Konfiguration)."""
+    paths = sorted(glob.glob(os.path.join(PROJECT_DIR, "agents_config_*.json")))
+    paths += [os.path.join(PROJECT_DIR, name) for name in ("research_agent_config.json", "plugin_developer_config.json")]
+    return [path for path in paths if os.path.exists(path)]
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+async def run_config(path: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Führt eine Konfiguration für args.tasks Aufgaben aus und liefert die Messwerte."""
+    workflow_name = os.path.splitext(os.path.basename(path))[0]
+    plan = workflow_engine.get_workflow_plan(path, workflow_name, show_messages=False)
+    if plan is None or plan.graph_error:
+        return {"config": workflow_name, "error": plan.graph_error if plan else "Konfiguration ungültig"}
+    workflow_engine.get_rate_limiter.cache_clear()
+    rate_limiter = workflow_engine.get_rate_limiter()
+    rate_limiter.configure(args.rpm, args.tpm)
+    workflow_engine.get_circuit_breaker.cache_clear()
+    workflow_engine.get_model_stats.cache_clear()
+    backend = MockModelBackend(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed,
+                               retry_delay=args.retry_delay, unavailable_models=tuple(args.unavailable_models), model_latency_factors=args.model_latency_factors)
+    callbacks = workflow_context.WorkflowCallbacks()
+    callbacks.stream_output = args.stream
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    trace_totals: Dict[str, float] = {}
+    retry_totals = {"retries": 0, "retry_wait_s": 0.0, "fallback_calls": 0}
+    agent_results: List[Dict[str, Any]] = []
+
+    async def run_task(task_index: int) -> tuple[float, bool]:
+        async with semaphore:
+            state = workflow_context.RunState(use_response_cache=False, incremental_execution=False, record_run=False, fallback_model_id=args.fallback_model,
+                                             default_model_policy=args.model_policy)
+            start = time.perf_counter()
+            success = await workflow_engine.run_workflow_async(backend, workflow_engine.DEFAULT_MODEL_ID, plan, f"Benchmark-Aufgabe {task_index}", state, callbacks, args.max_parallel_agents)
+            for category, entry in state.trace.summary().items():
+                trace_totals[category] = trace_totals.get(category, 0.0) + entry["total_s"]
+            agent_results.extend(state.agent_results_display)
+            for result in state.agent_results_display:
+                for key in retry_totals:
+                    retry_totals[key] += result.get(key, 0)
+            return time.perf_counter() - start, success
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    task_results = await asyncio.gather(*(run_task(task_index) for task_index in range(args.tasks)))
+    wall_time = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies = [latency for latency, _ in task_results]
+    limiter_metrics = rate_limiter.metrics()
+    return {
+        "config": workflow_name,
+        "agents": len(plan.agents),
+        "tasks": args.tasks,
+        "succeeded": sum(success for _, success in task_results),
+        "wall_s": wall_time,
+        "tasks_per_s": args.tasks / wall_time,
+        "model_calls": backend.stats["calls"],
+        "calls_per_s": backend.stats["calls"] / wall_time,
+        "p50_s": statistics.median(latencies),
+        "p95_s": percentile(latencies, 0.95),
+        "limiter_avg_wait_s": limiter_metrics["avg_wait_s"],
+        "limiter_p95_wait_s": limiter_metrics["p95_wait_s"],
+        "limiter_total_wait_s": limiter_metrics["total_wait_s"],
+        "simulated_latency_s": backend.stats["simulated_latency_s"],
+        "injected_errors": backend.stats["errors"] + backend.stats["rate_limited"],
+        **retry_totals,
+        "peak_memory_mb": peak_memory / 2**20,
+        "trace_totals_s": trace_totals,
+        "models": workflow_engine.summarize_model_usage(agent_results),
+    }
+
+async def run_all(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(4, args.concurrency * args.max_parallel_agents * 2)))
+    return [await run_config(path, args) for path in (args.configs or bundled_configs())]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="*", help="Nur diese Konfigurationen messen (Standard: alle mitgelieferten)")
+    parser.add_argument("--tasks", type=int, default=8, help="Aufgaben pro Konfiguration")
+    parser.add_argument("--concurrency", type=int, default=4, help="Gleichzeitig laufende Aufgaben")
+    parser.add_argument("--max-parallel-agents", type=int, default=4)
+    parser.add_argument("--latency", default="lognormal:0.3,0.5", help="Latenz des Mock-Backends, z.B. fixed:0, uniform:0.1,0.5")
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Anteil der Aufrufe mit 503-Fehler")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Anteil der Aufrufe mit 429-Fehler")
+    parser.add_argument("--retry-delay", type=float, help="Retry-Hinweis (Sekunden) in den 429-Fehlern des Mock-Backends")
+    parser.add_argument("--unavailable-models", nargs="*", default=[], help="Modelle (fnmatch-Muster), die immer mit 503 antworten, z.B. \"*flash*\"")
+    parser.add_argument("--fallback-model", help="Ausweichmodell bei offenem Circuit Breaker")
+    parser.add_argument("--model-policy", choices=list(workflow_engine.MODEL_POLICIES), help="Routing-Policy für alle Agenten ohne eigenes 'model'/'model_policy'")
+    parser.add_argument("--model-latency-factors", nargs="*", default=[], help="Latenzfaktor pro Modell im Mock-Backend, z.B. \"*lite*=0.5\" \"*pro*=3\"")
+    parser.add_argument("--stream", action="store_true", help="Streaming-Pfad statt generate_content messen")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Messwerte zusätzlich als JSON in diese Datei schreiben")
+    args = parser.parse_args()
+    args.model_latency_factors = {pattern: float(factor) for pattern, _, factor in (entry.rpartition("=") for entry in args.model_latency_factors)}
+    print(f"Mock-Latenz: {args.latency} | {args.tasks} Aufgaben, {args.concurrency} parallel | RPM {args.rpm}, TPM {args.tpm or 'unbegrenzt'}")
+    print(f"{'Konfiguration':<30}{'Agenten':>8}{'OK':>6}{'Aufr.':>7}{'Aufg/s':>8}{'Aufr/s':>8}{'p50 s':>8}{'p95 s':>8}{'Ø Warten':>10}{'p95 Warten':>12}{'Fehler':>8}{'Wdh.':>6}{'MB':>7}")
+    results = asyncio.run(run_all(args))
+    for result in results:
+        if "error" in result:
+            print(f"{result['config'][:29]:<30}  übersprungen: {result['error']}")
+            continue
+        print(f"{result['config'][:29]:<30}{result['agents']:>8}{result['succeeded']:>6}{result['model_calls']:>7}{result['tasks_per_s']:>8.2f}{result['calls_per_s']:>8.1f}"
+              f"{result['p50_s']:>8.2f}{result['p95_s']:>8.2f}{result['limiter_avg_wait_s']:>10.2f}{result['limiter_p95_wait_s']:>12.2f}{result['injected_errors']:>8}{result['retries']:>6}{result['peak_memory_mb']:>7.1f}")
+        for row in result["models"]:
+            print(f"{'':<4}{row['model']:<34}{row['calls']:>6} Aufrufe  Ø {row['avg_latency_s']:.2f} s  {row['input_tokens'] + row['output_tokens']} Tokens")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
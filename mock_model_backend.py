@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Lokales Mock-Backend für die Workflow-Engine: beantwortet Modellaufrufe deterministisch und ohne Netzwerk.
+Gedacht für Benchmarks des Runners (Scheduler, Rate-Limiter, Tool-Loop, Streaming) ohne API-Kontingent.
+
+Latenz-Spezifikationen (Sekunden):
+    fixed:0.2               konstante Latenz
+    uniform:0.1,0.6         gleichverteilt zwischen Minimum und Maximum
+    lognormal:0.4,0.5       log-normalverteilt mit Median 0.4 s und Sigma 0.5 (realistische lange Ausläufer)
+
+Function-Call-Skripte ordnen Agentennamen (fnmatch-Muster) eine Liste von Turns zu; jeder Turn ist eine Liste von
+Aufrufen {"name": ..., "args": {...}}, ein leerer Turn beendet den Tool-Loop mit einer Textantwort (ebenso ein Aufruf mit
+abgeschaltetem Function Calling, wie im letzten Turn bei erschöpftem Tool-Budget). Ohne Skript ruft
+ein Agent im ersten Turn alle deklarierten Tools aus MOCK_OFFLINE_TOOL_ARGS auf; Web-Tools werden nie aufgerufen.
+
+Für Tests der Wiederholungslogik injiziert das Backend 503- und 429-Fehler (429 optional mit RetryInfo 'retryDelay')
+und kann einzelne Modelle dauerhaft ausfallen lassen ('unavailable_models'), um Circuit Breaker und Fallback zu prüfen.
+Mit 'model_latency_factors' (fnmatch-Muster -> Faktor) antworten Modelle unterschiedlich schnell, z.B. für das Modell-Routing.
+"""
+import asyncio
+import fnmatch
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from typing import List, Dict, Any, Callable, Union, Optional, Tuple, AsyncIterator
+
+from google.genai import errors
+from google.genai.types import Part, Content, FunctionCall, GenerateContentConfig, GenerateContentResponse, GenerateContentResponseUsageMetadata, Candidate
+
+from workflow_engine import ModelBackend, CHARS_PER_TOKEN, estimate_token_count
+
+MOCK_OFFLINE_TOOL_ARGS: Dict[str, Dict[str, Any]] = {
+    "get_current_datetime": {},
+    "calculator": {"expression": "6 * 7"},
+    "list_uploaded_files": {},
+    "search_uploaded_files": {"query": "main"},
+}
+MOCK_WORDS = "agent workflow modell analyse ergebnis daten schritt plan code test review datei funktion klasse".split()
+AGENT_NAME_PATTERN = re.compile(r"Rolle: (.+?)\):")
+
+def parse_latency_spec(spec: str) -> Callable[[random.Random], float]:
+    """Wandelt eine Latenz-Spezifikation (fixed/uniform/lognormal) in eine Funktion rng -> Sekunden um."""
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(value) for value in params.split(",") if value.strip()]
+    except ValueError:
+        values = []
+    match kind.strip(), values:
+        case "fixed", [seconds] if seconds >= 0:
+            return lambda rng: seconds
+        case "uniform", [low, high] if 0 <= low <= high:
+            return lambda rng: rng.uniform(low, high)
+        case "lognormal", [median, sigma] if median > 0 and sigma >= 0:
+            return lambda rng: rng.lognormvariate(math.log(median), sigma)
+        case _:
+            raise ValueError(f"Ungültige Latenz-Spezifikation '{spec}' (erwartet fixed:S, uniform:MIN,MAX oder lognormal:MEDIAN,SIGMA).")
+
+class MockModelBackend(ModelBackend):
+    """
+    Deterministisches Offline-Backend. Latenz, Antwortlänge, Tool-Aufrufe und injizierte Fehler hängen nur von
+    'seed', Agentenname, Turn und Versuch ab, nicht von der Ausführungsreihenfolge paralleler Agenten oder Aufgaben:
+    Die Versuche werden pro Anfrage (Agent und erste Nachricht, also Aufgabe und Eingaben) und Turn gezählt.
+    error_rate und rate_limit_rate sind Wahrscheinlichkeiten pro Aufruf für einen 503- bzw. 429-Fehler der API;
+    retry_delay setzt den Retry-Hinweis der 429-Fehler. Modelle, die auf ein Muster aus unavailable_models passen
+    (z.B. "*flash*"), antworten immer mit 503. model_latency_factors skaliert die Latenz pro Modell (erstes passendes Muster).
+    """
+    cacheable = False
+
+    def __init__(self, latency: str = "lognormal:0.4,0.5", output_tokens: Tuple[int, int] = (80, 400), tool_script: Optional[Dict[str, List[List[Dict[str, Any]]]]] = None,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, first_token_share: float = 0.3, stream_chunks: int = 8, file_blocks: bool = True, seed: int = 0,
+                 retry_delay: Optional[float] = None, unavailable_models: Tuple[str, ...] = (), model_latency_factors: Optional[Dict[str, float]] = None):
+        self.latency = parse_latency_spec(latency)
+        self.output_tokens = output_tokens
+        self.tool_script = tool_script or {}
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.first_token_share = first_token_share
+        self.stream_chunks = max(1, stream_chunks)
+        self.file_blocks = file_blocks
+        self.seed = seed
+        self.retry_delay = retry_delay
+        self.unavailable_models = unavailable_models
+        self.model_latency_factors = model_latency_factors or {}
+        self._attempts: Dict[Tuple[str, str, int], int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "function_call_responses": 0, "errors": 0, "rate_limited": 0, "simulated_latency_s": 0.0, "calls_per_model": {}}
+
+    def _request_identity(self, contents: List[Union[Part, Content]]) -> Tuple[str, str, int]:
+        """
+        Agentenname (aus dem Systemprompt), Hash der ersten Nachricht (Systemprompt, Aufgabe und Eingaben) und Turn
+        (Anzahl bisheriger Modell-Antworten) einer Anfrage.
+        """
+        first = contents[0] if contents else None
+        first_parts = (first.parts or []) if isinstance(first, Content) else [first]
+        first_texts = [part.text for part in first_parts if getattr(part, "text", None)]
+        request_hash = hashlib.sha256("\0".join(first_texts).encode("utf-8")).hexdigest()[:16]
+        match = AGENT_NAME_PATTERN.search(first_texts[0]) if first_texts else None
+        agent_name = match.group(1) if match else request_hash[:12]
+        turn = sum(1 for item in contents if isinstance(item, Content) and item.role == "model")
+        return agent_name, request_hash, turn
+
+    def _scripted_calls(self, agent_name: str, turn: int, config: Optional[GenerateContentConfig]) -> List[Dict[str, Any]]:
+        calling_config = config.tool_config.function_calling_config if config and config.tool_config else None
+        if calling_config is not None and calling_config.mode == "NONE":
+            return []
+        for pattern, turns in self.tool_script.items():
+            if fnmatch.fnmatchcase(agent_name, pattern):
+                return turns[turn] if turn < len(turns) else []
+        if turn > 0 or not config or not config.tools:
+            return []
+        declared = [declaration.name for tool in config.tools for declaration in (tool.function_declarations or [])]
+        return [{"name": name, "args": MOCK_OFFLINE_TOOL_ARGS[name]} for name in declared if name in MOCK_OFFLINE_TOOL_ARGS]
+
+    def _mock_text(self, agent_name: str, rng: random.Random, output_tokens: int) -> str:
+        words = []
+        target_chars = output_tokens * CHARS_PER_TOKEN
+        while sum(len(word) + 1 for word in words) < target_chars:
+            words.append(rng.choice(MOCK_WORDS))
+        text = f"Mock-Antwort von {agent_name}:\n{' '.join(words)}"
+        if self.file_blocks:
+            file_name = re.sub(r"\W+", "_", agent_name).strip("_").lower() or "agent"
+            text += f"\n\n## FILE: mock/{file_name}.txt\n```text\n{' '.join(words[:20])}\n```"
+        return text
+
+    def _plan_response(self, model: str, contents: List[Union[Part, Content]], config: Optional[GenerateContentConfig]) -> Tuple[float, Union[GenerateContentResponse, Exception]]:
+        """Bestimmt Latenz und Antwort (oder Fehler) einer Anfrage, ohne zu warten."""
+        agent_name, request_hash, turn = self._request_identity(contents)
+        with self._lock:
+            attempt = self._attempts.get((agent_name, request_hash, turn), 0)
+            self._attempts[(agent_name, request_hash, turn)] = attempt + 1
+        rng = random.Random(f"{self.seed}|{agent_name}|{turn}|{attempt}")
+        latency = max(0.0, self.latency(rng))
+        latency *= next((factor for pattern, factor in self.model_latency_factors.items() if fnmatch.fnmatchcase(model, pattern)), 1.0)
+        roll = rng.random()
+        unavailable = any(fnmatch.fnmatchcase(model, pattern) for pattern in self.unavailable_models)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["calls_per_model"][model] = self.stats["calls_per_model"].get(model, 0) + 1
+            self.stats["simulated_latency_s"] += latency
+            if roll < self.rate_limit_rate and not unavailable:
+                self.stats["rate_limited"] += 1
+                retry_info = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{self.retry_delay}s"}] if self.retry_delay is not None else []
+                return latency * 0.1, errors.ClientError(429, {"error": {"code": 429, "message": "Mock: Resource has been exhausted.", "status": "RESOURCE_EXHAUSTED", "details": retry_info}})
+            if unavailable or roll < self.rate_limit_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return latency, errors.ServerError(503, {"error": {"code": 503, "message": "Mock: The model is overloaded.", "status": "UNAVAILABLE"}})
+        prompt_tokens = estimate_token_count(contents)
+        calls = self._scripted_calls(agent_name, turn, config)
+        if calls:
+            with self._lock:
+                self.stats["function_call_responses"] += 1
+            parts = [Part(function_call=FunctionCall(name=call["name"], args=call.get("args") or {})) for call in calls]
+            output_tokens = 10 * len(parts)
+        else:
+            output_tokens = rng.randint(*self.output_tokens)
+            parts = [Part(text=self._mock_text(agent_name, rng, output_tokens))]
+        return latency, GenerateContentResponse(
+            candidates=[Candidate(content=Content(role="model", parts=parts), finish_reason="STOP")],
+            usage_metadata=GenerateContentResponseUsageMetadata(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens, total_token_count=prompt_tokens + output_tokens),
+        )
+
+    def generate_content(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> GenerateContentResponse:
+        latency, response = self._plan_response(model, contents, config)
+        time.sleep(latency)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def generate_content_async(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> GenerateContentResponse:
+        latency, response = self._plan_response(model, contents, config)
+        await asyncio.sleep(latency)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def generate_content_stream_async(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> AsyncIterator[GenerateContentResponse]:
+        """Liefert Text in 'stream_chunks' Teilen; der erste Chunk kommt nach first_token_share der Latenz."""
+        latency, response = self._plan_response(model, contents, config)
+        if isinstance(response, Exception):
+            await asyncio.sleep(latency)
+            raise response
+        await asyncio.sleep(latency * self.first_token_share)
+        parts = response.candidates[0].content.parts
+        if parts[0].text is None:
+            yield response
+            return
+        text = parts[0].text
+        chunk_size = -(-len(text) // self.stream_chunks)
+        pieces = [text[start:start + chunk_size] for start in range(0, len(text), chunk_size)]
+        for index, piece in enumerate(pieces):
+            if index > 0:
+                await asyncio.sleep(latency * (1 - self.first_token_share) / (len(pieces) - 1))
+            is_last = index == len(pieces) - 1
+            yield GenerateContentResponse(
+                candidates=[Candidate(content=Content(role="model", parts=[Part(text=piece)]), finish_reason="STOP" if is_last else None)],
+                usage_metadata=response.usage_metadata if is_last else None,
+            )
+
+    async def count_tokens_async(self, model: str, contents: List[Union[Part, Content]]) -> int | None:
+        return estimate_token_count(contents)
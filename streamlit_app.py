@@ -3,400 +3,242 @@
 Dieses Script implementiert einen KI-Workflow-Generator und -Runner mit Streamlit.
 Es verwendet unter anderem das strukturierte Pattern Matching (PEP 634-636) und den Union-Typ-Operator (PEP 604).
 Außerdem wird großer Wert auf klare, einfache und lesbare Strukturen gelegt.
-Dieses Skript beinhaltet zusätzlich eine RPM-Funktion, die es erlaubt, die Anfragen an das Gemini Modell
-auf eine bestimmte Anzahl pro Minute zu begrenzen.
+Die Ausführung der Workflows (inklusive RPM-Begrenzung der Anfragen an das Gemini Modell) liegt in
+workflow_engine.py und kann über workflow_cli.py auch ohne Oberfläche genutzt werden.
 
 Benötigte Installationen:
-pip install streamlit google-generativeai python-dotenv Pillow python-dateutil asteval requests beautifulsoup4 wikipedia
+pip install streamlit google-generativeai python-dotenv Pillow python-dateutil asteval requests wikipedia
+Optional (schnellere HTML-Extraktion): pip install lxml
 """
 
 # Importiere alle notwendigen Bibliotheken
 import streamlit as st
 import google.genai as genai
-from google.genai.types import Part, Tool, GenerateContentConfig, GoogleSearch, FunctionDeclaration, FunctionResponse
-from dotenv import load_dotenv
-import os
-import json
-from typing import List, Dict, Any, Callable, Union
-import io
-from PIL import Image
+from google.genai.types import Part
+from typing import List, Any
 import datetime
+import json
 import re
-import zipfile
+import time
+import threading
 import traceback
-import time  # Wird für die RPM-Implementierung benötigt
-import inspect  # Hinzugefügt für Tool-Docstrings
-
-# --- Neue Importe für zusätzliche Tools ---
-from asteval import Interpreter  # Sicherer Ersatz für eval
-import requests
-from bs4 import BeautifulSoup  # Zur Text-Extraktion aus HTML
-import wikipedia
-
-# --- Neue globale Konstanten für die Websuche ---
-load_dotenv()
-GOOGLE_CSE_API_KEY = os.getenv("GOOGLE_CSE_API_KEY")
-GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
-MAX_RESULTS = 5
-
-# --- Konstanten ---
-API_KEY = os.getenv("API_KEY")
-DEFAULT_MODEL_ID = "gemini-2.0-flash-exp"  # Alternativ: "gemini-2.0-pro-exp-02-05" gemini-2.0-flash-exp gemini-1.5-flash-latest
-GENERATOR_WORKFLOW_NAME = "Dynamischer Workflow Generator"
-GENERATOR_CONFIG_FILE = "generator_agent_config.json"
-REQUESTS_TIMEOUT = 10  # Sekunden
-MAX_CONTENT_LENGTH = 5000  # Zeichen
-
-# --- RPM Funktionalität ---
-def rpm_limiter(func: Callable) -> Callable:
-    """
-    Decorator, der sicherstellt, dass die dekorierte Funktion nicht öfter als eine bestimmte Anzahl
-    von Aufrufen pro Minute ausgeführt wird.
-    """
-    def wrapper(*args, **kwargs):
-        rpm_limit = st.session_state.get("rpm_limit", 30)
-        current_time = time.time()
-        if "rpm_last_reset" not in st.session_state:
-            st.session_state.rpm_last_reset = current_time
-            st.session_state.rpm_calls = 0
-
-        if current_time - st.session_state.rpm_last_reset >= 60:
-            st.session_state.rpm_last_reset = current_time
-            st.session_state.rpm_calls = 0
-
-        if st.session_state.rpm_calls >= rpm_limit:
-            wait_time = 60 - (current_time - st.session_state.rpm_last_reset)
-            st.warning(f"RPM Limit erreicht. Warte {wait_time:.2f} Sekunden, bis neue Anfragen gesendet werden können.")
-            time.sleep(wait_time)
-            st.session_state.rpm_last_reset = time.time()
-            st.session_state.rpm_calls = 0
-
-        st.session_state.rpm_calls += 1
-        return func(*args, **kwargs)
-    return wrapper
-
-# API Call Wrapper
-@rpm_limiter
-def limited_generate_content(client: genai.Client, model: str, contents: List[Part], config: GenerateContentConfig) -> Any:
-    """
-    Wrapper um den API-Aufruf an das Gemini Modell zu rate-limiten.
-    """
-    return client.models.generate_content(model=model, contents=contents, config=config)
-
-# --- Neue Funktion: Custom Google Search (Websuche) ---
-def custom_google_search(query: str) -> str:
-    """
-    Führt eine Google Custom Search durch unter Verwendung der in der .env definierten API-Key und ID.
-    """
-    if not GOOGLE_CSE_API_KEY or not GOOGLE_CSE_ID:
-        return "Fehler: Google Custom Search API Key oder ID nicht konfiguriert in .env."
-    url_match = re.match(r"^\s*https?://([\w\-\.]+)", query.strip())
-    search_query = f"site:{url_match.group(1)}" if url_match else query.strip()
-    if not search_query:
-        return "Fehler: Leere Suchanfrage erhalten."
-    api_url = "https://www.googleapis.com/customsearch/v1"
-    params = {
-        "key": GOOGLE_CSE_API_KEY,
-        "cx": GOOGLE_CSE_ID,
-        "q": search_query,
-        "num": MAX_RESULTS,
-        "hl": "de",
-        "gl": "de"
-    }
-    try:
-        response = requests.get(api_url, params=params, timeout=REQUESTS_TIMEOUT)
-        response.raise_for_status()
-        data = response.json()
-        items = data.get("items", [])
-        if not items:
-            spelling = data.get("spelling", {}).get("correctedQuery")
-            return f"Keine direkten Ergebnisse für '{search_query}'. Meinten Sie: '{spelling}'?" if spelling else f"Keine Ergebnisse für '{search_query}'."
-        results = f"Suchergebnisse '{search_query}' ({len(items)}):\n\n" + "\n\n".join(
-            f"{i+1}. Title: {item.get('title','?')}\n   Link: {item.get('link','?')}\n   Beschreibung: {item.get('snippet','?').replace(chr(10),' ').strip()}"
-            for i, item in enumerate(items)
-        )
-        return results.strip()
-    except requests.exceptions.RequestException as e:
-        status = e.response.status_code if e.response else '?'
-        return f"Google-Suche Fehler '{search_query}' (Status: {status}): {e}"
-    except Exception as e:
-        return f"Unerw. Google-Suche Fehler '{search_query}': {type(e).__name__} - {e}"
-
-# --- Hilfsfunktionen (Tools für Agenten) ---
-def get_current_datetime() -> str:
-    """Gibt das aktuelle Datum und die Uhrzeit im ISO-Format zurück."""
-    return datetime.datetime.now().isoformat()
-
-def safe_calculator(expression: str) -> str:
-    """
-    Berechnet sicher einen mathematischen Ausdruck mithilfe von asteval.
-    """
-    try:
-        aeval = Interpreter()
-        result = aeval(expression)
-        if aeval.error:
-            error_msg = ", ".join(err.msg for err in aeval.error)
-            return f"Fehler bei der Berechnung von '{expression}': {error_msg}"
-        if isinstance(result, (int, float, complex)):
-            return f"Das Ergebnis von '{expression}' ist {result}"
+import functools
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from workflow_context import RunTrace, WorkflowCallbacks, set_run_context, ensure_run_state
+from workflow_engine import (
+    API_KEY, DEFAULT_MODEL_ID, GENERATOR_WORKFLOW_NAME, GENERATOR_CONFIG_FILE, ArtifactStore, WorkflowPlan, get_rate_limiter, get_workflow_plan,
+    save_generated_config, generate_workflow_config, GENERATOR_CANDIDATES, run_workflow, prepare_resume,
+    FALLBACK_MODEL_ID, MODEL_MAX_RETRIES, get_circuit_breaker, MODEL_POLICIES, get_model_stats, summarize_model_usage,
+)
+from workflow_storage import RESPONSE_CACHE_DB, RUN_STORE_DB, get_response_cache, get_tool_cache, get_run_store
+from workflow_tools import MAX_CONTENT_LENGTH, AVAILABLE_TOOLS, sync_upload_store, release_upload_entry, get_file_bytes, get_file_text_view
+
+# --- Anbindung der Engine an Streamlit ---
+class StreamlitCallbacks(WorkflowCallbacks):
+    """Zeigt Meldungen, Fortschritt und gestreamte Antworten der Engine in der Streamlit-Oberfläche an."""
+    def __init__(self, progress_placeholder: Any = None, live_area: Any = None):
+        self.progress_placeholder = progress_placeholder
+        self.live_area = live_area
+        self.stream_output = live_area is not None
+        self.live_placeholders = {}
+
+    def message(self, level: str, text: str) -> None:
+        getattr(st, level)(text)
+
+    def progress(self, running_agents: List[str], finished_count: int, total_count: int) -> None:
+        if self.progress_placeholder is not None:
+            self.progress_placeholder.info(f"🧠 Aktiv: **{', '.join(running_agents)}** ({finished_count}/{total_count} Agenten abgeschlossen)...")
+
+    def stream(self, agent_name: str, streamed_text: str, time_to_first_token: float, function_call_names: List[str]) -> None:
+        live_placeholder = self.live_placeholders.get(agent_name)
+        if live_placeholder is None:
+            live_placeholder = self.live_placeholders[agent_name] = self.live_area.expander(f"✍️ {agent_name} (TTFT {time_to_first_token:.2f} s)", expanded=True).empty()
+        if function_call_names:
+            live_placeholder.info(f"🔧 Tool-Aufruf erkannt: {', '.join(f'`{name}`' for name in function_call_names)}")
         else:
-            return f"Berechnung von '{expression}' ergab unerwarteten Typ: {type(result).__name__}"
-    except Exception as e:
-        return f"Fehler bei der Berechnung von '{expression}': {e}"
-
-def fetch_url_content(url: str) -> str:
-    """
-    Holt bereinigten Textinhalt einer Webseite.
-    """
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'de-DE,de;q=0.9',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'DNT': '1'
-        }
-        response = requests.get(url, headers=headers, timeout=REQUESTS_TIMEOUT, allow_redirects=True)
-        response.raise_for_status()
-        content_type = response.headers.get('Content-Type', '').lower()
-        if 'text/html' not in content_type:
-            return f"ERROR_FETCHING_URL:{url}\n---\nInhaltstyp ist nicht HTML ({content_type}), Verarbeitung abgebrochen."
-        soup = BeautifulSoup(response.content, 'html.parser')
-        tags_to_remove = ['script', 'style', 'nav', 'header', 'footer', 'aside', 'form',
-                          'button', 'select', 'textarea', 'input', 'label',
-                          'img', 'svg', 'noscript', 'iframe', 'link', 'meta',
-                          'figure', 'figcaption']
-        for tag_name in tags_to_remove:
-            for tag in soup.find_all(tag_name):
-                tag.decompose()
-        main_content = soup.find('main')
-        if not main_content:
-            main_content = soup.find('article')
-        target_element = main_content if main_content else (soup.body if soup.body else soup)
-        text = target_element.get_text(separator='\n', strip=True) if target_element else ""
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        cleaned_text = '\n'.join(chunk for chunk in chunks if chunk)
-        if not cleaned_text:
-            return f"ERROR_FETCHING_URL:{url}\n---\nKein relevanter Textinhalt nach Bereinigung gefunden."
-        output_prefix = f"CONTENT_FROM_URL:{url}\n---\n"
-        if len(cleaned_text) > MAX_CONTENT_LENGTH:
-            return f"{output_prefix}(Gekürzt)\n{cleaned_text[:MAX_CONTENT_LENGTH]}..."
-        else:
-            return f"{output_prefix}{cleaned_text}"
-    except requests.exceptions.Timeout:
-        return f"ERROR_FETCHING_URL:{url}\n---\nTimeout beim Abrufen der URL nach {REQUESTS_TIMEOUT} Sekunden."
-    except requests.exceptions.RequestException as e:
-        status_code = e.response.status_code if e.response is not None else 'N/A'
-        return f"ERROR_FETCHING_URL:{url}\n---\nNetzwerk-/HTTP-Fehler (Status: {status_code}): {e}"
-    except Exception as e:
-        return f"ERROR_FETCHING_URL:{url}\n---\nUnerwarteter Fehler während der Verarbeitung: {e}"
-
-def wikipedia_lookup(term: str) -> str:
-    """
-    Sucht einen Begriff auf Wikipedia (Deutsch) und gibt die Zusammenfassung zurück.
-    """
-    try:
-        wikipedia.set_lang("de")
-        page = wikipedia.page(term, auto_suggest=True, redirect=True)
-        summary = page.summary
-        if len(summary) > MAX_CONTENT_LENGTH:
-            summary = summary[:MAX_CONTENT_LENGTH] + "..."
-        return f"Wikipedia Zusammenfassung für '{term}':\n{summary}\n(Quelle: {page.url})"
-    except wikipedia.exceptions.PageError:
-        return f"Fehler: Seite für '{term}' nicht auf Wikipedia gefunden."
-    except wikipedia.exceptions.DisambiguationError as e:
-        options = ", ".join(e.options[:5])
-        return f"Fehler: Begriff '{term}' ist mehrdeutig. Mögliche Optionen: {options}..."
-    except Exception as e:
-        return f"Fehler bei der Wikipedia-Suche nach '{term}': {e}"
-
-def list_uploaded_files() -> str:
-    """Gibt eine Liste der Namen der aktuell hochgeladenen Dateien zurück."""
-    if 'uploaded_files_data' in st.session_state and st.session_state.uploaded_files_data:
-        filenames = [f["name"] for f in st.session_state.uploaded_files_data]
-        return f"Verfügbare hochgeladene Dateien: {', '.join(filenames)}"
+            live_placeholder.markdown(streamed_text + " ▌")
+
+def _attach_script_run_ctx(ctx: Any) -> None:
+    """Hängt den Streamlit-Skriptkontext an einen Worker-Thread, damit Tools auf st.session_state zugreifen können."""
+    if ctx is not None:
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+def execute_workflow_plan(client: Any, model_id: str, workflow_plan: WorkflowPlan, question: str, results_placeholder: Any) -> bool:
+    """Führt einen Workflow-Plan mit Fortschrittsanzeige und optionaler Live-Ausgabe aus und liefert den Gesamterfolg."""
+    live_output_placeholder = st.empty()
+    live_area = live_output_placeholder.container() if st.session_state.get("stream_agent_output", True) else None
+    with st.spinner(f"Agenten arbeiten..."):
+        overall_success = True
+        try:
+            overall_success = run_workflow(
+                client,
+                model_id,
+                workflow_plan,
+                question,
+                st.session_state,
+                StreamlitCallbacks(results_placeholder, live_area),
+                max_parallel=st.session_state.get("max_parallel_agents", 4),
+                thread_initializer=functools.partial(_attach_script_run_ctx, get_script_run_ctx()),
+            )
+        except Exception as e:
+             st.error(f"❌ Unerwarteter Fehler im Hauptprozess: {e}")
+             st.error(traceback.format_exc())
+             overall_success = False
+    results_placeholder.empty()
+    live_output_placeholder.empty()
+    return overall_success
+
+def show_workflow_results(workflow_name: str, overall_success: bool) -> None:
+    """Zeigt Gesamtstatus, Token-Verbrauch, Agenten-Ergebnisse, Dateien, Zeitleiste und finales Ergebnis aus st.session_state an."""
+    st.markdown("---")
+    if not st.session_state.agent_results_display:
+        st.warning("Keine Agenten ausgeführt.")
+    elif overall_success:
+        st.success("✅ Workflow erfolgreich abgeschlossen.")
     else:
-        return "Keine Dateien wurden hochgeladen."
-
-def read_specific_file(filename: str) -> str:
-    """
-    Liest den Inhalt einer spezifischen, bereits hochgeladenen Datei.
-    """
-    if 'uploaded_files_data' not in st.session_state or not st.session_state.uploaded_files_data:
-        return f"Fehler: Keine Dateien vorhanden, kann '{filename}' nicht lesen."
-    for file_data in st.session_state.uploaded_files_data:
-        if file_data["name"] == filename:
-            file_type = file_data["type"]
-            file_bytes = file_data["bytes"]
-            if file_type.startswith("image/"):
-                return f"Datei '{filename}' ist ein Bild ({file_type}) und kann nicht als Text gelesen werden."
-            elif file_type.startswith("text/") or any(filename.endswith(ext) for ext in ['.txt', '.py', '.md', '.csv', '.json', '.html', '.css', '.js', '.yaml', '.sh', '.java', '.cpp', '.h', '.cs', '.go', '.rb', '.php']):
-                try:
-                    for encoding in ['utf-8', 'latin-1', 'windows-1252']:
-                        try:
-                            content = file_bytes.decode(encoding)
-                            if len(content) > MAX_CONTENT_LENGTH * 2:
-                                return f"Inhalt von '{filename}' (gekürzt, {encoding}):\n{content[:MAX_CONTENT_LENGTH * 2]}..."
-                            return f"Inhalt von '{filename}' ({encoding}):\n{content}"
-                        except UnicodeDecodeError:
-                            continue
-                    return f"Fehler: Konnte Datei '{filename}' mit gängigen Encodings nicht dekodieren."
-                except Exception as e:
-                    return f"Fehler beim Lesen der Textdatei '{filename}': {e}"
+        if any(r['status']=='Fehlgeschlagen' for r in st.session_state.agent_results_display):
+             st.error("❌ Workflow mit Fehlern abgeschlossen.")
+        else:
+             st.warning("⚠️ Workflow mit Überspringungen oder Warnungen abgeschlossen.")
+    token_rows = [{"Agent": result.get("agent"), "Modell": result.get("model"), "Eingabe-Tokens": result.get("input_tokens"), "Ausgabe-Tokens": result.get("output_tokens"),
+                   "Prompt (geschätzt)": (result.get("prompt_report") or {}).get("tokens_after"), "Budget": (result.get("prompt_report") or {}).get("budget"),
+                   "Wiederholungen": result.get("retries", 0), "Retry-Wartezeit (s)": round(result.get("retry_wait_s", 0.0), 1)}
+                  for result in st.session_state.agent_results_display if result.get("input_tokens") is not None]
+    if token_rows:
+        with st.expander(f"🔢 Token-Verbrauch pro Agent (gesamt {sum(row['Eingabe-Tokens'] + row['Ausgabe-Tokens'] for row in token_rows)} Tokens)"):
+            st.dataframe(sorted(token_rows, key=lambda row: row["Eingabe-Tokens"] + row["Ausgabe-Tokens"], reverse=True), hide_index=True, use_container_width=True)
+    model_rows = summarize_model_usage(st.session_state.agent_results_display)
+    if model_rows:
+        with st.expander(f"🧭 Modelle: Latenz & Verbrauch ({len(model_rows)} Modelle)"):
+            st.dataframe([{"Modell": row["model"], "Agenten": row["agents"], "Aufrufe": row["calls"], "Ø Latenz (s)": round(row["avg_latency_s"], 2),
+                           "Latenz gesamt (s)": round(row["latency_s"], 1), "Eingabe-Tokens": row["input_tokens"], "Ausgabe-Tokens": row["output_tokens"],
+                           "Kosten (USD, geschätzt)": None if row["cost_usd"] is None else round(row["cost_usd"], 4)} for row in model_rows], hide_index=True, use_container_width=True)
+    st.subheader("Ergebnisse der einzelnen Agenten:")
+    for result in st.session_state.agent_results_display:
+        agent_name = result.get('agent', 'Unbekannter Agent')
+        status = result.get('status', 'Unbekannt')
+        output = result.get('output', '[Kein Output]')
+        sources = result.get('sources')
+        details = result.get('details')
+        status_icon = '❓'
+        if status == 'Erfolgreich': status_icon = '✅'
+        elif status == 'Fehlgeschlagen': status_icon = '❌'
+        elif status in ['Warnung', 'Übersprungen', 'Unbekannt']: status_icon = '⚠️'
+        expander_title = f"{status_icon} Agent: **{agent_name}** ({status})"
+        expand_default = (status != 'Übersprungen')
+        with st.expander(expander_title, expanded=expand_default):
+            st.markdown("##### Output:")
+            is_likely_code_output = "```" in output or (status == 'Erfolgreich' and any(kw in agent_name.lower() for kw in ["coder", "architect", "refiner", "developer"]))
+            if agent_name == GENERATOR_WORKFLOW_NAME and status == 'Erfolgreich':
+                 try:
+                     st.code(json.dumps(json.loads(output), indent=2), language="json")
+                 except json.JSONDecodeError:
+                     st.code(output, language="json")
+            elif is_likely_code_output and status == 'Erfolgreich':
+                lang_match = re.search(r"```(\w+)", output)
+                lang_name = workflow_name.split()[0].lower().replace("plugin", "python")
+                lang_map = {"python":"python", "c++":"cpp", "java":"java", "javascript":"javascript"}
+                default_lang = lang_map.get(lang_name, "plaintext")
+                lang = lang_match.group(1) if lang_match else default_lang
+                code_content = re.sub(r"^\s*```[\w\+\#\-\.]*\n?", "", output, count=1)
+                code_content = re.sub(r"\n?```\s*$", "", code_content)
+                st.code(code_content.strip(), language=lang, line_numbers=True)
             else:
-                return f"Datei '{filename}' hat einen unbekannten/nicht-textuellen Typ ({file_type}). Inhalt kann nicht direkt angezeigt werden."
-    return f"Fehler: Datei '{filename}' wurde nicht unter den hochgeladenen Dateien gefunden."
-
-# --- ENDE NEUE TOOLS ---
-
-# --- Tool Registry (Verzeichnis der verfügbaren Tools) - AKTUALISIERT ---
-AVAILABLE_TOOLS: Dict[str, Callable] = {
-    "get_current_datetime": get_current_datetime,
-    "calculator": safe_calculator,
-    "fetch_url_content": fetch_url_content,
-    "wikipedia_lookup": wikipedia_lookup,
-    "list_uploaded_files": list_uploaded_files,
-    "read_specific_file": read_specific_file,
-    "custom_google_search": custom_google_search
-}
-
-# --- Konfigurations- und Hilfsfunktionen ---
-def load_agent_config(file_path: str, is_generator_config: bool = False) -> Union[List[Dict[str, Any]], None]:
-    """
-    Lädt eine Agentenkonfiguration aus einer JSON-Datei und sortiert diese nach 'round'.
-    """
-    if not file_path or not os.path.exists(file_path):
-        error_key = f"error_config_not_found_{file_path}"
-        if error_key not in st.session_state:
-            st.error(f"❌ Konfigurationsdatei '{file_path or 'Kein Pfad angegeben'}' nicht gefunden.")
-            st.session_state[error_key] = True
-        return None
-    error_key = f"error_config_not_found_{file_path}"
-    if error_key in st.session_state:
-        del st.session_state[error_key]
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            config_data = json.load(f)
-        if not isinstance(config_data, list):
-            st.error(f"❌ Fehler: Konfigurationsdatei '{file_path}' enthält keine Liste von Agenten.")
-            return None
-        if not is_generator_config:
-            try:
-                config_data.sort(key=lambda x: x.get('round', float('inf')))
-            except TypeError:
-                st.error(f"❌ Fehler beim Sortieren der Agenten in '{file_path}'. Stellen Sie sicher, dass 'round' eine Zahl ist.")
-                return None
-        return config_data
-    except json.JSONDecodeError as e:
-        st.error(f"❌ Fehler beim Parsen der JSON-Datei '{file_path}': {e}")
-        return None
-    except Exception as e:
-        st.error(f"❌ Unbekannter Fehler beim Laden der Konfiguration '{file_path}': {e}")
-        st.error(traceback.format_exc())
-        return None
-
-def validate_config_list(config_list: List[Dict[str, Any]], source_description: str = "Konfiguration") -> Union[List[Dict[str, Any]], None]:
-    """
-    Validiert eine Liste von Agenten-Dictionaries mittels Pattern Matching.
-    """
-    if not config_list:
-        st.error(f"❌ Fehler: Die übergebene {source_description} ist leer.")
-        return None
-    valid_config_found = False
-    validated_agents: List[Dict[str, Any]] = []
-    any_invalid = False
-    for agent_dict in config_list:
-        if not isinstance(agent_dict, dict):
-            st.warning(f"Überspringe Eintrag in '{source_description}', da es kein Dictionary ist: {agent_dict}")
-            any_invalid = True
-            continue
-        match agent_dict:
-            case { "name": str(), "round": int(), "system_instruction": str(), **other_keys }:
-                validated_agents.append(agent_dict)
-                valid_config_found = True
-            case _:
-                st.warning(f"Agent '{agent_dict.get('name', 'Unbekannt')}' in '{source_description}' hat eine ungültige Struktur. Agent wird ignoriert.")
-                any_invalid = True
-    if any_invalid:
-         st.warning(f"⚠️ Mindestens ein Agent in '{source_description}' war ungültig und wurde ignoriert.")
-    if not valid_config_found:
-         st.error(f"❌ Keine validen Agenten in '{source_description}' gefunden.")
-         return None
-    try:
-        validated_agents.sort(key=lambda x: x.get('round', float('inf')))
-    except TypeError:
-       st.error(f"❌ Fehler beim Sortieren der validierten Agenten aus '{source_description}'.")
-       return None
-    return validated_agents
-
-def get_grounding_info(candidate: Any) -> Union[str, None]:
-    """
-    Extrahiert Grounding-Informationen (Websuche) aus einem API-Antwort-Kandidaten.
-    """
-    try:
-        grounding = getattr(candidate, "grounding_metadata", None)
-        if grounding:
-            search_entry_point = getattr(grounding, "search_entry_point", None)
-            if search_entry_point:
-                 uri = getattr(search_entry_point, "uri", None) or getattr(search_entry_point, "rendered_content", None)
-                 if uri: 
-                     return f"Quelle (URI): {uri}"
-            web_search_queries = getattr(grounding, "web_search_queries", None)
-            if web_search_queries:
-                 titles = [q.display_title for q in web_search_queries if hasattr(q, 'display_title') and q.display_title]
-                 if titles: 
-                     return f"Suchanfragen verwendet: {', '.join(titles)}"
-                 else: 
-                     return "Websuche wurde verwendet (keine spezifischen Titel)."
-    except AttributeError:
-        pass
-    except Exception as e:
-        st.warning(f"⚠️ Fehler beim Extrahieren der Grounding-Infos: {e}")
-    return None
-
-def parse_generator_output(response_text: str) -> tuple[Union[List[Dict[str, Any]], None], Union[str, None]]:
-    """
-    Extrahiert eine JSON-Liste für Agentenkonfigurationen aus dem Antworttext des Generators.
-    """
-    try:
-        cleaned_text = response_text.strip()
-        if cleaned_text.startswith("```json"):
-            cleaned_text = cleaned_text[7:].strip()
-        elif cleaned_text.startswith("```"):
-             cleaned_text = cleaned_text[3:].strip()
-        if cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[:-3].strip()
-        config_list = json.loads(cleaned_text)
-        if not isinstance(config_list, list):
-            return None, "Generator-Antwort ist keine JSON-Liste."
-        if not all(isinstance(item, dict) for item in config_list):
-             first_bad_item = next((item for item in config_list if not isinstance(item, dict)), None)
-             return None, f"Generator-Liste enthält Elemente, die keine Dictionaries sind (z.B.: {str(first_bad_item)[:100]}...).'"
-        return config_list, None
-    except json.JSONDecodeError as e:
-        error_msg = f"Generator-Antwort ist kein valides JSON: {e}\n\nEmpfangener Text (Anfang):\n```\n{response_text[:500]}...\n```"
-        return None, error_msg
-    except Exception as e:
-         return None, f"Unerwarteter Fehler beim Parsen der Generator-Antwort: {e}"
-
-# --- Neue Funktion: Auto-Save der generierten Agenten-JSON ---
-def save_generated_config(config: List[dict], base_name: str = "generated_workflow") -> str:
-    """
-    Speichert die durch den Generator erstellte JSON-Konfiguration automatisch im Verzeichnis 'generated_configs'.
-    """
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M")
-    directory = "generated_configs"
-    os.makedirs(directory, exist_ok=True)  # Erstelle das Verzeichnis, falls es nicht existiert
-    filename = f"{base_name}_{timestamp}.json"
-    full_path = os.path.join(directory, filename)
-    try:
-        with open(full_path, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
-        return f"✅ Workflow gespeichert unter: `{full_path}`"
-    except Exception as e:
-        return f"❌ Fehler beim Speichern: {e}"
+                st.markdown(output)
+            if sources:
+                st.markdown("##### Quellen/Infos:")
+                st.caption(f"{sources}")
+            if details:
+                st.info(f"Details: {details}")
+            if result.get("ttft") is not None:
+                st.caption(f"⏱️ Time-to-first-Token: {result['ttft']:.2f} s")
+            if result.get("input_tokens") is not None:
+                prompt_report = result.get("prompt_report") or {}
+                trimmed_segments = [segment["label"] for segment in prompt_report.get("segments", []) if segment["trimmed"]]
+                budget_info = f" | Budget {prompt_report['budget']}" if prompt_report.get("budget") else ""
+                trim_info = f" | gekürzt: {', '.join(trimmed_segments)}" if trimmed_segments else ""
+                st.caption(f"🔢 Tokens: Eingabe {result['input_tokens']}, Ausgabe {result['output_tokens']}{budget_info}{trim_info}")
+            if len(result.get("turn_prompt_tokens") or []) > 1:
+                reuse_info = f", {result['reused_tool_calls']} wiederholte Aufrufe übernommen" if result.get("reused_tool_calls") else ""
+                budget_info = " | Budget erreicht, letzte Antwort ohne Tools" if result.get("tool_budget_reached") else ""
+                st.caption(f"🔧 Tool-Loop: {len(result['turn_prompt_tokens'])} Turns, Prompt je Turn {' → '.join(str(tokens) for tokens in result['turn_prompt_tokens'])} Tokens; "
+                           f"{result.get('compacted_tokens', 0)} Tokens durch Kompaktierung gespart{reuse_info}{budget_info}")
+            if result.get("model"):
+                policy_info = f" (Policy `{result['model_policy']}`: {result.get('model_reason')})" if result.get("model_policy") else ""
+                st.caption(f"🧭 Modell: `{result['model']}`{policy_info}")
+            if result.get("retries") or result.get("fallback_calls"):
+                fallback_info = f", {result['fallback_calls']} Aufrufe über Ausweichmodell `{result['fallback_model']}`" if result.get("fallback_calls") else ""
+                st.caption(f"🔁 {result.get('retries', 0)} Wiederholungen ({result.get('retry_wait_s', 0.0):.1f} s Wartezeit){fallback_info}")
+    st.markdown("---")
+    st.subheader("📦 Download generierter Dateien")
+    artifacts = st.session_state.get("artifacts")
+    if artifacts is None:
+        artifacts = st.session_state.artifacts = ArtifactStore.from_results(st.session_state.agent_results_display)
+    if len(artifacts):
+        st.write(f"Generierte Dateien ({len(artifacts)}) für **'{workflow_name}'**:")
+        st.markdown("\n".join([f"- `{path}` (aus Agent '{source_agent}')" for path, source_agent, _ in artifacts.items()]))
+        for path, overridden_agent, winning_agent in artifacts.overridden:
+            st.caption(f"↪️ `{path}` von Agent '{overridden_agent}' wurde durch die Version von '{winning_agent}' ersetzt (späterer Agent im Workflow gewinnt).")
+        # Das ZIP wird erst beim Klick gebaut (Callable als data) und löst keinen Rerun aus; Streamlit hält es dann als Bytes.
+        download_filename = f"{workflow_name.lower().replace(' ','_')}_output_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}.zip"
+        st.download_button(label=f"⬇️ '{workflow_name}' Ergebnisse als ZIP", data=artifacts.zip_bytes, file_name=download_filename, mime="application/zip", key="download_zip_button", on_click="ignore")
+    else:
+        st.info("Keine Dateien (`## FILE: ...`) zum Zippen im Output gefunden.")
+    trace = st.session_state.get("trace")
+    if trace is not None and trace.spans:
+        with st.expander("⏱️ Zeitleiste (Agenten, Modell, Tools, Rate-Limiter)"):
+            st.vega_lite_chart(trace.timeline(), {
+                "mark": {"type": "bar", "tooltip": True},
+                "encoding": {
+                    "y": {"field": "lane", "type": "nominal", "title": None, "sort": None},
+                    "yOffset": {"field": "category", "type": "nominal"},
+                    "x": {"field": "start_ms", "type": "quantitative", "title": "ms seit Start"},
+                    "x2": {"field": "end_ms"},
+                    "color": {"field": "category", "type": "nominal", "title": "Kategorie"},
+                },
+            }, use_container_width=True)
+            st.dataframe([{"Kategorie": category, "Anzahl": entry["count"], "Dauer (s)": round(entry["total_s"], 2)} for category, entry in trace.summary().items()], hide_index=True)
+            st.caption("Modellaufrufe enthalten Cache-Zugriff und Wartezeit im Rate-Limiter.")
+            col_chrome, col_otel = st.columns(2)
+            trace_file_prefix = f"trace_{workflow_name.lower().replace(' ','_')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}"
+            col_chrome.download_button("⬇️ Chrome-Trace (JSON)", data=json.dumps(trace.to_chrome_trace()), file_name=f"{trace_file_prefix}.chrome.json", mime="application/json", key="download_chrome_trace")
+            col_otel.download_button("⬇️ OpenTelemetry (JSON)", data=json.dumps(trace.to_otel_json()), file_name=f"{trace_file_prefix}.otel.json", mime="application/json", key="download_otel_trace")
+    st.markdown("---")
+    st.subheader("🏁 Finales Text-Ergebnis")
+    final_successful_output = "[Kein spezifisches textuelles Endergebnis gefunden]"
+    final_agent_name = None
+    for res in reversed(st.session_state.agent_results_display):
+        output = res.get("output", "")
+        status = res.get("status")
+        agent = res.get("agent")
+        if agent != GENERATOR_WORKFLOW_NAME and status == "Erfolgreich" and output and "[Kein Output]" not in output and "[Keine Frage/Dateien]" not in output and "[Input fehlt]" not in output:
+             is_likely_just_files = output.strip().startswith("## FILE:")
+             is_meta_agent = any(kw in agent.lower() for kw in ["planner", "reviewer", "packager", "summary", "orchestrator"])
+             if (not is_likely_just_files or is_meta_agent):
+                 final_successful_output = output
+                 final_agent_name = agent
+                 break
+             elif final_agent_name is None:
+                 final_successful_output = f"[Letzter Output war Code/Datei von Agent '{agent}']"
+                 final_agent_name = agent
+    final_title_suffix = f"(von Agent: **{final_agent_name}**)" if final_agent_name else ""
+    st.markdown(f"**{final_title_suffix}**")
+    if "[Letzter Output war Code/Datei von Agent" in final_successful_output or "[Kein spezifisches textuelles Endergebnis gefunden" in final_successful_output:
+        st.info(final_successful_output)
+    else:
+        is_likely_code_final = "```" in final_successful_output or (final_agent_name and any(kw in final_agent_name.lower() for kw in ["coder", "developer", "refiner"]))
+        if is_likely_code_final:
+            lang_match = re.search(r"```(\w+)", final_successful_output)
+            lang_name = workflow_name.split()[0].lower().replace("plugin", "python")
+            lang_map = {"python":"python", "c++":"cpp", "java":"java", "javascript":"javascript"}
+            default_lang = lang_map.get(lang_name, "plaintext")
+            lang = lang_match.group(1) if lang_match else default_lang
+            code_content = re.sub(r"^\s*```[\w\+\#\-\.]*\n?", "", final_successful_output, count=1)
+            code_content = re.sub(r"\n?```\s*$", "", code_content)
+            st.code(code_content.strip(), language=lang, line_numbers=True)
+        else:
+            st.markdown(final_successful_output)
 
 # --- Hauptfunktion für den Streamlit-Tab ---
 def build_tab(api_key: str | None = None):
@@ -404,6 +246,7 @@ def build_tab(api_key: str | None = None):
     Baut die Streamlit-Weboberfläche für den KI Workflow Generator & Runner auf.
     """
     st.set_page_config(page_title="KI Workflow Generator & Runner", layout="wide")
+    set_run_context(st.session_state, StreamlitCallbacks())
     api_key = api_key or API_KEY
     if not api_key:
         st.error("❌ Kein API-Key gefunden.")
@@ -427,27 +270,26 @@ def build_tab(api_key: str | None = None):
     agent_config_file_path = supported_workflows.get(selected_workflow_name)
     is_generator_mode = (selected_workflow_name == GENERATOR_WORKFLOW_NAME)
 
-    config_for_sidebar = None
-    if agent_config_file_path:
-        config_for_sidebar = load_agent_config(agent_config_file_path)
+    workflow_plan = get_workflow_plan(agent_config_file_path, selected_workflow_name) if agent_config_file_path else None
 
     with st.sidebar:
         st.header("Einstellungen & Infos")
         st.info(f"Modus: **{selected_workflow_name}**")
         if agent_config_file_path:
             st.markdown(f"Konfig: `{agent_config_file_path}`")
-            if config_for_sidebar is not None:
-                validated_sidebar_config = validate_config_list(config_for_sidebar, f"'{agent_config_file_path}' (für Sidebar)")
-                if validated_sidebar_config:
-                    st.success(f"✅ Geladen ({len(validated_sidebar_config)} Agenten).")
-                    if not is_generator_mode:
-                        st.subheader("Agentenübersicht:")
-                        agent_summary = [{"R": a.get("round"), "Name": a.get("name"), "Desc": a.get("description", "-")} for a in validated_sidebar_config]
-                        st.dataframe(agent_summary, use_container_width=True, hide_index=True, column_config={"R": st.column_config.NumberColumn(width="small"), "Name": st.column_config.TextColumn(width="medium"), "Desc": st.column_config.TextColumn(width="large")})
-                        with st.expander("Vollständige JSON"):
-                            st.json(validated_sidebar_config)
-                else:
-                    st.warning("Fehlerhafte Sidebar-Konfiguration.")
+            if workflow_plan is not None:
+                validated_sidebar_config = workflow_plan.agents
+                st.success(f"✅ Geladen ({len(validated_sidebar_config)} Agenten).")
+                if workflow_plan.graph_error and not is_generator_mode:
+                    st.warning(f"Abhängigkeitsgraph ungültig: {workflow_plan.graph_error}")
+                if not is_generator_mode:
+                    st.subheader("Agentenübersicht:")
+                    agent_summary = [{"R": a.get("round"), "Name": a.get("name"), "Desc": a.get("description", "-")} for a in validated_sidebar_config]
+                    st.dataframe(agent_summary, use_container_width=True, hide_index=True, column_config={"R": st.column_config.NumberColumn(width="small"), "Name": st.column_config.TextColumn(width="medium"), "Desc": st.column_config.TextColumn(width="large")})
+                    with st.expander("Vollständige JSON"):
+                        st.json(validated_sidebar_config)
+            else:
+                st.warning("Fehlerhafte Sidebar-Konfiguration.")
         else:
             st.warning("Kein Konfigurationspfad definiert.")
         st.divider()
@@ -455,27 +297,123 @@ def build_tab(api_key: str | None = None):
         st.json(list(AVAILABLE_TOOLS.keys()))
         model_id = DEFAULT_MODEL_ID
         st.caption(f"Modell: `{model_id}`")
+        st.selectbox(
+            "Modell-Routing (Standard-Policy):",
+            options=[None, *MODEL_POLICIES],
+            format_func=lambda policy: "aus – Modell des Laufs" if policy is None else policy,
+            key="default_model_policy",
+            help="Gilt für Agenten ohne eigenes \"model\" bzw. \"model_policy\" in der Konfiguration. fast = schnellstes, balanced = günstigstes ab Flash-Klasse, quality = stärkstes Modell; gewählt anhand der beobachteten Latenz und Token-Zahlen."
+        )
+        observed_models = get_model_stats().snapshot()
+        if observed_models:
+            st.caption(" · ".join(f"`{model}`: Ø {entry['latency_s']:.1f} s ({entry['calls']} Aufrufe)" for model, entry in observed_models.items()))
         st.divider()
         st.subheader("RPM Einstellungen")
-        if 'rpm_limit' not in st.session_state:
-            st.session_state.rpm_limit = 30
-        rpm_limit_input = st.number_input(
+        rate_limiter = get_rate_limiter()
+        st.number_input(
             "Maximale Anfragen pro Minute (RPM):",
             min_value=1, max_value=120,
-            value=st.session_state.get("rpm_limit", 30),
+            value=rate_limiter.rpm,
+            step=1,
+            key="rpm_limit_input",
+            on_change=lambda: rate_limiter.configure(st.session_state.rpm_limit_input, rate_limiter.tpm),
+            help="Gilt für alle Sessions dieses Servers gemeinsam."
+        )
+        st.number_input(
+            "Maximale Tokens pro Minute (TPM, 0 = unbegrenzt):",
+            min_value=0, max_value=10_000_000,
+            value=rate_limiter.tpm,
+            step=10_000,
+            key="tpm_limit_input",
+            on_change=lambda: rate_limiter.configure(rate_limiter.rpm, st.session_state.tpm_limit_input),
+            help="Token-Budget pro Minute; der Verbrauch wird vor dem Aufruf geschätzt und danach anhand der Usage-Metadaten korrigiert."
+        )
+        limiter_metrics = rate_limiter.metrics()
+        col_queue, col_avg, col_p95 = st.columns(3)
+        col_queue.metric("Wartend", limiter_metrics["waiting"], help=f"Maximal gleichzeitig wartend: {limiter_metrics['max_waiting']}")
+        col_avg.metric("Ø Wartezeit", f"{limiter_metrics['avg_wait_s']:.1f} s")
+        col_p95.metric("p95 Wartezeit", f"{limiter_metrics['p95_wait_s']:.1f} s")
+        st.caption(f"{limiter_metrics['calls']} Aufrufe, {limiter_metrics['waited_calls']} davon mit Wartezeit (gesamt {limiter_metrics['total_wait_s']:.0f} s). Reservierter Rückstau: {limiter_metrics['backlog_s']:.1f} s. Backend: `{limiter_metrics['backend']}`")
+        st.subheader("Antwort-Cache")
+        st.toggle("Modellantworten cachen", value=True, key="use_response_cache", help="Identische Anfragen (Modell, Inhalte, Konfiguration) werden aus dem Cache beantwortet. Agenten mit \"temperature\" > 0 werden nur mit \"cache_responses\": true gecacht, andere lassen sich per \"cache_responses\": false ausnehmen.")
+        response_cache_stats = get_response_cache().stats()
+        col_hits, col_misses = st.columns(2)
+        col_hits.metric("Treffer", response_cache_stats["hits"])
+        col_misses.metric("Fehlschläge", response_cache_stats["misses"])
+        st.caption(f"{response_cache_stats['entries']} Einträge, {response_cache_stats['size_bytes'] / 1024 / 1024:.1f} MB in `{RESPONSE_CACHE_DB}`")
+        if st.button("🗑️ Cache leeren", key="clear_response_cache"):
+            get_response_cache().clear()
+            st.rerun()
+        st.subheader("Tool-Cache")
+        tool_cache_stats = get_tool_cache().stats()
+        col_memory, col_disk, col_tool_misses = st.columns(3)
+        col_memory.metric("RAM-Treffer", tool_cache_stats["memory_hits"])
+        col_disk.metric("Disk-Treffer", tool_cache_stats["disk_hits"])
+        col_tool_misses.metric("Fehlschläge", tool_cache_stats["misses"])
+        st.caption(", ".join(f"`{tool}`: {count}" for tool, count in tool_cache_stats["entries_per_tool"].items()) or "Noch keine gecachten Tool-Ergebnisse.")
+        if st.button("🗑️ Tool-Cache leeren", key="clear_tool_cache"):
+            get_tool_cache().clear()
+            st.rerun()
+        st.subheader("Inkrementelle Ausführung")
+        st.toggle("Nur geänderte Agenten neu ausführen", value=True, key="incremental_execution", help="Agenten, deren Konfiguration, Anfrage, Dateien und Vorgänger unverändert sind, übernehmen ihr Ergebnis aus dem vorherigen Lauf.")
+        st.subheader("Streaming")
+        st.toggle("Agenten-Antworten live streamen", value=True, key="stream_agent_output", help="Zeigt Tokens während der Generierung an und misst die Time-to-first-Token pro Agent.")
+        st.subheader("Token-Budget")
+        st.toggle("Tokens exakt über die API zählen", value=False, key="exact_token_count", help="Nahe am Token-Budget eines Agenten (\"token_budget\") wird der Prompt vor dem Kürzen über count_tokens gezählt statt nur lokal geschätzt. Kostet einen zusätzlichen API-Aufruf.")
+        st.subheader("Parallelität")
+        st.number_input(
+            "Maximal parallel laufende Agenten:",
+            min_value=1, max_value=16,
+            value=st.session_state.get("max_parallel_agents", 4),
             step=1,
-            key="rpm_limit_input"
+            key="max_parallel_agents",
+            help="Agenten ohne gegenseitige Abhängigkeit ('receives_messages_from') laufen gleichzeitig."
         )
-        st.session_state.rpm_limit = rpm_limit_input
+        if is_generator_mode:
+            st.number_input(
+                "Generator-Kandidaten:",
+                min_value=1, max_value=5,
+                value=st.session_state.get("generator_candidates", GENERATOR_CANDIDATES),
+                step=1,
+                key="generator_candidates",
+                help="So viele Konfigurationen werden gleichzeitig angefragt; die erste gültige (Schema, Validierung, azyklischer Graph) wird ausgeführt."
+            )
+        st.subheader("Ausfallsicherheit")
+        st.text_input(
+            "Ausweichmodell:",
+            value=st.session_state.get("fallback_model_id", FALLBACK_MODEL_ID or ""),
+            key="fallback_model_id",
+            help=f"Wird verwendet, solange der Circuit Breaker des gewählten Modells offen ist (leer = kein Fallback). Vorübergehende Fehler (429, 5xx, Timeout) werden bis zu {MODEL_MAX_RETRIES}-mal mit Backoff wiederholt."
+        )
+        breaker_status = get_circuit_breaker().status()
+        if breaker_status:
+            state_icons = {"geschlossen": "🟢", "halb offen": "🟡", "offen": "🔴"}
+            st.caption(" · ".join(f"{state_icons.get(entry['state'], '❓')} `{model}`: {entry['state']} ({entry['opened_count']}× geöffnet)" for model, entry in breaker_status.items()))
+        st.subheader("Laufhistorie")
+        st.toggle("Läufe speichern (Checkpoint pro Agent)", value=True, key="record_run", help="Jedes Agenten-Ergebnis wird sofort gespeichert. Abgebrochene Läufe können nach einem Neustart ab dem letzten abgeschlossenen Agenten fortgesetzt werden.")
+        run_store = get_run_store()
+        stored_runs = run_store.list_runs(limit=30)
+        resume_run_id = None
+        if stored_runs:
+            run_labels = {run["run_id"]: f"{datetime.datetime.fromtimestamp(run['created']).strftime('%d.%m. %H:%M')} · {run['workflow_name']} · {run['status']} ({run['agents_done']}/{run['agents_total']})" for run in stored_runs}
+            selected_run_id = st.selectbox("Gespeicherte Läufe:", options=list(run_labels), format_func=run_labels.get, key="selected_run_id")
+            selected_run = next(run for run in stored_runs if run["run_id"] == selected_run_id)
+            st.caption(f"`{selected_run_id}`: {selected_run['question'][:200] or '[Keine Aufgabe]'}")
+            col_load, col_resume = st.columns(2)
+            if col_load.button("📂 Laden", key="load_run_button", help="Ergebnisse anzeigen, ohne das Modell erneut aufzurufen."):
+                st.session_state.history_view = ("load", selected_run_id)
+            if col_resume.button("▶️ Fortsetzen", key="resume_run_button", disabled=selected_run["status"] == "Erfolgreich", help="Nur Agenten ohne erfolgreichen Checkpoint werden neu ausgeführt."):
+                resume_run_id = selected_run_id
+            compare_run_id = st.selectbox("Vergleichen mit:", options=[run_id for run_id in run_labels if run_id != selected_run_id], format_func=run_labels.get, index=None, key="compare_run_id")
+            if compare_run_id and st.button("🔀 Unterschiede anzeigen", key="diff_runs_button"):
+                st.session_state.history_view = ("diff", compare_run_id, selected_run_id)
+        else:
+            st.caption("Noch keine gespeicherten Läufe.")
+        st.caption(f"Gespeichert in `{RUN_STORE_DB}`")
 
-    if 'message_store' not in st.session_state:
-        st.session_state.message_store = {}
-    if 'agent_results_display' not in st.session_state:
-        st.session_state.agent_results_display = []
+    ensure_run_state(st.session_state)
     if 'last_question_processed' not in st.session_state:
         st.session_state.last_question_processed = ""
-    if 'uploaded_files_data' not in st.session_state:
-        st.session_state.uploaded_files_data = []
     if 'last_workflow_processed' not in st.session_state:
         st.session_state.last_workflow_processed = ""
 
@@ -485,21 +423,21 @@ def build_tab(api_key: str | None = None):
     question = st.text_area(question_label, key="task_description")
     uploaded_files = st.file_uploader("📎 Dateien hochladen (Kontext):", type=["png", "jpg", "jpeg", "webp", "txt", "py", "md", "csv", "json", "html", "css", "js", "yaml", "sh", "java", "cpp", "h", "cs", "go", "rb", "php"], accept_multiple_files=True, key="file_uploader")
 
-    current_uploaded_files_data = []
     if uploaded_files:
         st.write("Neu hochgeladene Dateien:")
-        for uploaded_file in uploaded_files:
-            try:
-                file_bytes = uploaded_file.getvalue()
-                file_data = {"name": uploaded_file.name, "type": uploaded_file.type, "size": uploaded_file.size, "bytes": file_bytes}
-                current_uploaded_files_data.append(file_data)
-                if uploaded_file.type.startswith("image/"):
-                    st.image(file_bytes, caption=f"{uploaded_file.name}", width=100)
-                else:
-                    file_size_kb = file_data.get('size', 0) / 1024
-                    st.caption(f"- `{uploaded_file.name}` ({uploaded_file.type}, {file_size_kb:.1f} KB)")
-            except Exception as file_e:
-                st.error(f"Fehler beim Verarbeiten der Datei '{uploaded_file.name}': {file_e}")
+        try:
+            current_uploaded_files_data = sync_upload_store(uploaded_files)
+        except Exception as file_e:
+            st.error(f"Fehler beim Verarbeiten der hochgeladenen Dateien: {file_e}")
+            current_uploaded_files_data = []
+        for file_data in current_uploaded_files_data:
+            if file_data["is_image"]:
+                st.image(file_data["bytes"] if file_data["bytes"] is not None else file_data["path"], caption=f"{file_data['name']}", width=100)
+            else:
+                file_size_kb = file_data.get('size', 0) / 1024
+                encoding_info = f", {file_data['encoding']}" if file_data.get("encoding") else ""
+                spill_info = ", ausgelagert" if file_data.get("path") else ""
+                st.caption(f"- `{file_data['name']}` ({file_data['type']}, {file_size_kb:.1f} KB{encoding_info}{spill_info})")
         st.session_state.uploaded_files_data = current_uploaded_files_data
         st.success(f"{len(current_uploaded_files_data)} Datei(en) bereit.")
     elif st.session_state.uploaded_files_data:
@@ -513,7 +451,7 @@ def build_tab(api_key: str | None = None):
                     file_size_kb = file_data.get('size', 0) / 1024
                     display_caption = f"`{file_data['name']}` ({file_data['type']}, {file_size_kb:.1f} KB)"
                     if file_data["type"].startswith("image/"):
-                        st.image(file_data["bytes"], caption=display_caption, width=100)
+                        st.image(file_data["bytes"] if file_data["bytes"] is not None else file_data["path"], caption=display_caption, width=100)
                     else:
                         st.caption(display_caption)
                  with col2:
@@ -522,7 +460,7 @@ def build_tab(api_key: str | None = None):
              if indices_to_remove:
                  indices_to_remove.sort(reverse=True)
                  for index in indices_to_remove:
-                     st.session_state.uploaded_files_data.pop(index)
+                     release_upload_entry(st.session_state.uploaded_files_data.pop(index))
                  st.success(f"{len(indices_to_remove)} Datei(en) entfernt.")
                  st.rerun()
              if not st.session_state.uploaded_files_data:
@@ -535,15 +473,20 @@ def build_tab(api_key: str | None = None):
         if not question and not st.session_state.uploaded_files_data:
             st.warning("Bitte Aufgabe beschreiben oder Dateien hochladen.")
             st.stop()
+        st.session_state.agent_fingerprints = {}
         st.session_state.message_store = {}
         st.session_state.agent_results_display = []
+        st.session_state.artifacts = ArtifactStore()
+        st.session_state.trace = RunTrace(selected_workflow_name)
+        st.session_state.run_id = None
+        st.session_state.config_path = None if is_generator_mode else agent_config_file_path
+        st.session_state.history_view = None
         st.session_state.last_question_processed = question
         st.session_state.last_workflow_processed = selected_workflow_name
         if '_displayed_errors' in st.session_state:
              st.session_state['_displayed_errors'] = set()
         results_placeholder = st.empty()
         final_agents_config = None
-        prompt_for_execution = question
         try:
             client = genai.Client(api_key=api_key)
         except Exception as e:
@@ -551,8 +494,8 @@ def build_tab(api_key: str | None = None):
              st.stop()
         if is_generator_mode:
             with st.spinner("🧠 Workflow-Generator arbeitet..."):
-                generator_config_list = load_agent_config(GENERATOR_CONFIG_FILE, is_generator_config=True)
-                generator_config = validate_config_list(generator_config_list, f"'{GENERATOR_CONFIG_FILE}'") if generator_config_list else None
+                generator_plan = get_workflow_plan(GENERATOR_CONFIG_FILE, GENERATOR_WORKFLOW_NAME, is_generator_config=True, show_messages=False)
+                generator_config = generator_plan.agents if generator_plan else None
                 if generator_config is None or not generator_config:
                     st.error("Generator-Konfig ungültig oder nicht geladen.")
                     st.stop()
@@ -566,85 +509,58 @@ def build_tab(api_key: str | None = None):
                 if st.session_state.uploaded_files_data:
                     generator_input_parts.append(Part(text="\n\n--- START KONTEXT DATEIEN ---"))
                     for file_data in st.session_state.uploaded_files_data:
-                        file_name, file_type, file_bytes = file_data["name"], file_data["type"], file_data["bytes"]
+                        file_name, file_type = file_data["name"], file_data["type"]
                         if file_type.startswith("image/"):
                              try:
-                                 image_part = Part.from_data(mime_type=file_type, data=file_bytes)
+                                 image_part = Part.from_data(mime_type=file_type, data=get_file_bytes(file_data))
                                  generator_input_parts.append(Part(text=f"\nBild: `{file_name}`"))
                                  generator_input_parts.append(image_part)
                              except Exception as img_e:
                                  st.warning(f"Konnte Bild '{file_name}' nicht für Generator hinzufügen: {img_e}")
                         else:
                             try:
-                                file_content = "[Dekodierungsfehler]"
-                                for encoding in ['utf-8', 'latin-1', 'windows-1252']:
-                                    try:
-                                        file_content = file_bytes.decode(encoding)
-                                        break
-                                    except UnicodeDecodeError:
-                                        continue
-                                if len(file_content) > MAX_CONTENT_LENGTH:
-                                    file_content = file_content[:MAX_CONTENT_LENGTH] + "\n... [Datei gekürzt]"
+                                file_content, truncated = get_file_text_view(file_data, MAX_CONTENT_LENGTH)
+                                if truncated:
+                                    file_content += "\n... [Datei gekürzt]"
                                 file_text_part = Part(text=(f"\n--- START DATEI: `{file_name}` ---\n{file_content}\n--- ENDE DATEI: `{file_name}` ---"))
                                 generator_input_parts.append(file_text_part)
                             except Exception as decode_e:
                                 st.warning(f"Datei '{file_name}' ({file_type}) ignoriert für Generator.")
                     generator_input_parts.append(Part(text="\n--- ENDE KONTEXT DATEIEN ---"))
-                generator_output = "[Generator nicht geantwortet]"
-                generator_success = False
+                candidate_count = st.session_state.get("generator_candidates", GENERATOR_CANDIDATES)
                 try:
-                    response = limited_generate_content(
-                        client=client,
-                        model=f"models/{model_id}",
-                        contents=generator_input_parts,
-                        config=GenerateContentConfig(temperature=float(generator_agent_conf.get("temperature", 0.5)))
-                    )
-                    if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-                        generator_output = "".join(part.text for part in response.candidates[0].content.parts if hasattr(part, 'text')).strip()
-                        if generator_output:
-                            generator_success = True
-                        else:
-                            generator_output = "[Generator gab leere Antwort]"
-                    else:
-                        feedback = getattr(response, 'prompt_feedback', None)
-                        block_reason = getattr(feedback, 'block_reason', "Unbekannt") if feedback else "Unbekannt"
-                        block_msg = getattr(feedback, 'block_reason_message', "Keine Details") if feedback else "Keine Details"
-                        generator_output = f"[Fehler: Generator-Antwort ungültig. Grund: {block_reason}. Nachricht: {block_msg}]"
-                        st.error(f"Generator-Fehler: {generator_output}")
+                    generation = generate_workflow_config(client, model_id, generator_agent_conf, generator_input_parts, candidate_count, use_cache=st.session_state.get("use_response_cache", True))
                 except Exception as gen_e:
                     st.error(f"❌ Kritischer Generator-Fehler: {gen_e}")
                     st.error(traceback.format_exc())
                     st.stop()
+                generator_output = generation["output"] or "[Generator gab leere Antwort]"
+                generator_success = generation["config"] is not None
+                candidate_info = f"Kandidat {generation['candidate']} von {candidate_count}" if generator_success else f"{candidate_count} Kandidaten verworfen"
                 st.session_state.agent_results_display.append({
                     "agent": generator_name,
                     "status": "Erfolgreich" if generator_success else "Fehlgeschlagen",
                     "output": generator_output,
                     "sources": None,
-                    "details": "Output des Workflow Generators"
+                    "details": f"Output des Workflow Generators ({candidate_info})",
+                    "input_tokens": generation["input_tokens"],
+                    "output_tokens": generation["output_tokens"]
                 })
+                for level, text in generation["messages"]:
+                    getattr(st, level)(text)
+                if generation["errors"]:
+                    with st.expander(f"Verworfene Generator-Kandidaten ({len(generation['errors'])})", expanded=not generator_success):
+                        for error_text in generation["errors"]:
+                            st.warning(error_text)
                 if not generator_success:
-                    st.error("Workflow-Generierung fehlgeschlagen.")
+                    st.error("Workflow-Generierung fehlgeschlagen: Kein Kandidat ergab eine gültige Konfiguration.")
                     with st.expander("Generator Output (Fehler)", expanded=True):
                         st.code(generator_output, language='text')
                     st.stop()
-                generated_config_list, parse_error = parse_generator_output(generator_output)
-                if parse_error:
-                    st.error("Fehler Parsen Generator-Antwort:")
-                    st.error(parse_error)
-                    st.code(generator_output, language='text')
-                    st.stop()
-                if not generated_config_list:
-                    st.error("Generator gab leere Konfig zurück.")
-                    st.code(generator_output, language='text')
-                    st.stop()
-                validated_generated_config = validate_config_list(generated_config_list, "generierter Konfiguration")
-                if validated_generated_config is None:
-                    st.error("Generierte Konfiguration ungültig. Prozess gestoppt.")
-                    st.subheader("Fehlerhafter JSON-Output des Generators:")
-                    st.code(generator_output, language="json")
-                    st.stop()
                 else:
+                    validated_generated_config = generation["config"]
                     final_agents_config = validated_generated_config
+                    workflow_plan = WorkflowPlan(selected_workflow_name, final_agents_config, [])
                     # --- Hier wird die Auto-Save-Funktion aufgerufen ---
                     save_message = save_generated_config(validated_generated_config, base_name="generated_workflow")
                     st.success(save_message)
@@ -660,419 +576,71 @@ def build_tab(api_key: str | None = None):
                     results_placeholder.info("Führe generierten Workflow aus...")
                     time.sleep(1)
         else:
-            config_to_validate = load_agent_config(agent_config_file_path)
-            if config_to_validate:
-                final_agents_config = validate_config_list(config_to_validate, f"'{agent_config_file_path}'")
+            workflow_plan = get_workflow_plan(agent_config_file_path, selected_workflow_name, show_messages=False)
+            final_agents_config = workflow_plan.agents if workflow_plan else None
             if final_agents_config is None:
                 st.error(f"Vordefinierte Konfig für '{selected_workflow_name}' ungültig/nicht geladen.")
                 st.stop()
             results_placeholder.info(f"Führe Workflow '{selected_workflow_name}' aus...")
             time.sleep(0.5)
         if final_agents_config:
-            with st.spinner(f"Agenten arbeiten..."):
-                try:
-                    overall_success = True
-                    for agent_index, agent_conf in enumerate(final_agents_config):
-                        agent_name = agent_conf.get("name", f"Agent_{agent_index+1}")
-                        system_instruction = agent_conf.get("system_instruction", "-")
-                        enable_web_search = agent_conf.get("enable_web_search", False)
-                        temperature = agent_conf.get("temperature")
-                        receives_from = agent_conf.get("receives_messages_from", [])
-                        accepts_files = agent_conf.get("accepts_files", False)
-                        callable_tool_names = agent_conf.get("callable_tools", [])
-                        results_placeholder.info(f"🧠 Agent: **{agent_name}** ({agent_index + 1}/{len(final_agents_config)})...")
-                        all_sources_found = True
-                        current_input_parts: List[Part] = []
-                        current_input_parts.append(Part(text=f"System Anweisung ({selected_workflow_name} - Rolle: {agent_name}):\n{system_instruction}\n---"))
-                        is_first_relevant_agent = not receives_from or all(source not in st.session_state.message_store for source in receives_from)
-                        if is_first_relevant_agent:
-                            if question.strip():
-                                current_input_parts.append(Part(text=f"Nutzeranfrage:\n{prompt_for_execution}"))
-                            if accepts_files and st.session_state.uploaded_files_data:
-                                current_input_parts.append(Part(text="\n\n--- START KONTEXT DATEIEN ---"))
-                                files_added_count = 0
-                                for file_data in st.session_state.uploaded_files_data:
-                                    file_name, file_type, file_bytes = file_data["name"], file_data["type"], file_data["bytes"]
-                                    if file_type.startswith("image/"):
-                                        try:
-                                            image_part = Part.from_data(mime_type=file_type, data=file_bytes)
-                                            current_input_parts.append(Part(text=f"\nBild: `{file_name}`"))
-                                            current_input_parts.append(image_part)
-                                            files_added_count += 1
-                                        except Exception as img_e:
-                                            st.warning(f"Bild '{file_name}' konnte nicht für Agent '{agent_name}' hinzugefügt werden: {img_e}")
-                                    else:
-                                        try:
-                                            file_content = "[Dekodierungsfehler]"
-                                            for encoding in ['utf-8', 'latin-1', 'windows-1252']:
-                                                try:
-                                                    file_content = file_bytes.decode(encoding)
-                                                    break
-                                                except UnicodeDecodeError:
-                                                    continue
-                                            if len(file_content) > MAX_CONTENT_LENGTH * 2:
-                                                file_content = file_content[:MAX_CONTENT_LENGTH * 2] + "\n... [Datei gekürzt]"
-                                            file_text_part = Part(text=(f"\n--- START DATEI: `{file_name}` ---\n{file_content}\n--- ENDE DATEI: `{file_name}` ---"))
-                                            current_input_parts.append(file_text_part)
-                                            files_added_count += 1
-                                        except Exception as decode_e:
-                                            st.warning(f"Datei '{file_name}' ({file_type}) ignoriert für Agent '{agent_name}' (Decode-Fehler): {decode_e}")
-                                if files_added_count > 0:
-                                    current_input_parts.append(Part(text="\n--- ENDE KONTEXT DATEIEN ---"))
-                                else:
-                                    if current_input_parts[-1].text == "\n\n--- START KONTEXT DATEIEN ---":
-                                        current_input_parts.pop()
-                        else:
-                            previous_outputs_text = []
-                            all_sources_found = True
-                            for source_agent_name in receives_from:
-                                if source_agent_name in st.session_state.message_store:
-                                    previous_outputs_text.append(f"--- START ERGEBNIS VON '{source_agent_name}' ---\n{st.session_state.message_store[source_agent_name]}\n--- ENDE ERGEBNIS VON '{source_agent_name}' ---")
-                                else:
-                                    error_msg = f"Input von '{source_agent_name}' fehlt. Überspringe '{agent_name}'."
-                                    st.warning(error_msg)
-                                    st.session_state.agent_results_display.append({"agent": agent_name, "status": "Übersprungen", "details": error_msg, "output": "[Input fehlt]"})
-                                    all_sources_found = False
-                                    break
-                            if not all_sources_found:
-                                overall_success = False
-                                continue
-                            input_from_previous = "\n\n".join(previous_outputs_text)
-                            current_input_parts.append(Part(text=f"Vorherige Ergebnisse:\n{input_from_previous}\n---\nDeine Aufgabe basierend auf diesen Ergebnissen:"))
-                        agent_tools_list = []
-                        current_agent_func_declarations = []
-                        if enable_web_search:
-                            agent_tools_list.append(Tool(function_declarations=[FunctionDeclaration(
-                                name="custom_google_search",
-                                description="Führt eine Google Custom Search aus. Nutzt den Suchbegriff oder eine URL für die Suche.",
-                                parameters={
-                                    "type": "OBJECT",
-                                    "properties": {
-                                        "query": {
-                                            "type": "STRING",
-                                            "description": "Die Suchanfrage oder URL, die durchsucht werden soll."
-                                        }
-                                    },
-                                    "required": ["query"]
-                                }
-                            )]))
-                        if callable_tool_names:
-                            for tool_name in callable_tool_names:
-                                if tool_name in AVAILABLE_TOOLS:
-                                    func = AVAILABLE_TOOLS[tool_name]
-                                    description = inspect.getdoc(func) or f"Führt die Aktion '{tool_name}' aus."
-                                    description = description.splitlines()[0]
-                                    params_schema = {}
-                                    if tool_name == "calculator" or tool_name == "safe_calculator":
-                                        params_schema = {
-                                            "type": "OBJECT",
-                                            "properties": {
-                                                "expression": {
-                                                    "type": "STRING",
-                                                    "description": "Der mathematische Ausdruck, z.B. '5 * (2 + 3)'"
-                                                }
-                                            },
-                                            "required": ["expression"]
-                                        }
-                                    elif tool_name == "get_current_datetime":
-                                        params_schema = {"type": "OBJECT", "properties": {}}
-                                    elif tool_name == "fetch_url_content":
-                                         params_schema = {
-                                             "type": "OBJECT",
-                                             "properties": {
-                                                 "url": {
-                                                     "type": "STRING",
-                                                     "description": "Die vollständige URL der Webseite, die abgerufen werden soll."
-                                                 }
-                                             },
-                                             "required": ["url"]
-                                         }
-                                    elif tool_name == "wikipedia_lookup":
-                                         params_schema = {
-                                             "type": "OBJECT",
-                                             "properties": {
-                                                 "term": {
-                                                     "type": "STRING",
-                                                     "description": "Der Suchbegriff für Wikipedia."
-                                                 }
-                                             },
-                                             "required": ["term"]
-                                         }
-                                    elif tool_name == "list_uploaded_files":
-                                         params_schema = {"type": "OBJECT", "properties": {}}
-                                    elif tool_name == "read_specific_file":
-                                         params_schema = {
-                                             "type": "OBJECT",
-                                             "properties": {
-                                                 "filename": {
-                                                     "type": "STRING",
-                                                     "description": "Der genaue Name der hochgeladenen Datei, die gelesen werden soll."
-                                                 }
-                                             },
-                                             "required": ["filename"]
-                                         }
-                                    elif tool_name == "custom_google_search":
-                                         params_schema = {
-                                             "type": "OBJECT",
-                                             "properties": {
-                                                 "query": {
-                                                     "type": "STRING",
-                                                     "description": "Die Suchanfrage oder URL für die Google Custom Search."
-                                                 }
-                                             },
-                                             "required": ["query"]
-                                         }
-                                    if params_schema or tool_name in ["get_current_datetime", "list_uploaded_files"]:
-                                         current_agent_func_declarations.append(
-                                             FunctionDeclaration(name=tool_name, description=description, parameters=params_schema)
-                                         )
-                                    else:
-                                         st.warning(f"Kein Schema für bekanntes Tool '{tool_name}' definiert. Es wird nicht für Agent '{agent_name}' verfügbar sein.")
-                                else:
-                                    st.warning(f"Tool '{tool_name}' für '{agent_name}' nicht in AVAILABLE_TOOLS.")
-                            if current_agent_func_declarations:
-                                agent_tools_list.append(Tool(function_declarations=current_agent_func_declarations))
-                        gen_config_args = {}
-                        if temperature is not None:
-                             try:
-                                 gen_config_args["temperature"] = float(temperature)
-                             except ValueError:
-                                 st.warning(f"Ungültiger Temperaturwert '{temperature}' für Agent '{agent_name}'. Verwende Standard.")
-                        agent_specific_config = GenerateContentConfig(**gen_config_args)
-                        max_function_calls = 5
-                        call_count = 0
-                        final_agent_output = ""
-                        agent_success_flag = False
-                        grounding_info = None
-                        conversation_history = list(current_input_parts)
-                        should_skip = (agent_conf.get("name", "").startswith("Planner") and accepts_files and not st.session_state.uploaded_files_data and not question.strip())
-                        while call_count < max_function_calls:
-                            if should_skip:
-                                st.info(f"'{agent_name}' übersprungen (Planner ohne Input).")
-                                st.session_state.agent_results_display.append({"agent": agent_name, "status": "Übersprungen", "output": "[Keine Frage/Dateien]"})
-                                agent_success_flag = True
-                                final_agent_output = "[Keine Frage/Dateien]"
-                                break
-                            try:
-                                effective_model_for_call = f"models/{model_id}"
-                                response = limited_generate_content(
-                                    client=client,
-                                    model=effective_model_for_call,
-                                    contents=conversation_history,
-                                    config=agent_specific_config,
-                                )
-                                candidate = response.candidates[0] if response.candidates else None
-                                function_call = None
-                                if candidate and hasattr(candidate, 'content') and candidate.content and hasattr(candidate.content, 'parts') and candidate.content.parts:
-                                    first_part = candidate.content.parts[0]
-                                    if hasattr(first_part, 'function_call') and first_part.function_call:
-                                         function_call = first_part.function_call
-                                if function_call and hasattr(function_call, 'name'):
-                                    tool_name = function_call.name
-                                    tool_args = dict(function_call.args) if hasattr(function_call, 'args') else {}
-                                    st.info(f"'{agent_name}' -> Tool `{tool_name}`...")
-                                    conversation_history.append(candidate.content.parts[0])
-                                    if tool_name in AVAILABLE_TOOLS:
-                                        tool_function = AVAILABLE_TOOLS[tool_name]
-                                        try:
-                                            function_result = tool_function(**tool_args)
-                                            st.success(f"Tool `{tool_name}` OK.")
-                                            function_response_part = Part(function_response=FunctionResponse(name=tool_name, response={"content": str(function_result)}))
-                                            conversation_history.append(function_response_part)
-                                            call_count += 1
-                                            continue
-                                        except Exception as func_exc:
-                                            st.error(f"Tool `{tool_name}` Fehler: {func_exc}")
-                                            error_response_part = Part(function_response=FunctionResponse(name=tool_name, response={"error": f"Fehler bei Ausführung: {str(func_exc)}"}))
-                                            conversation_history.append(error_response_part)
-                                            call_count += 1
-                                            continue
-                                    else:
-                                        st.error(f"Unbekanntes Tool `{tool_name}` von Agent '{agent_name}' angefordert.")
-                                        error_response_part = Part(function_response=FunctionResponse(name=tool_name, response={"error": f"Unbekanntes Tool: {tool_name}"}))
-                                        conversation_history.append(error_response_part)
-                                        call_count += 1
-                                        continue
-                                else:
-                                    if candidate and hasattr(candidate, 'content') and candidate.content and hasattr(candidate.content, 'parts') and candidate.content.parts:
-                                        text_parts = [part.text for part in candidate.content.parts if hasattr(part, 'text')]
-                                        if text_parts:
-                                            final_agent_output = "\n".join(text_parts).strip()
-                                            grounding_info = get_grounding_info(candidate)
-                                            agent_success_flag = True
-                                        else:
-                                            feedback = getattr(response, 'prompt_feedback', None)
-                                            finish_reason = getattr(candidate, 'finish_reason', 'UNKNOWN')
-                                            safety_ratings = getattr(candidate, 'safety_ratings', [])
-                                            block_reason = getattr(feedback, 'block_reason', "Kein Text") if feedback else "Kein Text"
-                                            block_msg = getattr(feedback, 'block_reason_message', f"Finish Reason: {finish_reason}, Safety: {safety_ratings}") if feedback else f"Finish Reason: {finish_reason}, Safety: {safety_ratings}"
-                                            final_agent_output = f"[Fehler: Keine gültige Antwort. Grund: {block_reason}. Nachricht: {block_msg}]"
-                                            st.error(f"'{agent_name}': {final_agent_output}")
-                                            agent_success_flag = False
-                                    else:
-                                        feedback = getattr(response, 'prompt_feedback', None)
-                                        finish_reason = getattr(candidate, 'finish_reason', 'UNKNOWN') if candidate else 'NO_CANDIDATE'
-                                        block_reason = getattr(feedback, 'block_reason', "Keine Antwortstruktur") if feedback else "Keine Antwortstruktur"
-                                        block_msg = getattr(feedback, 'block_reason_message', f"Finish Reason: {finish_reason}") if feedback else f"Finish Reason: {finish_reason}"
-                                        final_agent_output = f"[Fehler: Keine gültige Antwort. Grund: {block_reason}. Nachricht: {block_msg}]"
-                                        st.error(f"'{agent_name}': {final_agent_output}")
-                                        agent_success_flag = False
-                                    break
-                            except Exception as e:
-                                st.error(f"❌ Kritischer Fehler bei '{agent_name}': {e}")
-                                st.error(traceback.format_exc())
-                                final_agent_output = f"[Kritischer Fehler: {e}]"
-                                agent_success_flag = False
-                                overall_success = False
-                                break
-                        if call_count >= max_function_calls:
-                            st.warning(f"Agent '{agent_name}' hat Limit für Funktionsaufrufe ({max_function_calls}) erreicht.")
-                            if not final_agent_output:
-                                final_agent_output = "[Function Call Limit erreicht]"
-                            agent_success_flag = False
-                        if final_agent_output:
-                            if agent_success_flag and "[Keine Frage/Dateien]" not in final_agent_output:
-                                st.session_state.message_store[agent_name] = final_agent_output
-                            already_skipped = any(r['agent'] == agent_name and r['status'] == 'Übersprungen' for r in st.session_state.agent_results_display)
-                            if not already_skipped:
-                                current_status = "Erfolgreich" if agent_success_flag else "Fehlgeschlagen"
-                                if "[Übersprungen" in final_agent_output or "[Keine Frage/Dateien]" in final_agent_output or "[Input fehlt]" in final_agent_output:
-                                    current_status = "Übersprungen"
-                                st.session_state.agent_results_display.append({
-                                    "agent": agent_name,
-                                    "status": current_status,
-                                    "output": final_agent_output,
-                                    "sources": grounding_info,
-                                    "details": None
-                                })
-                        elif not should_skip:
-                             st.warning(f"Agent '{agent_name}' beendete ohne expliziten Output.")
-                             st.session_state.agent_results_display.append({
-                                 "agent": agent_name, "status": "Unbekannt",
-                                 "output": "[Kein Output erhalten]", "sources": None, "details": "Agent lief, aber gab keinen Output."
-                             })
-                             agent_success_flag = False
-                        if not agent_success_flag and not (should_skip or "[Input fehlt]" in final_agent_output):
-                            overall_success = False
-                except Exception as e:
-                     st.error(f"❌ Unerwarteter Fehler im Hauptprozess: {e}")
-                     st.error(traceback.format_exc())
-                     overall_success = False
-            results_placeholder.empty()
-            st.markdown("---")
-            if not st.session_state.agent_results_display:
-                st.warning("Keine Agenten ausgeführt.")
-            elif overall_success:
-                st.success("✅ Workflow erfolgreich abgeschlossen.")
-            else:
-                if any(r['status']=='Fehlgeschlagen' for r in st.session_state.agent_results_display):
-                     st.error("❌ Workflow mit Fehlern abgeschlossen.")
-                else:
-                     st.warning("⚠️ Workflow mit Überspringungen oder Warnungen abgeschlossen.")
-            st.subheader("Ergebnisse der einzelnen Agenten:")
-            for result in st.session_state.agent_results_display:
-                agent_name = result.get('agent', 'Unbekannter Agent')
-                status = result.get('status', 'Unbekannt')
-                output = result.get('output', '[Kein Output]')
-                sources = result.get('sources')
-                details = result.get('details')
-                status_icon = '❓'
-                if status == 'Erfolgreich': status_icon = '✅'
-                elif status == 'Fehlgeschlagen': status_icon = '❌'
-                elif status in ['Warnung', 'Übersprungen', 'Unbekannt']: status_icon = '⚠️'
-                expander_title = f"{status_icon} Agent: **{agent_name}** ({status})"
-                expand_default = (status != 'Übersprungen')
-                with st.expander(expander_title, expanded=expand_default):
-                    st.markdown("##### Output:")
-                    is_likely_code_output = "```" in output or (status == 'Erfolgreich' and any(kw in agent_name.lower() for kw in ["coder", "architect", "refiner", "developer"]))
-                    if agent_name == GENERATOR_WORKFLOW_NAME and status == 'Erfolgreich':
-                         try:
-                             st.code(json.dumps(json.loads(output), indent=2), language="json")
-                         except json.JSONDecodeError:
-                             st.code(output, language="json")
-                    elif is_likely_code_output and status == 'Erfolgreich':
-                        lang_match = re.search(r"```(\w+)", output)
-                        lang_name = selected_workflow_name.split()[0].lower().replace("plugin", "python")
-                        lang_map = {"python":"python", "c++":"cpp", "java":"java", "javascript":"javascript"}
-                        default_lang = lang_map.get(lang_name, "plaintext")
-                        lang = lang_match.group(1) if lang_match else default_lang
-                        code_content = re.sub(r"^\s*```[\w\+\#\-\.]*\n?", "", output, count=1)
-                        code_content = re.sub(r"\n?```\s*$", "", code_content)
-                        st.code(code_content.strip(), language=lang, line_numbers=True)
-                    else:
-                        st.markdown(output)
-                    if sources:
-                        st.markdown("##### Quellen/Infos:")
-                        st.caption(f"{sources}")
-                    if details:
-                        st.info(f"Details: {details}")
-            st.markdown("---")
-            st.subheader("📦 Download generierter Dateien")
-            project_files = {}
-            file_pattern = re.compile(r"## FILE: \s*([\w\.\-\/]+\.\w+)\s*\n```(?:[\w\+\#\-\.]*\n)?(.*?)```", re.DOTALL | re.MULTILINE)
-            for result in st.session_state.agent_results_display:
-                 if result.get("status") == "Erfolgreich" and result.get("agent") != GENERATOR_WORKFLOW_NAME and result.get("output"):
-                     output_text = result.get("output")
-                     matches = file_pattern.findall(output_text)
-                     for filename, content in matches:
-                         clean_filename = filename.strip()
-                         clean_content = content.strip()
-                         if clean_content:
-                             if not clean_content.endswith('\n'):
-                                 clean_content += '\n'
-                             project_files[clean_filename] = clean_content
-                             st.caption(f"✔️ Datei `{clean_filename}` aus Agent '{result.get('agent')}' extrahiert.")
-            if project_files:
-                st.write(f"Generierte Dateien ({len(project_files)}) für **'{selected_workflow_name}'**:")
-                st.markdown("\n".join([f"- `{fname}`" for fname in sorted(project_files.keys())]))
-                zip_buffer = io.BytesIO()
+            if workflow_plan.graph_error:
+                st.error(f"❌ Ungültiger Abhängigkeitsgraph: {workflow_plan.graph_error}")
+                st.stop()
+            overall_success = execute_workflow_plan(client, model_id, workflow_plan, question, results_placeholder)
+            show_workflow_results(selected_workflow_name, overall_success)
+    elif resume_run_id:
+        stored_run = run_store.load_run(resume_run_id)
+        resume_plan = WorkflowPlan(stored_run["workflow_name"], stored_run["agents"], [])
+        if resume_plan.graph_error:
+            st.error(f"❌ Ungültiger Abhängigkeitsgraph: {resume_plan.graph_error}")
+            st.stop()
+        st.session_state.agent_fingerprints = {}
+        st.session_state.message_store = {}
+        st.session_state.agent_results_display = []
+        st.session_state.artifacts = ArtifactStore()
+        st.session_state.trace = RunTrace(stored_run["workflow_name"])
+        st.session_state.history_view = None
+        prepare_resume(st.session_state, stored_run)
+        completed_count = sum(result.get("status") == "Erfolgreich" for result in stored_run["results"])
+        st.markdown(f"**Aufgabe:** {stored_run['question']}")
+        results_placeholder = st.empty()
+        results_placeholder.info(f"Setze Lauf `{resume_run_id}` fort ({completed_count}/{len(resume_plan.agents)} Agenten bereits abgeschlossen)...")
+        try:
+            client = genai.Client(api_key=api_key)
+        except Exception as e:
+             st.error(f"Fehler beim Initialisieren des genai.Client: {e}")
+             st.stop()
+        overall_success = execute_workflow_plan(client, stored_run["model_id"], resume_plan, stored_run["question"], results_placeholder)
+        show_workflow_results(stored_run["workflow_name"], overall_success)
+    elif st.session_state.get("history_view"):
+        match st.session_state.history_view:
+            case ("load", run_id):
+                stored_run = run_store.load_run(run_id)
+                if stored_run is None:
+                    st.warning(f"Lauf `{run_id}` nicht gefunden.")
+                    st.stop()
+                st.info(f"📂 Gespeicherter Lauf `{run_id}` vom {datetime.datetime.fromtimestamp(stored_run['created']).strftime('%d.%m.%Y %H:%M')} ({stored_run['status']}) – Ergebnisse aus der Laufhistorie, ohne erneute Modellaufrufe.")
+                st.markdown(f"**Aufgabe:** {stored_run['question']}")
+                if stored_run["error"]:
+                    st.error(f"Abbruchgrund: {stored_run['error']}")
+                st.session_state.agent_results_display = stored_run["results"]
+                st.session_state.artifacts = ArtifactStore.from_results(stored_run["results"], [agent_conf.get("name") for agent_conf in stored_run["agents"]])
+                st.session_state.message_store = {result["agent"]: result["output"] for result in stored_run["results"] if result.get("status") == "Erfolgreich"}
+                st.session_state.trace = None
+                show_workflow_results(stored_run["workflow_name"], stored_run["status"] == "Erfolgreich")
+            case ("diff", run_id_a, run_id_b):
+                st.subheader(f"🔀 Vergleich `{run_id_a}` → `{run_id_b}`")
                 try:
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
-                        for filename, content in project_files.items():
-                            zip_f.writestr(filename, content.encode('utf-8'))
-                    zip_bytes = zip_buffer.getvalue()
-                    download_filename = f"{selected_workflow_name.lower().replace(' ','_')}_output_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}.zip"
-                    st.download_button(label=f"⬇️ '{selected_workflow_name}' Ergebnisse als ZIP", data=zip_bytes, file_name=download_filename, mime="application/zip", key="download_zip_button")
-                except Exception as zip_e:
-                    st.error(f"Fehler beim Zippen: {zip_e}")
-                    st.error(traceback.format_exc())
-            else:
-                st.info("Keine Dateien (`## FILE: ...`) zum Zippen im Output gefunden.")
-            st.markdown("---")
-            st.subheader("🏁 Finales Text-Ergebnis")
-            final_successful_output = "[Kein spezifisches textuelles Endergebnis gefunden]"
-            final_agent_name = None
-            for res in reversed(st.session_state.agent_results_display):
-                output = res.get("output", "")
-                status = res.get("status")
-                agent = res.get("agent")
-                if agent != GENERATOR_WORKFLOW_NAME and status == "Erfolgreich" and output and "[Kein Output]" not in output and "[Keine Frage/Dateien]" not in output and "[Input fehlt]" not in output:
-                     is_likely_just_files = file_pattern.fullmatch(output.strip()) is not None or output.strip().startswith("## FILE:")
-                     is_meta_agent = any(kw in agent.lower() for kw in ["planner", "reviewer", "packager", "summary", "orchestrator"])
-                     if (not is_likely_just_files or is_meta_agent):
-                         final_successful_output = output
-                         final_agent_name = agent
-                         break
-                     elif final_agent_name is None:
-                         final_successful_output = f"[Letzter Output war Code/Datei von Agent '{agent}']"
-                         final_agent_name = agent
-            final_title_suffix = f"(von Agent: **{final_agent_name}**)" if final_agent_name else ""
-            st.markdown(f"**{final_title_suffix}**")
-            if "[Letzter Output war Code/Datei von Agent" in final_successful_output or "[Kein spezifisches textuelles Endergebnis gefunden" in final_successful_output:
-                st.info(final_successful_output)
-            else:
-                is_likely_code_final = "```" in final_successful_output or (final_agent_name and any(kw in final_agent_name.lower() for kw in ["coder", "developer", "refiner"]))
-                if is_likely_code_final:
-                    lang_match = re.search(r"```(\w+)", final_successful_output)
-                    lang_name = selected_workflow_name.split()[0].lower().replace("plugin", "python")
-                    lang_map = {"python":"python", "c++":"cpp", "java":"java", "javascript":"javascript"}
-                    default_lang = lang_map.get(lang_name, "plaintext")
-                    lang = lang_match.group(1) if lang_match else default_lang
-                    code_content = re.sub(r"^\s*```[\w\+\#\-\.]*\n?", "", final_successful_output, count=1)
-                    code_content = re.sub(r"\n?```\s*$", "", code_content)
-                    st.code(code_content.strip(), language=lang, line_numbers=True)
-                else:
-                    st.markdown(final_successful_output)
+                    diff_rows = run_store.diff_runs(run_id_a, run_id_b)
+                except KeyError as e:
+                    st.warning(f"Lauf `{e.args[0]}` nicht gefunden.")
+                    st.stop()
+                st.dataframe([{"Agent": row["agent"], "Status A": row["status_a"], "Status B": row["status_b"], "Output geändert": row["changed"]} for row in diff_rows], hide_index=True, use_container_width=True)
+                for row in diff_rows:
+                    if row["changed"]:
+                        with st.expander(f"Δ {row['agent']}"):
+                            st.code(row["diff"] or "[Nur in einem der Läufe vorhanden]", language="diff")
     # Ende build_tab
 
 if __name__ == "__main__":
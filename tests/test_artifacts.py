@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Tests der ## FILE:-Extraktion (parse_file_blocks, ArtifactStore) und des bei Bedarf gebauten ZIP-Archivs.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import io
+import os
+import sys
+import unittest
+import zipfile
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_engine  # noqa: E402
+from workflow_engine import GENERATOR_WORKFLOW_NAME, ArtifactStore, parse_file_blocks  # noqa: E402
+
+def agent_result(agent: str, output: str, status: str = "Erfolgreich") -> dict:
+    return {"agent": agent, "status": status, "output": output}
+
+class ParseFileBlocksTest(unittest.TestCase):
+    def test_blocks_with_and_without_language(self) -> None:
+        text = "Vorwort\n## FILE: src/main.py\n```python\nprint(1)\n```\nZwischentext\n## FILE: README.md\n```\n# Titel\n```"
+        self.assertEqual(list(parse_file_blocks(text)), [("src/main.py", "print(1)\n"), ("README.md", "# Titel\n")])
+
+    def test_unclosed_block_ends_parsing(self) -> None:
+        text = "## FILE: a.txt\n```\nA\n```\n## FILE: b.txt\n```\nohne Ende"
+        self.assertEqual(list(parse_file_blocks(text)), [("a.txt", "A\n")])
+
+class ArtifactStoreTest(unittest.TestCase):
+    def test_later_agent_in_workflow_order_wins(self) -> None:
+        store = ArtifactStore()
+        store.add_result(agent_result("Refiner", "## FILE: x.py\n```\nneu\n```"), rank=2)  # parallel früher fertig
+        store.add_result(agent_result("Coder", "## FILE: x.py\n```\nalt\n```\n## FILE: y.py\n```\ny\n```"), rank=1)
+        self.assertEqual(store.items(), [("x.py", "Refiner", "neu\n"), ("y.py", "Coder", "y\n")])
+        self.assertEqual(store.overridden, [("x.py", "Coder", "Refiner")])
+
+    def test_failed_generator_and_empty_blocks_are_ignored(self) -> None:
+        store = ArtifactStore.from_results([
+            agent_result("Coder", "## FILE: a.py\n```\nA\n```", status="Fehler"),
+            agent_result(GENERATOR_WORKFLOW_NAME, "## FILE: b.py\n```\nB\n```"),
+            agent_result("Writer", "## FILE: leer.txt\n```\n   \n```"),
+        ])
+        self.assertEqual(len(store), 0)
+
+    def test_zip_is_built_only_on_request(self) -> None:
+        with mock.patch.object(ArtifactStore, "open_zip", autospec=True, side_effect=ArtifactStore.open_zip) as open_zip:
+            store = ArtifactStore.from_results([agent_result("Coder", "## FILE: pkg/a.py\n```\nA\n```")])
+            store.items()
+            open_zip.assert_not_called()
+            archive = zipfile.ZipFile(io.BytesIO(store.zip_bytes()))
+        self.assertEqual(open_zip.call_count, 1)
+        self.assertEqual((archive.namelist(), archive.read("pkg/a.py")), (["pkg/a.py"], b"A\n"))
+
+    def test_large_zip_spools_to_disk(self) -> None:
+        store = ArtifactStore.from_results([agent_result("Coder", "## FILE: daten.bin\n```\n" + os.urandom(64 * 1024).hex() + "\n```")])
+        with mock.patch.object(workflow_engine, "ZIP_SPOOL_MAX_BYTES", 1024):
+            spooled_zip = store.open_zip()
+        with spooled_zip:
+            self.assertTrue(spooled_zip._rolled)
+            self.assertEqual(zipfile.ZipFile(spooled_zip).namelist(), ["daten.bin"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des PooledHttpClient und von fetch_url_content (workflow_tools) gegen einen lokalen http.server als Stand-in für echte Webseiten.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_tools  # noqa: E402
+from workflow_tools import HTTP_CHUNK_SIZE, PooledHttpClient, StreamingTextExtractor, fetch_url_content  # noqa: E402
+
+PAGE_ETAG = '"v1"'
+SMALL_PAGE = b"<html><body><main>Hallo Welt</main></body></html>"
+LARGE_PAGE = b"<html><body>" + b"x" * (3 * HTTP_CHUNK_SIZE) + b"</body></html>"
+LATIN1_PAGE = "<html><body><main>Grüße aus Köln</main></body></html>".encode("latin-1")
+PDF_DOCUMENT = b"%PDF-1.4\n" + b"\0" * (3 * HTTP_CHUNK_SIZE)
+
+class ConditionalGetHandler(BaseHTTPRequestHandler):
+    """
+    Liefert /small und /large mit ETag und antwortet auf passendes If-None-Match mit 304; /latin1 ist HTML mit
+    Zeichensatz nur im Content-Type-Header, /doc.pdf ein Nicht-HTML-Dokument.
+    """
+    protocol_version = "HTTP/1.1"
+    request_log: List[Dict[str, str]] = []
+
+    def do_GET(self) -> None:
+        self.request_log.append({"path": self.path, "if_none_match": self.headers.get("If-None-Match", "")})
+        if self.headers.get("If-None-Match") == PAGE_ETAG:
+            self.send_response(304)
+            self.send_header("ETag", PAGE_ETAG)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path in ("/latin1", "/doc.pdf"):
+            body, content_type = (LATIN1_PAGE, "text/html; charset=iso-8859-1") if self.path == "/latin1" else (PDF_DOCUMENT, "application/pdf")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = LARGE_PAGE if self.path == "/large" else SMALL_PAGE
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", PAGE_ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+class LocalServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ConditionalGetHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+class PooledHttpClientTest(LocalServerTestCase):
+    def setUp(self) -> None:
+        ConditionalGetHandler.request_log.clear()
+        self.client = PooledHttpClient(max_retries=0)
+
+    def test_not_modified_replays_cached_body(self) -> None:
+        first = self.client.get(f"{self.base_url}/small")
+        self.assertEqual((first.status_code, first.content), (200, SMALL_PAGE))
+        chunks: List[bytes] = []
+        second = self.client.get(f"{self.base_url}/small", on_chunk=lambda chunk: chunks.append(chunk) and False)
+        self.assertEqual(ConditionalGetHandler.request_log[-1]["if_none_match"], PAGE_ETAG)
+        self.assertEqual(self.client.not_modified_count, 1)
+        self.assertEqual((second.status_code, second.content, b"".join(chunks)), (200, SMALL_PAGE, SMALL_PAGE))
+
+    def test_streamed_body_is_replayed_after_not_modified(self) -> None:
+        self.client.get(f"{self.base_url}/large", on_chunk=lambda chunk: False)
+        chunks: List[bytes] = []
+        self.client.get(f"{self.base_url}/large", on_chunk=lambda chunk: chunks.append(chunk) and False)
+        self.assertEqual(self.client.not_modified_count, 1)
+        self.assertEqual(b"".join(chunks), LARGE_PAGE)
+
+    def test_truncated_body_is_not_cached(self) -> None:
+        partial = self.client.get(f"{self.base_url}/large", max_bytes=HTTP_CHUNK_SIZE)
+        self.assertEqual(len(partial.content), HTTP_CHUNK_SIZE)
+        self.client.get(f"{self.base_url}/large", on_chunk=lambda chunk: True)
+        full = self.client.get(f"{self.base_url}/large")
+        self.assertEqual([entry["if_none_match"] for entry in ConditionalGetHandler.request_log], ["", "", ""])
+        self.assertEqual((full.status_code, full.content), (200, LARGE_PAGE))
+
+    def test_cache_is_keyed_by_request_headers(self) -> None:
+        self.client.get(f"{self.base_url}/small", headers={"Accept-Language": "de"})
+        self.client.get(f"{self.base_url}/small", headers={"Accept-Language": "en"})
+        self.client.get(f"{self.base_url}/small", headers={"Accept-Language": "de"})
+        self.assertEqual([entry["if_none_match"] for entry in ConditionalGetHandler.request_log], ["", "", PAGE_ETAG])
+
+    def test_each_caller_gets_its_own_response(self) -> None:
+        first = self.client.get(f"{self.base_url}/small")
+        first.headers["ETag"] = '"vom Aufrufer geändert"'
+        first.encoding = "latin-1"
+        second = self.client.get(f"{self.base_url}/small")
+        third = self.client.get(f"{self.base_url}/small")
+        self.assertEqual(ConditionalGetHandler.request_log[1]["if_none_match"], PAGE_ETAG)
+        self.assertIsNot(second, third)
+        second.headers["X-Test"] = "nur hier"
+        self.assertNotIn("X-Test", third.headers)
+        self.assertEqual((third.headers["ETag"], third.encoding, third.content), (PAGE_ETAG, "utf-8", SMALL_PAGE))
+
+    def test_rejected_response_body_is_not_read(self) -> None:
+        chunks: List[bytes] = []
+        response = self.client.get(f"{self.base_url}/doc.pdf", on_chunk=lambda chunk: chunks.append(chunk) and False,
+                                   accept_response=lambda response: "text/html" in response.headers["Content-Type"])
+        self.assertEqual((response.status_code, response.content, chunks), (200, b"", []))
+
+class FetchUrlContentTest(LocalServerTestCase):
+    def test_non_html_is_rejected_before_parsing(self) -> None:
+        with mock.patch.object(StreamingTextExtractor, "feed") as feed:
+            result = fetch_url_content.__wrapped__(f"{self.base_url}/doc.pdf")
+        self.assertIn("Inhaltstyp ist nicht HTML (application/pdf)", result)
+        feed.assert_not_called()
+
+    def test_charset_from_content_type_header(self) -> None:
+        self.assertIn("Grüße aus Köln", fetch_url_content.__wrapped__(f"{self.base_url}/latin1"))
+        with mock.patch.object(workflow_tools, "lxml_etree", None):
+            self.assertIn("Grüße aus Köln", fetch_url_content.__wrapped__(f"{self.base_url}/latin1"))
+
+if __name__ == "__main__":
+    unittest.main()
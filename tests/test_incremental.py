@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tests der inkrementellen Wiederausführung (compute_agent_fingerprint, agent_result_memo): Ergebnisse werden bei
+unveränderten Eingaben übernommen und bei geänderter Konfiguration, geändertem Quell-Agenten, geänderten Uploads
+oder anderem Modell bzw. anderer Policy neu berechnet. Ausgeführt mit dem Offline-MockModelBackend.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+from typing import Any, Dict, List, Optional, Set
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_engine  # noqa: E402
+from workflow_context import RunState, WorkflowCallbacks  # noqa: E402
+from workflow_engine import CircuitBreaker, WorkflowPlan, get_rate_limiter, run_workflow_async, validate_config_list  # noqa: E402
+from workflow_tools import build_upload_entry  # noqa: E402
+from mock_model_backend import MockModelBackend  # noqa: E402
+
+def chain(**changes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Kette Sammler -> Analyst -> Autor; 'changes' ergänzt bzw. überschreibt Felder einzelner Agenten."""
+    configs = [
+        {"name": "Sammler", "round": 1, "system_instruction": "Sammle Fakten.", "accepts_files": True},
+        {"name": "Analyst", "round": 2, "system_instruction": "Analysiere.", "receives_messages_from": ["Sammler"]},
+        {"name": "Autor", "round": 3, "system_instruction": "Schreibe.", "receives_messages_from": ["Analyst"]},
+    ]
+    return [{**config, **changes.get(config["name"], {})} for config in configs]
+
+class IncrementalExecutionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        get_rate_limiter().configure(100000, 0)
+        breaker_patch = mock.patch.object(workflow_engine, "get_circuit_breaker", return_value=CircuitBreaker(5, 60.0))
+        breaker_patch.start()
+        self.addCleanup(breaker_patch.stop)
+        self.state = RunState(use_response_cache=False, incremental_execution=True, record_run=False)
+        self.first_outputs = self.run_chain(chain())
+
+    def run_chain(self, configs: List[Dict[str, Any]], model_id: str = workflow_engine.DEFAULT_MODEL_ID, files: Optional[List[Dict[str, Any]]] = None) -> Dict[str, str]:
+        """Ein Lauf wie in der Oberfläche: Ergebnisse werden zurückgesetzt, Fingerabdrücke und Gedächtnis bleiben."""
+        self.state.update(message_store={}, agent_results_display=[], artifacts=None, trace=None, uploaded_files_data=files or [])
+        self.backend = MockModelBackend(latency="fixed:0", file_blocks=False)
+        plan = WorkflowPlan("Test", validate_config_list(configs, "Test"), [])
+        self.assertTrue(asyncio.run(run_workflow_async(self.backend, model_id, plan, "Aufgabe", self.state, WorkflowCallbacks(), 2)))
+        return dict(self.state.message_store)
+
+    def recomputed(self) -> Set[str]:
+        return {result["agent"] for result in self.state.agent_results_display if not (result.get("details") or "").startswith("Eingaben unverändert")}
+
+    def test_identical_inputs_reuse_every_result(self) -> None:
+        self.assertEqual(self.run_chain(chain()), self.first_outputs)
+        self.assertEqual((self.recomputed(), self.backend.stats["calls"]), (set(), 0))
+
+    def test_config_change_reruns_the_agent_and_everything_downstream(self) -> None:
+        self.run_chain(chain(Analyst={"system_instruction": "Analysiere kritisch."}))
+        self.assertEqual(self.recomputed(), {"Analyst", "Autor"})
+        self.assertEqual(self.state.message_store["Sammler"], self.first_outputs["Sammler"])
+
+    def test_upstream_change_invalidates_dependents(self) -> None:
+        self.run_chain(chain(Sammler={"temperature": 0.3}))
+        self.assertEqual(self.recomputed(), {"Sammler", "Analyst", "Autor"})
+        self.run_chain(chain(Sammler={"temperature": 0.3}))
+        self.assertEqual(self.recomputed(), set())
+
+    def test_changed_upload_invalidates_results(self) -> None:
+        notes = [build_upload_entry("notizen.txt", "text/plain", "Version 1".encode("utf-8"))]
+        self.run_chain(chain(), files=notes)
+        self.assertEqual(self.recomputed(), {"Sammler", "Analyst", "Autor"})
+        self.run_chain(chain(), files=[build_upload_entry("notizen.txt", "text/plain", "Version 1".encode("utf-8"))])
+        self.assertEqual(self.recomputed(), set())
+        self.run_chain(chain(), files=[build_upload_entry("notizen.txt", "text/plain", "Version 2".encode("utf-8"))])
+        self.assertEqual(self.recomputed(), {"Sammler", "Analyst", "Autor"})
+
+    def test_other_model_reruns_every_agent(self) -> None:
+        self.run_chain(chain(), model_id="gemini-2.0-flash-lite")
+        self.assertEqual(self.recomputed(), {"Sammler", "Analyst", "Autor"})
+        self.run_chain(chain(Autor={"model": "gemini-2.0-flash-lite"}))
+        self.assertEqual(self.recomputed(), {"Autor"})
+
+    def test_policy_not_routed_model_is_part_of_the_fingerprint(self) -> None:
+        self.run_chain(chain(Autor={"model_policy": "fast"}))
+        self.assertEqual(self.recomputed(), {"Autor"})
+        # Auch wenn die Policy wegen neuer Messwerte ein anderes Modell wählt, bleibt das Ergebnis gültig.
+        route_agent_model = workflow_engine.route_agent_model
+
+        def route_to_other_model(*args: Any) -> Any:
+            model_id, policy, reason = route_agent_model(*args)
+            return ("gemini-2.0-pro-exp-02-05" if policy else model_id), policy, reason
+
+        with mock.patch.object(workflow_engine, "route_agent_model", route_to_other_model):
+            self.run_chain(chain(Autor={"model_policy": "fast"}))
+        self.assertEqual(self.recomputed(), set())
+        self.run_chain(chain(Autor={"model_policy": "quality"}))
+        self.assertEqual(self.recomputed(), {"Autor"})
+
+    def test_disabled_incremental_execution_reruns_everything(self) -> None:
+        self.state.incremental_execution = False
+        self.run_chain(chain())
+        self.assertEqual(self.recomputed(), {"Sammler", "Analyst", "Autor"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministische Tests von Circuit Breaker, Backoff und Modell-Fallback (CircuitBreaker, model_retry_delay,
+model_retry) mit simulierter Uhr, festem Zufallsgenerator und dem Offline-MockModelBackend.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+import time
+import unittest
+from typing import Any, List
+from unittest import mock
+
+from google.genai import errors
+from google.genai.types import Content, Part
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_engine  # noqa: E402
+from workflow_engine import CircuitBreaker, ModelUnavailableError, model_retry, model_retry_delay, new_model_call_stats  # noqa: E402
+from mock_model_backend import MockModelBackend  # noqa: E402
+
+class FakeTime:
+    """Ersatz für das time-Modul der Engine: monotonic ist simuliert, sleep merkt sich die Wartezeit und rückt die Uhr vor."""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: List[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(time, name)
+
+class FakeTimeTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeTime()
+        for name, value in (("time", self.clock), ("random", random.Random(7))):
+            patcher = mock.patch.object(workflow_engine, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+class CircuitBreakerTest(FakeTimeTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.breaker = CircuitBreaker(failure_threshold=3, cooldown_s=60.0)
+
+    def state(self) -> str:
+        return self.breaker.status()["m"]["state"]
+
+    def open_breaker(self) -> None:
+        self.assertEqual([self.breaker.record_failure("m") for _ in range(3)], [False, False, True])
+
+    def test_opens_after_consecutive_failures(self) -> None:
+        self.breaker.record_failure("m")
+        self.breaker.record_failure("m")
+        self.breaker.record_success("m")  # Ein Erfolg setzt die Folge zurück
+        self.assertEqual((self.state(), self.breaker.allow("m")), ("geschlossen", 0.0))
+        self.open_breaker()
+        self.clock.now += 20
+        self.assertEqual((self.state(), self.breaker.allow("m")), ("offen", 40.0))
+
+    def test_half_open_admits_one_probe_and_success_closes(self) -> None:
+        self.open_breaker()
+        self.clock.now += 60
+        self.assertEqual(self.state(), "halb offen")
+        self.assertEqual(self.breaker.allow("m"), 0.0)
+        self.clock.now += 5
+        self.assertEqual(self.breaker.allow("m"), 55.0)  # Zweiter Aufrufer wartet auf das Ergebnis des Probeaufrufs
+        self.breaker.record_success("m")
+        self.assertEqual((self.state(), self.breaker.allow("m"), self.breaker.status()["m"]["failures"]), ("geschlossen", 0.0, 0))
+
+    def test_failed_probe_reopens(self) -> None:
+        self.open_breaker()
+        self.clock.now += 60
+        self.assertEqual(self.breaker.allow("m"), 0.0)
+        self.assertTrue(self.breaker.record_failure("m"))
+        self.assertEqual((self.state(), self.breaker.allow("m"), self.breaker.status()["m"]["opened_count"]), ("offen", 60.0, 2))
+
+    def test_abandoned_probe_blocks_for_at_most_one_cooldown(self) -> None:
+        self.open_breaker()
+        self.clock.now += 60
+        self.assertEqual(self.breaker.allow("m"), 0.0)  # Probeaufruf ohne Ergebnis
+        self.clock.now += 60
+        self.assertEqual(self.breaker.allow("m"), 0.0)
+
+class RetryDelayTest(FakeTimeTestCase):
+    def test_backoff_is_jittered_and_capped(self) -> None:
+        error = errors.ServerError(503, {"error": {"code": 503, "message": "überlastet", "status": "UNAVAILABLE"}})
+        delays = [model_retry_delay(error, attempt) for attempt in range(8)]
+        for attempt, delay in enumerate(delays):
+            backoff = min(workflow_engine.MODEL_RETRY_MAX_DELAY, workflow_engine.MODEL_RETRY_BASE_DELAY * 2 ** attempt)
+            self.assertTrue(backoff / 2 <= delay <= backoff, (attempt, delay))
+        workflow_engine.random.seed(7)
+        self.assertEqual([model_retry_delay(error, attempt) for attempt in range(8)], delays)  # Nur der Zufallsgenerator bestimmt den Jitter
+        self.assertEqual(len(set(delays[-2:])), 2)
+
+    def test_retry_after_hint_takes_precedence(self) -> None:
+        def rate_limited(delay: str) -> errors.ClientError:
+            return errors.ClientError(429, {"error": {"code": 429, "message": "zu viele Anfragen", "status": "RESOURCE_EXHAUSTED",
+                                                      "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": delay}]}})
+        delay = model_retry_delay(rate_limited("7s"), attempt=5)
+        self.assertTrue(7.0 <= delay <= 7.0 + workflow_engine.MODEL_RETRY_BASE_DELAY)
+        self.assertIsNone(model_retry_delay(rate_limited("120s"), attempt=0))  # Länger als MODEL_RETRY_MAX_DELAY: aufgeben
+        self.assertIsNone(model_retry_delay(errors.ClientError(400, {"error": {"code": 400, "message": "ungültig"}}), attempt=0))
+
+class ModelRetryTest(FakeTimeTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.breaker = CircuitBreaker(failure_threshold=2, cooldown_s=60.0)
+        for name, value in (("get_circuit_breaker", mock.Mock(return_value=self.breaker)), ("MODEL_MAX_RETRIES", 3), ("FALLBACK_MODEL_ID", None)):
+            patcher = mock.patch.object(workflow_engine, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.stats = new_model_call_stats()
+
+    def call(self, backend: MockModelBackend, model: str = "models/kaputt") -> Any:
+        @model_retry
+        def generate(model: str) -> Any:
+            return backend.generate_content(model=model, contents=[Content(role="user", parts=[Part(text="System Anweisung (Test - Rolle: Agent):")])], config=None)
+        return generate(model=model)
+
+    def test_gives_up_after_max_retries_with_rate_limit_hints(self) -> None:
+        backend = MockModelBackend(latency="fixed:0", rate_limit_rate=1.0, retry_delay=2.0)
+        self.breaker.failure_threshold = 10  # Nur die Wiederholungen, der Breaker bleibt geschlossen
+        with self.assertRaises(errors.ClientError):
+            self.call(backend, "models/modell")
+        self.assertEqual(backend.stats["calls"], 4)
+        self.assertEqual(len(self.clock.sleeps), 3)
+        self.assertTrue(all(2.0 <= delay <= 3.0 for delay in self.clock.sleeps), self.clock.sleeps)
+        self.assertEqual(self.stats["retries"], 3)
+        self.assertAlmostEqual(self.stats["retry_wait_s"], sum(self.clock.sleeps))
+
+    def test_recovers_after_transient_errors(self) -> None:
+        backend = MockModelBackend(latency="fixed:0", error_rate=0.5, seed=1)
+        response = self.call(backend, "models/modell")
+        self.assertIn("Mock-Antwort von Agent", response.text)
+        self.assertGreaterEqual(backend.stats["errors"], 1)
+        self.assertEqual(backend.stats["calls"], backend.stats["errors"] + 1)
+        self.assertEqual(len(self.clock.sleeps), backend.stats["errors"])
+        self.assertEqual(self.breaker.status()["models/modell"]["state"], "geschlossen")
+
+    def test_open_breaker_switches_to_fallback_model(self) -> None:
+        backend = MockModelBackend(latency="fixed:0", unavailable_models=("*kaputt*",))
+        with mock.patch.object(workflow_engine, "FALLBACK_MODEL_ID", "ersatz"):
+            self.call(backend)
+            # Zweiter Fehler öffnet den Breaker: sofortiger Wechsel ohne Wartezeit und ohne verbrauchten Versuch
+            self.assertEqual(backend.stats["calls_per_model"], {"models/kaputt": 2, "models/ersatz": 1})
+            self.assertEqual((len(self.clock.sleeps), self.clock.sleeps[-1]), (2, 0.0))
+            self.assertEqual((self.stats["fallback_calls"], self.stats["fallback_model"]), (1, "models/ersatz"))
+            self.call(backend)  # Solange der Breaker offen ist, geht jeder Aufruf direkt an das Ausweichmodell
+            self.assertEqual(backend.stats["calls_per_model"], {"models/kaputt": 2, "models/ersatz": 2})
+            self.clock.now += 60
+            self.call(backend)  # Halb offen: Der Probeaufruf scheitert, der Breaker öffnet erneut
+            self.assertEqual(backend.stats["calls_per_model"], {"models/kaputt": 3, "models/ersatz": 3})
+        self.assertEqual(self.breaker.status()["models/kaputt"]["opened_count"], 2)
+
+    def test_open_breaker_without_fallback_waits_for_the_probe(self) -> None:
+        backend = MockModelBackend(latency="fixed:0", unavailable_models=("*kaputt*",))
+        with self.assertRaises(errors.ServerError):
+            self.call(backend)
+        # Zwei Fehler öffnen den Breaker, danach wird bis zum Probeaufruf gewartet, der erneut scheitert.
+        self.assertEqual(backend.stats["calls"], 3)
+        self.assertAlmostEqual(self.clock.sleeps[-1], 60.0 - self.clock.sleeps[-2])
+
+    def test_open_breaker_without_fallback_raises(self) -> None:
+        backend = MockModelBackend(latency="fixed:0", unavailable_models=("*kaputt*",))
+        for _ in range(2):
+            self.breaker.record_failure("models/kaputt")
+        with mock.patch.object(workflow_engine, "MODEL_MAX_RETRIES", 0), self.assertRaises(ModelUnavailableError):
+            self.call(backend)
+        self.assertEqual(backend.stats["calls"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des PromptAssembler: Reihenfolge beim Kürzen (feste Segmente vor kürzbaren, kleine Segmente bleiben ganz,
+große werden anteilig gekürzt) und Einhalten des Token-Budgets.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import os
+import sys
+import unittest
+from typing import Optional
+
+from google.genai.types import Part
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from workflow_engine import IMAGE_TOKEN_ESTIMATE, MIN_TRIMMED_SEGMENT_TOKENS, PromptAssembler, estimate_text_tokens, trim_text_to_tokens  # noqa: E402
+
+SYSTEM = "S" * 400
+QUESTION = "Q" * 200
+FILE_TEXT = "Anfang der Datei. " + "a" * 7964 + " Ende der Datei."
+RESULT_TEXT = "b" * 4001
+SMALL_RESULT = "c" * 400
+
+def assembler(budget: Optional[int]) -> PromptAssembler:
+    prompt = PromptAssembler(budget)
+    prompt.add_text("Systemanweisung", SYSTEM)
+    prompt.add_text("Nutzeranfrage", QUESTION)
+    prompt.add_part("Bild", Part(text="[Bild]"), IMAGE_TOKEN_ESTIMATE)
+    prompt.add_text("Datei a.txt", FILE_TEXT, trimmable=True, header="--- START DATEI ---\n", footer="\n--- ENDE DATEI ---")
+    prompt.add_text("Ergebnis Analyst", RESULT_TEXT, trimmable=True, new_part=False)
+    prompt.add_text("Ergebnis Kurz", SMALL_RESULT, trimmable=True)
+    return prompt
+
+class PromptAssemblerTest(unittest.TestCase):
+    def test_within_budget_nothing_is_trimmed(self) -> None:
+        unlimited_parts, unlimited_report = assembler(None).build()
+        parts, report = assembler(unlimited_report["tokens_before"]).build()
+        self.assertEqual(parts, unlimited_parts)
+        self.assertEqual(report["tokens_after"], report["tokens_before"])
+        self.assertEqual([part.text for part in parts], [SYSTEM, QUESTION, "[Bild]", "--- START DATEI ---\n" + FILE_TEXT + "\n--- ENDE DATEI ---" + RESULT_TEXT, SMALL_RESULT])
+
+    def test_fixed_and_small_segments_are_kept_and_large_ones_trimmed_proportionally(self) -> None:
+        parts, report = assembler(2000).build()
+        segments = {entry["label"]: entry for entry in report["segments"]}
+        self.assertEqual([label for label, entry in segments.items() if entry["trimmed"]], ["Datei a.txt", "Ergebnis Analyst"])
+        self.assertEqual((parts[0].text, parts[1].text, parts[2].text, parts[4].text), (SYSTEM, QUESTION, "[Bild]", SMALL_RESULT))
+        # Beide großen Segmente behalten denselben Anteil ihrer ursprünglichen Größe.
+        file_share = segments["Datei a.txt"]["tokens"] / estimate_text_tokens("--- START DATEI ---\n" + FILE_TEXT + "\n--- ENDE DATEI ---")
+        result_share = segments["Ergebnis Analyst"]["tokens"] / estimate_text_tokens(RESULT_TEXT)
+        self.assertAlmostEqual(file_share, result_share, delta=0.01)
+        # Kopf und Fuß des Segments sowie Anfang und Ende des Inhalts bleiben erhalten.
+        self.assertTrue(parts[3].text.startswith("--- START DATEI ---\nAnfang der Datei. "))
+        self.assertIn(" Ende der Datei.\n--- ENDE DATEI ---", parts[3].text)
+        self.assertIn("Tokens gekürzt ...]", parts[3].text)
+
+    def test_trimmed_prompt_hits_the_budget(self) -> None:
+        tokens_before = assembler(None).build()[1]["tokens_before"]
+        for budget in (1200, 1500, 2345, 3000, tokens_before - 1):
+            parts, report = assembler(budget).build()
+            self.assertLessEqual(report["tokens_after"], budget, budget)
+            self.assertGreaterEqual(report["tokens_after"], budget - 2, budget)
+            estimated = sum(estimate_text_tokens(part.text) for part in parts) - estimate_text_tokens("[Bild]") + IMAGE_TOKEN_ESTIMATE
+            self.assertLessEqual(estimated, budget, budget)
+
+    def test_trimmed_segments_keep_a_minimum_size(self) -> None:
+        report = assembler(300).build()[1]
+        trimmed = [entry["tokens"] for entry in report["segments"] if entry["trimmed"]]
+        self.assertEqual(len(trimmed), 2)
+        for tokens in trimmed:
+            self.assertGreaterEqual(tokens, MIN_TRIMMED_SEGMENT_TOKENS - 1)
+        self.assertGreater(report["tokens_after"], 300)  # Das Budget ist kleiner als feste Segmente plus Mindestgrößen
+
+    def test_calibrated_scale_is_respected(self) -> None:
+        prompt = assembler(2000)
+        prompt.calibrate(2 * prompt.estimated_tokens())  # Die exakte Zählung ergibt doppelt so viele Tokens
+        report = prompt.build()[1]
+        self.assertLessEqual(report["tokens_after"], 2000)
+        self.assertGreaterEqual(report["tokens_after"], 1990)
+
+    def test_trim_text_includes_the_marker_in_the_budget(self) -> None:
+        text = "Kopf " + "x" * 4000 + " Fuß"
+        for max_tokens in (20, 100, 999):
+            trimmed = trim_text_to_tokens(text, max_tokens)
+            self.assertLessEqual(estimate_text_tokens(trimmed), max_tokens)
+            self.assertTrue(trimmed.startswith("Kopf ") and trimmed.endswith(" Fuß"))
+        self.assertEqual(trim_text_to_tokens(text, estimate_text_tokens(text)), text)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des Rate-Limiters (TokenBucketLimiter) mit simulierter Uhr: Abstand der Anfragen unter dem RPM-Limit,
+Warten am TPM-Limit, Änderung der Limits zur Laufzeit und ein über SQLite geteilter Zustand.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from typing import List
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_engine  # noqa: E402
+from workflow_engine import TokenBucketLimiter  # noqa: E402
+
+class FakeClockTestCase(unittest.TestCase):
+    """Ersetzt time.time und time.sleep durch eine simulierte Uhr, die beim Schlafen vorrückt."""
+    def setUp(self) -> None:
+        self.clock = [1000.0]
+        self.sent_at: List[float] = []
+        for name, replacement in (("time", lambda: self.clock[0]), ("sleep", self.sleep)):
+            patcher = mock.patch.object(workflow_engine.time, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sleep(self, seconds: float) -> None:
+        self.clock[0] += seconds
+
+    def send(self, limiter: TokenBucketLimiter, tokens: int = 0) -> float:
+        wait_time = limiter.acquire(tokens)
+        self.sent_at.append(self.clock[0])
+        return wait_time
+
+class RequestRateTest(FakeClockTestCase):
+    def test_requests_are_spaced_by_sixty_over_rpm(self) -> None:
+        limiter = TokenBucketLimiter(rpm=60)
+        waits = [self.send(limiter) for _ in range(4)]
+        self.assertEqual(waits, [0.0, 1.0, 1.0, 1.0])
+        self.assertEqual(self.sent_at, [1000.0, 1001.0, 1002.0, 1003.0])
+        self.assertEqual(limiter.metrics()["waited_calls"], 3)
+
+    def test_never_more_than_rpm_requests_per_minute(self) -> None:
+        limiter = TokenBucketLimiter(rpm=10)
+        for _ in range(25):
+            self.send(limiter)
+        for index, sent_at in enumerate(self.sent_at):
+            self.assertLessEqual(sum(1 for other in self.sent_at[index:] if other < sent_at + 60.0), 10)
+
+    def test_idle_time_is_not_saved_up(self) -> None:
+        limiter = TokenBucketLimiter(rpm=60)
+        self.send(limiter)
+        self.clock[0] += 30
+        self.assertEqual([limiter.reserve(), limiter.reserve()], [0.0, 1.0])
+
+class TokenRateTest(FakeClockTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        # 10 Tokens pro Sekunde, bis zu 600 Tokens angespart; das RPM-Limit spielt praktisch keine Rolle.
+        self.limiter = TokenBucketLimiter(rpm=10**6, tpm=600)
+
+    def test_blocks_once_the_token_bucket_is_empty(self) -> None:
+        self.assertAlmostEqual(self.send(self.limiter, 300), 0.0, places=3)
+        self.assertAlmostEqual(self.send(self.limiter, 300), 0.0, places=3)
+        self.assertAlmostEqual(self.send(self.limiter, 300), 30.0, places=3)
+        self.assertAlmostEqual(self.sent_at[-1] - self.sent_at[0], 30.0, places=3)
+
+    def test_actual_usage_corrects_the_estimate(self) -> None:
+        self.limiter.reserve(600)
+        self.limiter.record_usage(600, 300)  # Nur die Hälfte verbraucht: 30 Sekunden Budget zurück
+        self.assertAlmostEqual(self.limiter.reserve(300), 0.0, places=3)
+        self.assertAlmostEqual(self.limiter.reserve(100), 10.0, places=3)
+
+class ConfigureTest(FakeClockTestCase):
+    def test_new_limits_apply_to_the_next_reservation(self) -> None:
+        limiter = TokenBucketLimiter(rpm=60)
+        self.assertEqual([limiter.reserve(), limiter.reserve()], [0.0, 1.0])
+        self.clock[0] += 60
+        limiter.configure(rpm=6)
+        self.assertEqual([limiter.reserve(), limiter.reserve()], [0.0, 10.0])
+        limiter.configure(rpm=10**6, tpm=60)
+        self.clock[0] += 60
+        self.assertAlmostEqual(limiter.reserve(120), 60.0, places=3)
+        limiter.configure(rpm=10**6, tpm=0)  # tpm <= 0 schaltet das Token-Budget ab
+        self.clock[0] += 60
+        self.assertAlmostEqual(limiter.reserve(10**6), 0.0, places=3)
+
+class SharedStateTest(FakeClockTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "limiter.sqlite")
+
+    def test_two_limiters_share_one_budget(self) -> None:
+        first = TokenBucketLimiter(rpm=60, state_path=self.path)
+        second = TokenBucketLimiter(rpm=60, state_path=self.path)
+        self.assertEqual([first.reserve(), second.reserve(), first.reserve(), second.reserve()], [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual((first.metrics()["calls"], second.metrics()["calls"]), (2, 2))
+        self.assertEqual(first.metrics()["backlog_s"], 3.0)
+
+    def test_configure_reaches_the_other_limiter(self) -> None:
+        first = TokenBucketLimiter(rpm=60, state_path=self.path)
+        second = TokenBucketLimiter(rpm=60, state_path=self.path)
+        second.configure(rpm=6, tpm=0)
+        self.assertEqual([first.reserve(), first.reserve()], [0.0, 10.0])
+        self.assertEqual(first.rpm, 6)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des Antwort-Caches (ResponseCache, response_cache-Decorator) und der Cache-Regel pro Agent.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from typing import List, Tuple
+from unittest import mock
+
+from google.genai.types import Candidate, Content, GenerateContentConfig, GenerateContentResponse, Part
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_engine  # noqa: E402
+from workflow_engine import ModelBackend, TokenBucketLimiter, agent_uses_response_cache, limited_generate_content_stream_async  # noqa: E402
+from workflow_storage import ResponseCache, _to_json_data  # noqa: E402
+
+def text_response(text: str) -> GenerateContentResponse:
+    return GenerateContentResponse(candidates=[Candidate(content=Content(role="model", parts=[Part(text=text)]))])
+
+class StreamingBackend(ModelBackend):
+    """Cachebares Backend, das 'Hallo Welt' in zwei Chunks streamt und die Aufrufe zählt."""
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_stream_async(self, model, contents, config):
+        self.calls += 1
+        for text in ("Hallo ", "Welt"):
+            yield text_response(text)
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "responses.sqlite")
+        self.clock = [1000.0]
+        clock_patch = mock.patch.object(workflow_engine.time, "time", lambda: self.clock[0])
+        clock_patch.start()
+        self.addCleanup(clock_patch.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_key_is_stable_and_covers_model_contents_and_config(self) -> None:
+        key = ResponseCache.make_key("models/a", [Part(text="Frage")], GenerateContentConfig(temperature=0.0))
+        self.assertEqual(key, ResponseCache.make_key("models/a", [Part(text="Frage")], GenerateContentConfig(temperature=0.0)))
+        variants = [
+            ResponseCache.make_key("models/b", [Part(text="Frage")], GenerateContentConfig(temperature=0.0)),
+            ResponseCache.make_key("models/a", [Part(text="Frage?")], GenerateContentConfig(temperature=0.0)),
+            ResponseCache.make_key("models/a", [Part(text="Frage")], GenerateContentConfig(temperature=0.2)),
+            ResponseCache.make_key("models/a", [Part(text="Frage")], None),
+        ]
+        self.assertNotIn(key, variants)
+        self.assertEqual(len(set(variants)), len(variants))
+
+    def test_entries_expire_after_ttl(self) -> None:
+        cache = ResponseCache(self.path, ttl_seconds=60, max_bytes=10**6)
+        cache.put("k", text_response("alt"))
+        self.clock[0] += 60
+        self.assertEqual(cache.get("k").text, "alt")
+        self.clock[0] += 1
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual((cache.stats()["entries"], cache.hits, cache.misses), (0, 1, 1))
+
+    def test_least_recently_used_entries_are_evicted(self) -> None:
+        entry_size = len(json.dumps(_to_json_data(text_response("x" * 100)), ensure_ascii=False))
+        cache = ResponseCache(self.path, ttl_seconds=3600, max_bytes=3 * entry_size)
+        for key in ("a", "b", "c"):
+            self.clock[0] += 1
+            cache.put(key, text_response("x" * 100))
+        self.clock[0] += 1
+        cache.get("a")  # "a" ist jetzt zuletzt genutzt, "b" der älteste Eintrag
+        self.clock[0] += 1
+        cache.put("d", text_response("x" * 100))
+        self.assertEqual([key for key in "abcd" if cache.get(key) is not None], ["a", "c", "d"])
+        self.assertLessEqual(cache.stats()["size_bytes"], 3 * entry_size)
+
+    def test_cache_hit_replays_text_to_on_chunk(self) -> None:
+        backend = StreamingBackend()
+        cache = ResponseCache(self.path, ttl_seconds=3600, max_bytes=10**6)
+        chunks: List[Tuple[str, float, List[str]]] = []
+
+        async def ask() -> GenerateContentResponse:
+            return await limited_generate_content_stream_async(client=backend, model="models/test", contents=[Part(text="Frage")],
+                                                               config=GenerateContentConfig(temperature=0.0), on_chunk=lambda *args: chunks.append(args))
+
+        # Eigener Limiter: Der geteilte hat Ankunftszeiten der echten Uhr, die simulierte Uhr steht bei 1000 s.
+        with mock.patch.object(workflow_engine, "get_response_cache", return_value=cache), mock.patch.object(workflow_engine, "get_rate_limiter", return_value=TokenBucketLimiter(100000)):
+            first = asyncio.run(ask())
+            streamed_chunks = len(chunks)
+            second = asyncio.run(ask())
+        self.assertEqual((backend.calls, first.text, second.text), (1, "Hallo Welt", "Hallo Welt"))
+        self.assertEqual(streamed_chunks, 2)
+        self.assertEqual(chunks[streamed_chunks:], [("Hallo Welt", 0.0, [])])
+
+class AgentCacheRuleTest(unittest.TestCase):
+    def test_sampled_agents_are_not_cached_unless_they_opt_in(self) -> None:
+        self.assertFalse(agent_uses_response_cache({"temperature": 0.4}))
+        self.assertTrue(agent_uses_response_cache({"temperature": 0.4, "cache_responses": True}))
+
+    def test_deterministic_agents_are_cached_unless_they_opt_out(self) -> None:
+        self.assertTrue(agent_uses_response_cache({}))
+        self.assertTrue(agent_uses_response_cache({"temperature": 0}))
+        self.assertTrue(agent_uses_response_cache({"temperature": "ungültig"}))
+        self.assertFalse(agent_uses_response_cache({"temperature": 0, "cache_responses": False}))
+
+if __name__ == "__main__":
+    unittest.main()
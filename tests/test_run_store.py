@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tests der Laufhistorie (RunStore) und der Fortsetzung abgebrochener Läufe (prepare_resume) mit einer temporären
+SQLite-Datei und dem Offline-MockModelBackend.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import closing
+from typing import Any, Dict, List
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_engine  # noqa: E402
+from workflow_context import RunState, WorkflowCallbacks  # noqa: E402
+from workflow_engine import CircuitBreaker, WorkflowPlan, get_rate_limiter, prepare_resume, run_workflow_async, validate_config_list  # noqa: E402
+from workflow_storage import RunStore  # noqa: E402
+from mock_model_backend import MockModelBackend  # noqa: E402
+
+AGENTS = [
+    {"name": "Sammler", "round": 1, "system_instruction": "Sammle Fakten."},
+    {"name": "Analyst", "round": 2, "system_instruction": "Analysiere.", "receives_messages_from": ["Sammler"], "model": "kaputt-modell"},
+    {"name": "Autor", "round": 3, "system_instruction": "Schreibe.", "receives_messages_from": ["Analyst"]},
+    {"name": "Lektor", "round": 2, "system_instruction": "Prüfe.", "receives_messages_from": ["Sammler"]},
+]
+
+class CountingBackend(MockModelBackend):
+    """MockModelBackend, das die Modellaufrufe pro Agent zählt."""
+    def __init__(self, **options: Any):
+        super().__init__(latency="fixed:0", file_blocks=False, **options)
+        self.agents_called: List[str] = []
+
+    async def generate_content_async(self, model, contents, config):
+        self.agents_called.append(self._request_identity(contents)[0])
+        return await super().generate_content_async(model, contents, config)
+
+class RunStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        get_rate_limiter().configure(100000, 0)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "historie", "runs.sqlite")
+        self.store = RunStore(self.path)
+        for name, value in (("get_run_store", mock.Mock(return_value=self.store)), ("get_circuit_breaker", mock.Mock(return_value=CircuitBreaker(5, 60.0))), ("MODEL_MAX_RETRIES", 0)):
+            patcher = mock.patch.object(workflow_engine, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def execute(self, state: RunState, backend: CountingBackend, agents: List[Dict[str, Any]]) -> bool:
+        plan = WorkflowPlan("Test", validate_config_list(agents, "Test"), [])
+        return asyncio.run(run_workflow_async(backend, workflow_engine.DEFAULT_MODEL_ID, plan, "Aufgabe", state, WorkflowCallbacks(), 2))
+
+    def agent_events(self, run_id: str) -> List[str]:
+        with closing(sqlite3.connect(self.path)) as conn:
+            return [agent for (agent,) in conn.execute("SELECT agent FROM run_events WHERE run_id = ? AND kind = 'agent' ORDER BY seq", (run_id,))]
+
+    def failed_run(self) -> Dict[str, Any]:
+        """Erster Lauf, in dem das Modell des Analysten gestört ist: Analyst scheitert, Autor wird übersprungen."""
+        state = RunState(use_response_cache=False)
+        self.assertFalse(self.execute(state, CountingBackend(unavailable_models=("*kaputt*",)), AGENTS))
+        return self.store.load_run(state.run_id)
+
+    def test_partial_failure_is_recorded(self) -> None:
+        stored_run = self.failed_run()
+        statuses = {result["agent"]: result["status"] for result in stored_run["results"]}
+        self.assertEqual(statuses, {"Sammler": "Erfolgreich", "Lektor": "Erfolgreich", "Analyst": "Fehlgeschlagen", "Autor": "Übersprungen"})
+        self.assertEqual((stored_run["status"], stored_run["question"], stored_run["agents"]), ("Fehlgeschlagen", "Aufgabe", validate_config_list(AGENTS, "Test")))
+        self.assertEqual(set(stored_run["fingerprints"]), set(statuses))
+        self.assertEqual([(entry["run_id"], entry["status"], entry["agents_done"], entry["agents_total"]) for entry in self.store.list_runs()],
+                         [(stored_run["run_id"], "Fehlgeschlagen", 2, 4)])
+
+    def test_resume_skips_completed_agents(self) -> None:
+        stored_run = self.failed_run()
+        # Neue Sitzung ohne Gedächtnis und ohne inkrementelle Ausführung: Nur die Checkpoints erlauben das Überspringen.
+        state = RunState(use_response_cache=False, incremental_execution=False)
+        prepare_resume(state, stored_run)
+        backend = CountingBackend()  # Die Störung ist vorbei
+        self.assertTrue(self.execute(state, backend, stored_run["agents"]))
+        self.assertEqual(sorted(backend.agents_called), ["Analyst", "Autor"])
+        resumed_run = self.store.load_run(stored_run["run_id"])
+        self.assertEqual(resumed_run["status"], "Erfolgreich")
+        self.assertEqual({result["agent"]: result["status"] for result in resumed_run["results"]}, dict.fromkeys(["Sammler", "Lektor", "Analyst", "Autor"], "Erfolgreich"))
+        outputs = {result["agent"]: result["output"] for result in stored_run["results"]}
+        self.assertEqual(state.message_store["Sammler"], outputs["Sammler"])
+        # Übernommene Checkpoints werden nicht erneut angehängt, die neu gelaufenen Agenten schon.
+        self.assertEqual(sorted(self.agent_events(stored_run["run_id"])), ["Analyst", "Analyst", "Autor", "Autor", "Lektor", "Sammler"])
+        self.assertEqual(len(self.store.list_runs()), 1)
+
+    def test_run_without_final_status_is_incomplete(self) -> None:
+        plan = WorkflowPlan("Test", validate_config_list(AGENTS, "Test"), [])
+        run_id = self.store.start_run(plan, "Aufgabe", "modell", [("a.txt", "abc")])
+        self.store.record_agent(run_id, {"agent": "Sammler", "status": "Erfolgreich", "output": "Fakten"}, "fp-1")
+        reopened = RunStore(self.path).load_run(run_id)
+        self.assertEqual((reopened["status"], reopened["files"], reopened["fingerprints"]), ("Unvollständig", [("a.txt", "abc")], {"Sammler": "fp-1"}))
+        self.assertEqual(self.store.list_runs()[0]["status"], "Unvollständig")
+        self.assertIsNone(self.store.load_run("unbekannt"))
+
+if __name__ == "__main__":
+    unittest.main()
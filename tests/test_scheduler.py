@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des Abhängigkeitsgraphen (build_dependency_graph) und des parallelen Schedulers (run_agents_dag), ausgeführt
+mit dem Offline-MockModelBackend.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+from typing import Any, Dict, List, Tuple
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_engine  # noqa: E402
+from workflow_context import RunState, WorkflowCallbacks  # noqa: E402
+from workflow_engine import CircuitBreaker, WorkflowPlan, build_dependency_graph, get_rate_limiter, run_workflow_async, validate_config_list  # noqa: E402
+from mock_model_backend import MockModelBackend  # noqa: E402
+
+def agent(name: str, *sources: str, **options: Any) -> Dict[str, Any]:
+    return {"name": name, "round": 1, "system_instruction": f"Du bist {name}.", "receives_messages_from": list(sources), **options}
+
+class RecordingBackend(MockModelBackend):
+    """MockModelBackend, das Beginn und Ende jedes Modellaufrufs pro Agent protokolliert."""
+    def __init__(self, **options: Any):
+        super().__init__(latency="fixed:0.02", file_blocks=False, unavailable_models=("*kaputt*",), **options)
+        self.events: List[Tuple[str, str]] = []
+
+    async def generate_content_async(self, model, contents, config):
+        agent_name = self._request_identity(contents)[0]
+        self.events.append(("start", agent_name))
+        try:
+            return await super().generate_content_async(model, contents, config)
+        finally:
+            self.events.append(("end", agent_name))
+
+    def max_concurrency(self) -> int:
+        running = peak = 0
+        for kind, _ in self.events:
+            running += 1 if kind == "start" else -1
+            peak = max(peak, running)
+        return peak
+
+class DependencyGraphTest(unittest.TestCase):
+    def test_sources_become_dependencies(self) -> None:
+        dependencies, error = build_dependency_graph([agent("A"), agent("B", "A"), agent("C", "A", "B", "A")])
+        self.assertIsNone(error)
+        self.assertEqual(dependencies, {"A": [], "B": ["A"], "C": ["A", "B"]})
+
+    def test_cycle_is_reported(self) -> None:
+        dependencies, error = build_dependency_graph([agent("Start"), agent("A", "Start", "C"), agent("B", "A"), agent("C", "B")])
+        self.assertIsNone(dependencies)
+        self.assertIn("Zyklische Abhängigkeit", error)
+        self.assertEqual(error.split(": ")[1].rstrip(".").split(", "), ["A", "B", "C"])
+
+    def test_unknown_source_and_duplicate_name_are_reported(self) -> None:
+        self.assertIn("unbekannten Agenten: X", build_dependency_graph([agent("A", "X")])[1])
+        self.assertIn("mehrfach vergeben", build_dependency_graph([agent("A"), agent("A")])[1])
+
+class RunAgentsDagTest(unittest.TestCase):
+    def setUp(self) -> None:
+        get_rate_limiter().configure(100000, 0)
+        # Eigener Circuit Breaker, damit das gestörte Modell keine anderen Tests beeinflusst
+        breaker_patch = mock.patch.object(workflow_engine, "get_circuit_breaker", return_value=CircuitBreaker(5, 60.0))
+        breaker_patch.start()
+        self.addCleanup(breaker_patch.stop)
+
+    def run_plan(self, configs: List[Dict[str, Any]], max_parallel: int) -> Tuple[bool, RecordingBackend, Dict[str, str]]:
+        backend = RecordingBackend()
+        plan = WorkflowPlan("Test", validate_config_list(configs, "Test"), [])
+        state = RunState(use_response_cache=False, incremental_execution=False, record_run=False)
+        success = asyncio.run(run_workflow_async(backend, workflow_engine.DEFAULT_MODEL_ID, plan, "Aufgabe", state, WorkflowCallbacks(), max_parallel))
+        return success, backend, {result["agent"]: result["status"] for result in state.agent_results_display}
+
+    def test_cyclic_plan_is_rejected_before_any_model_call(self) -> None:
+        with self.assertRaisesRegex(ValueError, "Zyklische Abhängigkeit"):
+            self.run_plan([agent("A", "B"), agent("B", "A")], 2)
+
+    def test_dependent_agent_starts_after_its_sources_finish(self) -> None:
+        success, backend, statuses = self.run_plan([agent("A"), agent("B"), agent("C", "A", "B"), agent("D", "C"), agent("E")], 4)
+        self.assertTrue(success)
+        self.assertEqual(set(statuses.values()), {"Erfolgreich"})
+        position = {event: index for index, event in enumerate(backend.events)}
+        self.assertLess(position[("end", "A")], position[("start", "C")])
+        self.assertLess(position[("end", "B")], position[("start", "C")])
+        self.assertLess(position[("end", "C")], position[("start", "D")])
+        # Unabhängige Agenten warten nicht auf die Kette A/B -> C -> D.
+        self.assertLess(position[("start", "E")], position[("end", "A")])
+
+    def test_max_parallel_agents_cap_holds(self) -> None:
+        configs = [agent(f"Agent{index}") for index in range(6)]
+        self.assertEqual(self.run_plan(configs, 2)[1].max_concurrency(), 2)
+        self.assertEqual(self.run_plan(configs, 6)[1].max_concurrency(), 6)
+
+    def test_failed_source_stops_its_dependents(self) -> None:
+        with mock.patch.object(workflow_engine, "MODEL_MAX_RETRIES", 0):
+            success, backend, statuses = self.run_plan([agent("A", model="kaputt-modell"), agent("B"), agent("C", "A", "B"), agent("D", "C"), agent("E", "B")], 4)
+        self.assertFalse(success)
+        self.assertEqual(statuses, {"A": "Fehlgeschlagen", "B": "Erfolgreich", "C": "Übersprungen", "D": "Übersprungen", "E": "Erfolgreich"})
+        self.assertNotIn(("start", "C"), backend.events)
+        self.assertNotIn(("start", "D"), backend.events)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des Tool-Loops: Kompaktierung und Wiederverwendung (ToolLoopCompactor) sowie Token-Budget und Turn-Grenze,
+ausgeführt mit dem Offline-MockModelBackend.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+from typing import Any, Dict, List
+from unittest import mock
+
+from google.genai.types import Content, FunctionCall, FunctionResponse, Part
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import workflow_engine  # noqa: E402
+from workflow_context import RunState, WorkflowCallbacks  # noqa: E402
+from workflow_engine import ToolLoopCompactor, WorkflowPlan, get_rate_limiter, run_workflow_async, validate_config_list  # noqa: E402
+from mock_model_backend import MockModelBackend  # noqa: E402
+
+LONG_RESULT = " ".join(f"Satz {index} über Wetterdaten und anderes." for index in range(200))
+
+def tool_turn(call_id: str, name: str, args: Dict[str, Any]) -> Content:
+    return Content(role="model", parts=[Part(function_call=FunctionCall(id=call_id, name=name, args=args))])
+
+def tool_result(call_id: str, name: str, content: str) -> Content:
+    return Content(role="user", parts=[Part(function_response=FunctionResponse(id=call_id, name=name, response={"content": content}))])
+
+class ToolLoopCompactorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.compactor = ToolLoopCompactor("Wetterdaten", summary_chars=200)
+        self.call = FunctionCall(id="1", name="fetch_url_content", args={"url": "https://example.org"})
+        self.history = [Content(role="user", parts=[Part(text="Frage")]), tool_turn("1", self.call.name, dict(self.call.args)), tool_result("1", self.call.name, LONG_RESULT)]
+        self.compactor.remember([self.call], self.history[2].parts, history_index=2)
+
+    def test_unread_result_is_kept_and_read_result_is_summarized(self) -> None:
+        self.assertEqual(self.compactor.compact(self.history), 0)  # Das Modell hat das Ergebnis noch nicht gesehen
+        self.history.append(Content(role="model", parts=[Part(text="Gelesen")]))
+        saved_tokens = self.compactor.compact(self.history)
+        summary = self.history[2].parts[0].function_response.response["content"]
+        self.assertGreater(saved_tokens, 0)
+        summary_text, _, note = summary.partition("\n")
+        self.assertLessEqual(len(summary_text), 200)
+        self.assertTrue(note.startswith("[Extraktiv gekürzt"))
+        self.assertEqual(self.compactor.compact(self.history), 0)  # Jedes Ergebnis wird nur einmal zusammengefasst
+        self.assertEqual(self.compactor.saved_tokens, saved_tokens)
+
+    def test_repeated_call_reuses_full_result_and_references_the_old_one(self) -> None:
+        reused_part = self.compactor.reuse(FunctionCall(id="2", name=self.call.name, args={"url": "https://example.org"}), self.history)
+        self.assertEqual(reused_part.function_response.response["content"], LONG_RESULT)
+        self.assertIn("siehe erneuten Aufruf", self.history[2].parts[0].function_response.response["content"])
+        self.assertIsNone(self.compactor.reuse(FunctionCall(id="3", name=self.call.name, args={"url": "https://example.com"}), self.history))
+        self.assertEqual(self.compactor.reused_calls, 1)
+
+    def test_failed_calls_are_not_remembered(self) -> None:
+        failed_call = FunctionCall(id="4", name="calculator", args={"expression": "1/0"})
+        self.compactor.remember([failed_call], [Part(function_response=FunctionResponse(id="4", name="calculator", response={"error": "Division durch 0"}))], history_index=3)
+        self.assertIsNone(self.compactor.reuse(failed_call, self.history))
+
+class ToolLoopBudgetTest(unittest.TestCase):
+    def setUp(self) -> None:
+        get_rate_limiter().configure(100000, 0)
+
+    def run_agent(self, **agent_options: Any) -> Dict[str, Any]:
+        """Ein Agent, dessen Mock-Modell in jedem Turn den Rechner aufruft, bis der Tool-Loop begrenzt wird."""
+        agents = validate_config_list([{"name": "Rechner", "round": 1, "system_instruction": "Rechne.", "callable_tools": ["calculator"], **agent_options}], "Test")
+        backend = MockModelBackend(latency="fixed:0", tool_script={"Rechner": [[{"name": "calculator", "args": {"expression": f"{turn} * 2"}}] for turn in range(50)]}, file_blocks=False)
+        state = RunState(use_response_cache=False, incremental_execution=False, record_run=False)
+        asyncio.run(run_workflow_async(backend, workflow_engine.DEFAULT_MODEL_ID, WorkflowPlan("Test", agents, []), "Aufgabe", state, WorkflowCallbacks(), 1))
+        return state.agent_results_display[-1]
+
+    def test_turn_cap_ends_the_loop(self) -> None:
+        with mock.patch.object(workflow_engine, "MAX_TOOL_TURNS", 4):
+            result = self.run_agent(tool_token_budget=10**6)
+        self.assertEqual((result["status"], len(result["turn_prompt_tokens"]), result["tool_budget_reached"]), ("Erfolgreich", 5, True))
+
+    def test_budget_applies_to_each_turn_not_to_the_sum(self) -> None:
+        with mock.patch.object(workflow_engine, "MAX_TOOL_TURNS", 6):
+            unlimited: List[int] = self.run_agent(tool_token_budget=10**6)["turn_prompt_tokens"]
+            # Das Budget liegt über jedem einzelnen Prompt, aber weit unter ihrer Summe: Erst die Turn-Grenze beendet den Loop.
+            per_turn = self.run_agent(tool_token_budget=max(unlimited) + 1)
+            # Ist schon der zweite Prompt größer als das Budget, antwortet das Modell dort ohne Tools.
+            exceeded = self.run_agent(tool_token_budget=unlimited[1] - 1)
+        self.assertLess(max(unlimited) + 1, sum(unlimited))
+        self.assertEqual(per_turn["turn_prompt_tokens"], unlimited)
+        self.assertEqual((len(exceeded["turn_prompt_tokens"]), exceeded["tool_budget_reached"], exceeded["status"]), (2, True, "Erfolgreich"))
+
+if __name__ == "__main__":
+    unittest.main()
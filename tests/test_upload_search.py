@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Tests der BM25-Suche über hochgeladene Dateien (UploadSearchIndex, search_uploaded_files, retrieve_file_excerpt)
+auf einem kleinen festen Korpus.
+
+Aufruf (aus dem Projektverzeichnis):
+    python -m pytest tests
+"""
+import math
+import os
+import sys
+import unittest
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from workflow_context import RunState, run_context  # noqa: E402
+from workflow_tools import (BM25_B, BM25_K1, SEARCH_CHUNK_CHARS, UploadSearchIndex, build_upload_entry, retrieve_file_excerpt,  # noqa: E402
+                            search_uploaded_files, tokenize_for_search)
+
+LINE_CHARS = 40
+SECTION_LINES = SEARCH_CHUNK_CHARS // LINE_CHARS  # Jeder Abschnitt des Handbuchs füllt genau einen Index-Abschnitt
+
+def section(*key_lines: str) -> str:
+    lines = list(key_lines) + ["Allgemeiner Fülltext ohne Bezug"] * (SECTION_LINES - len(key_lines))
+    return "".join(f"{line:<{LINE_CHARS - 1}}\n" for line in lines)
+
+HANDBOOK_SECTIONS = [
+    section("Installation des Pakets"),
+    section("Der Circuit Breaker öffnet", "Circuit Breaker schließt wieder"),
+    section("Rate Limiter verteilt Anfragen"),
+    section("Auch hier ein Circuit Breaker"),
+]
+HANDBOOK = "".join(HANDBOOK_SECTIONS)
+NOTES = "Circuit Breaker Notiz\nkurz\n"
+
+def reference_bm25(index: UploadSearchIndex, texts: List[str], query: str) -> Dict[int, float]:
+    """Unvektorisierte BM25-Formel als Vergleich für UploadSearchIndex.search."""
+    chunk_tokens = [tokenize_for_search(texts[file_index][start:end]) for file_index, start, end, _ in index.chunks]
+    average_length = sum(map(len, chunk_tokens)) / len(chunk_tokens)
+    scores = {}
+    for chunk_id, tokens in enumerate(chunk_tokens):
+        score = 0.0
+        for term in set(tokenize_for_search(query)):
+            document_count = sum(1 for other in chunk_tokens if term in other)
+            count = tokens.count(term)
+            if count:
+                idf = math.log(1 + (len(chunk_tokens) - document_count + 0.5) / (document_count + 0.5))
+                score += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / average_length))
+        if score > 0:
+            scores[chunk_id] = score
+    return scores
+
+class UploadSearchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.handbook = build_upload_entry("handbuch.txt", "text/plain", HANDBOOK.encode("utf-8"))
+        self.notes = build_upload_entry("notizen.txt", "text/plain", NOTES.encode("utf-8"))
+        self.state = RunState(uploaded_files_data=[self.handbook, self.notes])
+        self.index = UploadSearchIndex(self.state.uploaded_files_data)
+
+    def test_sections_become_chunks(self) -> None:
+        self.assertEqual(self.index.chunks, [(0, index * SEARCH_CHUNK_CHARS, (index + 1) * SEARCH_CHUNK_CHARS, index * SECTION_LINES + 1) for index in range(4)] + [(1, 0, len(NOTES), 1)])
+
+    def test_ranking_follows_bm25(self) -> None:
+        hits = self.index.search("Circuit Breaker")
+        expected = reference_bm25(self.index, [HANDBOOK, NOTES], "Circuit Breaker")
+        self.assertEqual([chunk_id for _, chunk_id in hits], sorted(expected, key=lambda chunk_id: -expected[chunk_id]))
+        for score, chunk_id in hits:
+            self.assertAlmostEqual(score, expected[chunk_id], places=4)
+        # Kurze Notiz vor dem Abschnitt mit zwei Treffern vor dem gleich langen Abschnitt mit einem Treffer
+        self.assertEqual([chunk_id for _, chunk_id in hits], [4, 1, 3])
+
+    def test_top_k_and_filename_filter(self) -> None:
+        self.assertEqual([chunk_id for _, chunk_id in self.index.search("Circuit Breaker", top_k=2)], [4, 1])
+        self.assertEqual([chunk_id for _, chunk_id in self.index.search("Circuit Breaker", filename="handbuch.txt")], [1, 3])
+        self.assertEqual(self.index.search("Quantencomputer"), [])
+
+    def test_search_tool_reports_files_lines_and_text(self) -> None:
+        with run_context(self.state):
+            result = search_uploaded_files("Rate Limiter", top_k=3)
+        self.assertTrue(result.startswith("Top 1 Abschnitte für 'Rate Limiter':"))
+        self.assertIn(f"--- 1. `handbuch.txt` ab Zeile {2 * SECTION_LINES + 1} (Score ", result)
+        self.assertTrue(result.endswith(HANDBOOK_SECTIONS[2].strip()))
+        with run_context(RunState()):
+            self.assertEqual(search_uploaded_files("Rate Limiter"), "Keine Dateien wurden hochgeladen.")
+
+    def test_excerpt_is_head_plus_matching_sections_in_file_order(self) -> None:
+        max_chars = 4 * SEARCH_CHUNK_CHARS
+        with run_context(self.state):
+            excerpt = retrieve_file_excerpt(self.handbook, "Circuit Breaker Rate Limiter", max_chars)
+        head = HANDBOOK[:SEARCH_CHUNK_CHARS]
+        expected = head + "".join(f"\n[... Abschnitt ab Zeile {index * SECTION_LINES + 1} ...]\n{HANDBOOK_SECTIONS[index]}" for index in (1, 2, 3))
+        self.assertEqual(excerpt, expected)
+
+    def test_excerpt_stops_before_exceeding_max_chars(self) -> None:
+        max_chars = 2 * SEARCH_CHUNK_CHARS  # Dateianfang (max_chars // 4) und genau ein ganzer Abschnitt passen
+        with run_context(self.state):
+            excerpt = retrieve_file_excerpt(self.handbook, "Circuit Breaker", max_chars)
+            self.assertIsNone(retrieve_file_excerpt(self.handbook, "Circuit Breaker", SEARCH_CHUNK_CHARS))
+            self.assertIsNone(retrieve_file_excerpt(self.handbook, "Quantencomputer", max_chars))
+        self.assertEqual(excerpt, HANDBOOK[:max_chars // 4] + f"\n[... Abschnitt ab Zeile {SECTION_LINES + 1} ...]\n{HANDBOOK_SECTIONS[1]}")
+
+if __name__ == "__main__":
+    unittest.main()
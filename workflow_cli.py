@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Kommandozeilen-Runner für Workflows ohne Streamlit-Oberfläche.
+
+Führt eine Workflow-Konfiguration für viele Aufgaben aus einer JSONL-Datei aus. Bis zu '--concurrency' Aufgaben laufen
+gleichzeitig in einer Event-Loop und teilen sich den prozessweiten Rate-Limiter (RPM/TPM); innerhalb einer Aufgabe
+laufen unabhängige Agenten wie in der Oberfläche parallel ('--max-parallel-agents').
+
+Aufruf (aus dem Projektverzeichnis):
+    python workflow_cli.py --config agents_config_java.json --questions aufgaben.jsonl --concurrency 4 \\
+        --output ergebnisse.jsonl --zip ergebnisse.zip
+
+Mit '--mock-latency' (z.B. lognormal:0.4,0.5) antwortet statt der API das Offline-Mock-Backend (mock_model_backend.py).
+
+Aufgaben-Datei: eine Aufgabe pro Zeile, entweder als JSON-String oder als Objekt
+    {"id": "aufgabe-1", "question": "...", "files": ["pfad/zur/datei.py"]}
+'id' und 'files' sind optional; Dateien aus '--files' erhält jede Aufgabe zusätzlich.
+Pro Aufgabe wird eine JSONL-Zeile geschrieben, sobald sie abgeschlossen ist. Mit '--zip' landen die extrahierten
+## FILE:-Dateien jeder Aufgabe im Unterordner '<id>/' des Archivs. Jede Zeile enthält eine Zusammenfassung der
+Zeitleiste ('trace_summary'); mit '--trace-dir' wird die vollständige Zeitleiste pro Aufgabe als Chrome-Trace
+('<id>.chrome.json') und OpenTelemetry-JSON ('<id>.otel.json') gespeichert.
+
+Jede Aufgabe wird als Lauf in der Laufhistorie gespeichert ('run_id' in der Ausgabe), jedes Agenten-Ergebnis sofort als
+Checkpoint. Nach einem Abbruch setzt '--resume' jede Aufgabe bei ihrem letzten Lauf (gleicher Workflow, gleiche Frage)
+fort: Agenten mit erfolgreichem Checkpoint werden ohne Modellaufruf übernommen.
+
+Vorübergehende API-Fehler (429, 5xx, Timeout) werden mit Backoff wiederholt; fällt das Modell dauerhaft aus, wechselt
+der Circuit Breaker auf '--fallback-model'. 'retries' und 'fallback_calls' stehen pro Agent in 'results'.
+
+Agenten mit "model" bzw. "model_policy" in der Konfiguration laufen auf ihrem eigenen bzw. geroutetem Modell;
+'--model-policy' setzt die Policy für alle übrigen. 'model_summary' enthält Aufrufe, Latenz, Tokens und geschätzte
+Kosten pro Modell, am Ende folgt dieselbe Übersicht über alle Aufgaben auf stderr.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import google.genai as genai
+
+from workflow_context import RunState, RunTrace, WorkflowCallbacks, ensure_run_state, run_context
+from workflow_engine import (
+    API_KEY, DEFAULT_MODEL_ID, ArtifactStore, FALLBACK_MODEL_ID, MODEL_POLICIES, ModelClient, WorkflowPlan, get_rate_limiter,
+    get_workflow_plan, prepare_resume, run_workflow_async, summarize_model_usage,
+)
+from workflow_storage import get_run_store
+from workflow_tools import load_upload_file
+
+
+class ConsoleCallbacks(WorkflowCallbacks):
+    """Gibt die Meldungen einer Aufgabe mit ihrer ID auf stderr aus; info/success/toast und Fortschritt nur mit --verbose."""
+    def __init__(self, task_id: str, verbose: bool = False):
+        self.task_id = task_id
+        self.verbose = verbose
+
+    def message(self, level: str, text: str) -> None:
+        if self.verbose or level in ("warning", "error"):
+            print(f"[{self.task_id}] {level.upper()}: {text}", file=sys.stderr)
+
+    def progress(self, running_agents: List[str], finished_count: int, total_count: int) -> None:
+        if self.verbose:
+            print(f"[{self.task_id}] Aktiv: {', '.join(running_agents)} ({finished_count}/{total_count} Agenten abgeschlossen)", file=sys.stderr)
+
+
+def read_tasks(path: str) -> List[Dict[str, Any]]:
+    """Liest die Aufgaben aus einer JSONL-Datei; leere Zeilen werden übersprungen."""
+    tasks = []
+    seen_ids = set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"question": entry}
+            if not isinstance(entry, dict) or not isinstance(entry.get("question"), str):
+                raise ValueError(f"Zeile {line_number}: Erwartet wird ein String oder ein Objekt mit 'question'.")
+            entry["id"] = str(entry.get("id") or f"task-{line_number}")
+            if entry["id"] in seen_ids:
+                raise ValueError(f"Zeile {line_number}: Doppelte Aufgaben-ID '{entry['id']}'.")
+            seen_ids.add(entry["id"])
+            tasks.append(entry)
+    return tasks
+
+
+async def run_task(task: Dict[str, Any], client: ModelClient, plan: WorkflowPlan, args: argparse.Namespace, semaphore: asyncio.Semaphore) -> Tuple[Dict[str, Any], ArtifactStore]:
+    """
+    Führt eine Aufgabe mit eigenem Zustand aus, sobald einer der '--concurrency' Plätze frei ist. Liefert den
+    JSONL-Datensatz und die während des Laufs extrahierten ## FILE:-Dateien.
+    """
+    async with semaphore:
+        callbacks = ConsoleCallbacks(task["id"], args.verbose)
+        state = ensure_run_state(RunState(use_response_cache=not args.no_cache, trace=RunTrace(f"{plan.workflow_name} [{task['id']}]"),
+                                          record_run=not args.no_history, config_path=args.config, fallback_model_id=args.fallback_model,
+                                          default_model_policy=args.model_policy))
+        started = time.perf_counter()
+        error = None
+        with run_context(state, callbacks):
+            try:
+                state.uploaded_files_data = [load_upload_file(path) for path in [*args.files, *task.get("files", [])]]
+                stored_run = get_run_store().latest_run(plan.workflow_name, task["question"]) if args.resume else None
+                if stored_run is not None and stored_run["agents"] == plan.agents:
+                    prepare_resume(state, stored_run)
+                    callbacks.message("info", f"Setze Lauf {stored_run['run_id']} fort ({stored_run['status']}).")
+                success = await run_workflow_async(client, args.model, plan, task["question"], state, callbacks, args.max_parallel_agents)
+            except Exception as e:
+                callbacks.message("error", f"Aufgabe abgebrochen: {e}")
+                success, error = False, str(e)
+        if args.trace_dir:
+            os.makedirs(args.trace_dir, exist_ok=True)
+            for suffix, trace_data in (("chrome", state.trace.to_chrome_trace()), ("otel", state.trace.to_otel_json())):
+                with open(os.path.join(args.trace_dir, f"{task['id']}.{suffix}.json"), "w", encoding="utf-8") as f:
+                    json.dump(trace_data, f)
+        artifacts = state.get("artifacts") if state.get("artifacts") is not None else ArtifactStore()
+        return {
+            "id": task["id"],
+            "run_id": state.get("run_id"),
+            "question": task["question"],
+            "success": success,
+            "error": error,
+            "duration_s": round(time.perf_counter() - started, 3),
+            "results": state.agent_results_display,
+            "trace_summary": state.trace.summary(),
+            "model_summary": summarize_model_usage(state.agent_results_display),
+            "files": [path for path, _, _ in artifacts.items()],
+        }, artifacts
+
+
+async def run_batch(args: argparse.Namespace) -> int:
+    """Führt alle Aufgaben aus und schreibt die Ergebnisse; gibt den Exit-Code zurück (0 = alle erfolgreich)."""
+    workflow_name = args.workflow_name or os.path.splitext(os.path.basename(args.config))[0]
+    with run_context(RunState(), ConsoleCallbacks(workflow_name, verbose=True)):
+        plan = get_workflow_plan(args.config, workflow_name)
+    if plan is None:
+        return 2
+    if plan.graph_error:
+        print(f"Ungültiger Abhängigkeitsgraph: {plan.graph_error}", file=sys.stderr)
+        return 2
+    tasks = read_tasks(args.questions)
+    rate_limiter = get_rate_limiter()
+    if args.rpm or args.tpm is not None:
+        rate_limiter.configure(args.rpm or rate_limiter.rpm, rate_limiter.tpm if args.tpm is None else args.tpm)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(4, args.concurrency * args.max_parallel_agents * 2)))
+    if args.mock_latency:
+        from mock_model_backend import MockModelBackend
+        client = MockModelBackend(latency=args.mock_latency)
+    else:
+        client = genai.Client(api_key=API_KEY)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failed_count = 0
+    retry_count = 0
+    all_results: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        output = sys.stdout if args.output == "-" else stack.enter_context(open(args.output, "w", encoding="utf-8"))
+        zip_f = stack.enter_context(zipfile.ZipFile(args.zip, "w", zipfile.ZIP_DEFLATED)) if args.zip else None
+        for finished in asyncio.as_completed([run_task(task, client, plan, args, semaphore) for task in tasks]):
+            record, artifacts = await finished
+            if zip_f is not None:
+                artifacts.add_to_zip(zip_f, f"{record['id']}/")
+            output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+            failed_count += not record["success"]
+            retry_count += sum(result.get("retries", 0) for result in record["results"])
+            all_results.extend(record["results"])
+            print(f"[{record['id']}] {'OK' if record['success'] else 'FEHLER'} nach {record['duration_s']:.1f} s", file=sys.stderr)
+    limiter_metrics = rate_limiter.metrics()
+    print(f"{len(tasks) - failed_count}/{len(tasks)} Aufgaben erfolgreich in {time.perf_counter() - started:.1f} s. "
+          f"Rate-Limit: {limiter_metrics['waited_calls']} von {limiter_metrics['calls']} Aufrufen mussten warten (Ø {limiter_metrics['avg_wait_s']:.1f} s). "
+          f"Wiederholte Modellaufrufe: {retry_count}.", file=sys.stderr)
+    for row in summarize_model_usage(all_results):
+        cost_info = f", ~{row['cost_usd']:.4f} USD" if row["cost_usd"] is not None else ""
+        print(f"  {row['model']}: {row['calls']} Aufrufe von {row['agents']} Agenten, Ø {row['avg_latency_s']:.2f} s, "
+              f"{row['input_tokens']} Eingabe-/{row['output_tokens']} Ausgabe-Tokens{cost_info}", file=sys.stderr)
+    return 1 if failed_count else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Führt einen Workflow ohne Oberfläche für alle Aufgaben einer JSONL-Datei aus.")
+    parser.add_argument("--config", required=True, help="Agenten-Konfiguration, z.B. agents_config_java.json")
+    parser.add_argument("--questions", required=True, help="JSONL-Datei mit einer Aufgabe pro Zeile")
+    parser.add_argument("--output", default="-", help="Ziel der Ergebnisse als JSONL (Standard: stdout)")
+    parser.add_argument("--zip", help="Optional: ZIP-Archiv für die extrahierten ## FILE:-Dateien aller Aufgaben")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximal gleichzeitig laufende Aufgaben (Standard: 4)")
+    parser.add_argument("--max-parallel-agents", type=int, default=4, help="Maximal parallel laufende Agenten pro Aufgabe (Standard: 4)")
+    parser.add_argument("--files", nargs="*", default=[], help="Dateien, die jeder Aufgabe als Kontext mitgegeben werden")
+    parser.add_argument("--workflow-name", help="Name des Workflows im Systemprompt (Standard: Dateiname der Konfiguration)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_ID, help=f"Modell-ID (Standard: {DEFAULT_MODEL_ID})")
+    parser.add_argument("--rpm", type=int, help="Anfragen pro Minute für alle Aufgaben gemeinsam")
+    parser.add_argument("--tpm", type=int, help="Tokens pro Minute für alle Aufgaben gemeinsam (0 = unbegrenzt)")
+    parser.add_argument("--no-cache", action="store_true", help="Antwort-Cache für Modellaufrufe nicht verwenden")
+    parser.add_argument("--verbose", action="store_true", help="Auch Info-Meldungen und Fortschritt ausgeben")
+    parser.add_argument("--no-history", action="store_true", help="Läufe nicht in der Laufhistorie speichern")
+    parser.add_argument("--resume", action="store_true", help="Jede Aufgabe bei ihrem letzten gespeicherten Lauf fortsetzen (erfolgreiche Agenten werden übernommen)")
+    parser.add_argument("--trace-dir", help="Optional: Verzeichnis für die Zeitleiste jeder Aufgabe (Chrome-Trace und OpenTelemetry-JSON)")
+    parser.add_argument("--model-policy", choices=list(MODEL_POLICIES), help="Routing-Policy für Agenten ohne eigenes 'model'/'model_policy' (Standard: Modell aus '--model')")
+    parser.add_argument("--fallback-model", default=FALLBACK_MODEL_ID, help="Ausweichmodell bei offenem Circuit Breaker (Standard: FALLBACK_MODEL_ID aus .env)")
+    parser.add_argument("--mock-latency", help="Offline mit dem Mock-Backend statt der API ausführen, z.B. lognormal:0.4,0.5")
+    args = parser.parse_args()
+    if not API_KEY and not args.mock_latency:
+        print("Kein API-Key gefunden (API_KEY in .env setzen).", file=sys.stderr)
+        return 2
+    args.concurrency = max(1, args.concurrency)
+    args.max_parallel_agents = max(1, args.max_parallel_agents)
+    return asyncio.run(run_batch(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
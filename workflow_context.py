@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Laufkontext und Tracing der Workflow-Engine: Zustand (RunState bzw. st.session_state) und Rückmeldungen
+(WorkflowCallbacks) eines Laufs sowie die gemessenen Abschnitte seiner Zeitleiste (RunTrace).
+Wird von workflow_engine und workflow_tools gemeinsam genutzt.
+"""
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# --- Laufkontext (Zustand und Rückmeldungen eines Workflow-Laufs) ---
+class RunState(dict):
+    """
+    Zustand eines Workflow-Laufs außerhalb von Streamlit mit Attributzugriff wie st.session_state
+    (message_store, agent_results_display, uploaded_files_data, ...). Die Oberfläche übergibt direkt st.session_state.
+    """
+    def __getattr__(self, key: str) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        self[key] = value
+
+    def __delattr__(self, key: str) -> None:
+        del self[key]
+
+def ensure_run_state(state: Any) -> Any:
+    """Legt die von der Engine benötigten Felder im Zustand an, falls sie fehlen."""
+    for key, factory in (("message_store", dict), ("agent_results_display", list), ("uploaded_files_data", list), ("agent_fingerprints", dict), ("agent_result_memo", dict)):
+        if key not in state:
+            state[key] = factory()
+    return state
+
+class WorkflowCallbacks:
+    """
+    Rückmeldungen der Engine (Meldungen, Fortschritt, gestreamte Antworten). Die Standard-Implementierung verwirft
+    alles; Oberfläche und CLI überschreiben die Methoden. Ist 'stream_output' gesetzt, werden Antworten gestreamt.
+    """
+    stream_output = False
+
+    def message(self, level: str, text: str) -> None:
+        """Meldung mit dem Level 'info', 'success', 'warning', 'error' oder 'toast'."""
+
+    def progress(self, running_agents: List[str], finished_count: int, total_count: int) -> None:
+        """Wird vom Scheduler vor jedem Warten mit den gerade laufenden Agenten aufgerufen."""
+
+    def stream(self, agent_name: str, streamed_text: str, time_to_first_token: float, function_call_names: List[str]) -> None:
+        """Zwischenstand einer gestreamten Antwort (nur bei 'stream_output')."""
+
+_RUN_CONTEXT: contextvars.ContextVar[Optional[Tuple[Any, WorkflowCallbacks]]] = contextvars.ContextVar("workflow_run_context", default=None)
+_FALLBACK_RUN_CONTEXT: Tuple[Any, WorkflowCallbacks] = (ensure_run_state(RunState()), WorkflowCallbacks())
+
+def set_run_context(state: Any, callbacks: Optional[WorkflowCallbacks] = None) -> contextvars.Token:
+    """
+    Setzt Zustand und Callbacks für den aktuellen Kontext. asyncio-Tasks und asyncio.to_thread übernehmen den Kontext,
+    daher sehen Agenten und Tools eines Laufs denselben Zustand, während gleichzeitige Läufe getrennt bleiben.
+    """
+    return _RUN_CONTEXT.set((state, callbacks or WorkflowCallbacks()))
+
+@contextmanager
+def run_context(state: Any, callbacks: Optional[WorkflowCallbacks] = None) -> Iterator[Any]:
+    """Wie set_run_context, stellt den vorherigen Kontext beim Verlassen des Blocks aber wieder her."""
+    token = set_run_context(state, callbacks)
+    try:
+        yield state
+    finally:
+        _RUN_CONTEXT.reset(token)
+
+def run_state() -> Any:
+    """Zustand des aktuellen Laufs (st.session_state in der Oberfläche, sonst ein RunState)."""
+    return (_RUN_CONTEXT.get() or _FALLBACK_RUN_CONTEXT)[0]
+
+def run_callbacks() -> WorkflowCallbacks:
+    """Callbacks des aktuellen Laufs."""
+    return (_RUN_CONTEXT.get() or _FALLBACK_RUN_CONTEXT)[1]
+
+def notify(level: str, text: str) -> None:
+    """Leitet eine Meldung an die Callbacks des aktuellen Laufs weiter."""
+    run_callbacks().message(level, text)
+
+# --- Tracing (Zeitleiste eines Laufs) ---
+class TraceSpan:
+    """Ein gemessener Abschnitt eines Laufs (Agent, Modellaufruf, Tool, Limiter-Wartezeit, Dekodierung, ZIP)."""
+    __slots__ = ("name", "category", "attributes", "span_id", "parent_id", "start", "end")
+
+    def __init__(self, name: str, category: str, attributes: Dict[str, Any], parent_id: Optional[str]):
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+class RunTrace:
+    """
+    Sammelt die Spans eines Workflow-Laufs und exportiert sie als Chrome-Trace (chrome://tracing, Perfetto) oder als
+    OpenTelemetry-JSON (OTLP). Gemessen wird monoton; erst der Export rechnet auf Unix-Zeit um.
+    """
+    def __init__(self, name: str = "workflow"):
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[TraceSpan] = []
+        self._origin = time.perf_counter()
+        self._origin_unix_ns = time.time_ns()
+        self._lock = threading.Lock()
+
+    def add(self, span: TraceSpan) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def finished_spans(self) -> List[TraceSpan]:
+        with self._lock:
+            return sorted((span for span in self.spans if span.end is not None), key=lambda span: span.start)
+
+    @staticmethod
+    def lane(span: TraceSpan) -> str:
+        """Zeile im Gantt-Diagramm: der Agent des Spans, sonst der Workflow selbst."""
+        return str(span.attributes.get("agent") or "Workflow")
+
+    @staticmethod
+    def _attributes(span: TraceSpan) -> Dict[str, Any]:
+        return {key: value for key, value in span.attributes.items() if value is not None}
+
+    def timeline(self) -> List[Dict[str, Any]]:
+        """Abgeschlossene Spans als Zeilen für ein Gantt-Diagramm (Millisekunden seit Start des Laufs)."""
+        return [{
+            "lane": self.lane(span),
+            "name": span.name,
+            "category": span.category,
+            "start_ms": round((span.start - self._origin) * 1000, 2),
+            "end_ms": round((span.end - self._origin) * 1000, 2),
+            "duration_ms": round((span.end - span.start) * 1000, 2),
+            "details": ", ".join(f"{key}={value}" for key, value in self._attributes(span).items() if key != "agent"),
+        } for span in self.finished_spans()]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Anzahl und Gesamtdauer (Sekunden) der Spans je Kategorie; Modellaufrufe enthalten die Limiter-Wartezeit."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for span in self.finished_spans():
+            entry = totals.setdefault(span.category, {"count": 0, "total_s": 0.0})
+            entry["count"] += 1
+            entry["total_s"] = round(entry["total_s"] + span.end - span.start, 6)
+        return totals
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Chrome-Trace-Event-Format: ein Thread pro Agent, Spans als vollständige Ereignisse ('X')."""
+        lanes: Dict[str, int] = {}
+        events = []
+        for span in self.finished_spans():
+            thread_id = lanes.setdefault(self.lane(span), len(lanes) + 1)
+            events.append({"name": span.name, "cat": span.category, "ph": "X", "pid": 1, "tid": thread_id,
+                           "ts": round((span.start - self._origin) * 1e6, 1), "dur": round((span.end - span.start) * 1e6, 1), "args": self._attributes(span)})
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.name}})
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": thread_id, "args": {"name": lane}} for lane, thread_id in lanes.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace_id": self.trace_id}}
+
+    def to_otel_json(self) -> Dict[str, Any]:
+        """OpenTelemetry-JSON (OTLP/HTTP-Format von ExportTraceServiceRequest)."""
+        def otel_value(value: Any) -> Dict[str, Any]:
+            if isinstance(value, bool):
+                return {"boolValue": value}
+            if isinstance(value, int):
+                return {"intValue": str(value)}
+            if isinstance(value, float):
+                return {"doubleValue": value}
+            return {"stringValue": str(value)}
+
+        def unix_nanos(timestamp: float) -> str:
+            return str(self._origin_unix_ns + int((timestamp - self._origin) * 1e9))
+
+        spans = []
+        for span in self.finished_spans():
+            attributes = {"workflow.category": span.category, **self._attributes(span)}
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": unix_nanos(span.start),
+                "endTimeUnixNano": unix_nanos(span.end),
+                "attributes": [{"key": key, "value": otel_value(value)} for key, value in attributes.items()],
+                "status": {"code": 2, "message": str(span.attributes["error"])} if span.attributes.get("error") else {"code": 1},
+            })
+        resource_attributes = [{"key": "service.name", "value": {"stringValue": "ki-workflow-runner"}}, {"key": "workflow.name", "value": {"stringValue": self.name}}]
+        return {"resourceSpans": [{"resource": {"attributes": resource_attributes}, "scopeSpans": [{"scope": {"name": "workflow_engine"}, "spans": spans}]}]}
+
+_CURRENT_SPAN: contextvars.ContextVar[Optional[TraceSpan]] = contextvars.ContextVar("workflow_trace_span", default=None)
+TRACE_INHERITED_ATTRIBUTES = ("agent", "round")
+
+@contextmanager
+def trace_span(name: str, category: str, **attributes: Any) -> Iterator[TraceSpan]:
+    """
+    Misst einen Abschnitt und legt ihn im Trace des aktuellen Laufs ab (run_state().trace, falls vorhanden).
+    Agent und Runde werden vom umgebenden Span übernommen; weitere Attribute können im Block ergänzt werden.
+    """
+    parent = _CURRENT_SPAN.get()
+    if parent is not None:
+        for key in TRACE_INHERITED_ATTRIBUTES:
+            if key in parent.attributes:
+                attributes.setdefault(key, parent.attributes[key])
+    span = TraceSpan(name, category, attributes, parent.span_id if parent else None)
+    token = _CURRENT_SPAN.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.attributes["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _CURRENT_SPAN.reset(token)
+        span.end = time.perf_counter()
+        trace = run_state().get("trace")
+        if trace is not None:
+            trace.add(span)
+
+def current_span() -> Optional[TraceSpan]:
+    """Der gerade offene Span des aktuellen Kontexts oder None."""
+    return _CURRENT_SPAN.get()
+
+def set_span_attributes(**attributes: Any) -> None:
+    """Ergänzt Attribute des gerade offenen Spans (z.B. aus Tools heraus, die im Thread-Pool laufen)."""
+    span = current_span()
+    if span is not None:
+        span.attributes.update(attributes)
@@ -0,0 +1,1921 @@
+# -*- coding: utf-8 -*-
+"""
+Workflow-Engine des KI-Workflow-Generators und -Runners, unabhängig von der Streamlit-Oberfläche.
+Enthält Rate-Limiter, Retry/Circuit Breaker, Modell-Routing, Modell-Backends, Konfigurationsladen, Prompt-Zusammenstellung,
+den parallelen Agenten-Scheduler und die Artefakte eines Laufs. Der Zustand eines Laufs (RunState bzw. st.session_state)
+und seine Rückmeldungen (WorkflowCallbacks) werden über einen Laufkontext übergeben, sodass streamlit_app.py und
+workflow_cli.py dieselbe Engine nutzen.
+
+Weitere Module:
+workflow_context.py – Laufkontext und Tracing
+workflow_storage.py – Antwort-Cache, Tool-Ergebnis-Cache und Laufhistorie (SQLite)
+workflow_tools.py   – HTTP-Client, Tool-Registry, Web-Tools, Upload-Speicher und Suchindex
+
+Benötigte Installationen:
+pip install google-generativeai python-dotenv Pillow python-dateutil asteval requests wikipedia numpy
+Optional (schnellere HTML-Extraktion): pip install lxml
+"""
+
+# Importiere alle notwendigen Bibliotheken
+import google.genai as genai
+from google.genai import errors as genai_errors
+from google.genai.types import Part, GenerateContentConfig, GoogleSearch, FunctionResponse, GenerateContentResponse, Content, Schema, Type, ToolConfig, FunctionCallingConfig
+from dotenv import load_dotenv
+import os
+import json
+from typing import List, Dict, Any, Callable, Union, Awaitable, Optional, Tuple, Iterator, AsyncIterator
+from PIL import Image
+import datetime
+import re
+import zipfile
+import traceback
+import time  # Wird für die RPM-Implementierung benötigt
+import inspect  # Hinzugefügt für Tool-Docstrings
+import asyncio  # Parallele Ausführung unabhängiger Agenten
+import threading
+import sqlite3
+import hashlib
+import functools
+import tempfile
+import contextvars
+import random
+import httpx
+import warnings
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+from workflow_context import (
+    RunTrace, WorkflowCallbacks, current_span, ensure_run_state, notify, run_callbacks, run_context, run_state, set_span_attributes, trace_span,
+)
+from workflow_storage import ResponseCache, get_response_cache, get_run_store
+from workflow_tools import (
+    MAX_CONTENT_LENGTH, TOOL_REGISTRY, get_file_bytes, get_file_text_view, get_tool_bundle, retrieve_file_excerpt, tokenize_for_search,
+)
+
+# --- Konstanten ---
+load_dotenv()
+API_KEY = os.getenv("API_KEY")
+DEFAULT_MODEL_ID = "gemini-2.0-flash-exp"  # Alternativ: "gemini-2.0-pro-exp-02-05" gemini-2.0-flash-exp gemini-1.5-flash-latest
+GENERATOR_WORKFLOW_NAME = "Dynamischer Workflow Generator"
+GENERATOR_CONFIG_FILE = "generator_agent_config.json"
+GENERATOR_CANDIDATES = int(os.getenv("GENERATOR_CANDIDATES") or 3)  # Parallel erzeugte Konfigurations-Kandidaten pro Generierung
+CHARS_PER_TOKEN = 4  # Grobe lokale Token-Schätzung
+IMAGE_TOKEN_ESTIMATE = 258  # Pauschale Tokens pro Bild (Gemini)
+DEFAULT_AGENT_TOKEN_BUDGET = int(os.getenv("DEFAULT_AGENT_TOKEN_BUDGET") or 0)  # Eingabe-Budget je Agent, 0 = unbegrenzt
+MIN_TRIMMED_SEGMENT_TOKENS = 200  # Gekürzte Dateien/Vorgänger-Ergebnisse behalten mindestens so viele Tokens
+TOOL_LOOP_TOKEN_BUDGET = int(os.getenv("TOOL_LOOP_TOKEN_BUDGET") or 32000)  # Höchstgröße des Prompts eines Turns im Tool-Loop (Eingabe-Tokens)
+MAX_TOOL_TURNS = int(os.getenv("MAX_TOOL_TURNS") or 12)  # Harte Obergrenze der Modell-Turns mit Tool-Aufrufen pro Agent
+TOOL_RESULT_SUMMARY_CHARS = 800  # Länge der extraktiven Zusammenfassung bereits gelesener Tool-Ergebnisse
+DEFAULT_RPM_LIMIT = 30
+FALLBACK_MODEL_ID = os.getenv("FALLBACK_MODEL_ID") or None  # Ausweichmodell, solange der Circuit Breaker des angefragten Modells offen ist
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES") or 4)  # Wiederholungen pro Modellaufruf bei 429/5xx/Timeout
+MODEL_RETRY_BASE_DELAY = 1.0  # Sekunden, verdoppelt sich pro Versuch (mit Jitter)
+MODEL_RETRY_MAX_DELAY = 60.0  # Längere Retry-After-Hinweise führen zum Abbruch statt zum Warten
+MODEL_CALL_TIMEOUT = float(os.getenv("MODEL_CALL_TIMEOUT") or 300)  # Sekunden pro asynchronem Modellaufruf (inkl. Streaming)
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+CIRCUIT_BREAKER_FAILURES = 5  # Aufeinanderfolgende Fehler, nach denen ein Modell als gestört gilt
+CIRCUIT_BREAKER_COOLDOWN_S = 60.0
+# Modellkatalog für das Routing pro Agent: Qualitätsstufe (1 = schnell/günstig, 3 = stärkstes Modell), erwartete Dauer
+# eines Aufrufs bis zu eigenen Messungen und Preis in USD pro 1 Mio. Eingabe-/Ausgabe-Tokens (Richtwerte).
+MODEL_CATALOG: Dict[str, Dict[str, float]] = {
+    "gemini-2.0-flash-lite": {"quality": 1, "latency_s": 2.0, "input_cost": 0.075, "output_cost": 0.30},
+    "gemini-2.0-flash-exp": {"quality": 2, "latency_s": 4.0, "input_cost": 0.10, "output_cost": 0.40},
+    "gemini-2.0-pro-exp-02-05": {"quality": 3, "latency_s": 12.0, "input_cost": 1.25, "output_cost": 10.00},
+}
+if os.getenv("MODEL_CATALOG_FILE"):  # Optional: eigener Katalog als JSON im gleichen Format
+    try:
+        with open(os.environ["MODEL_CATALOG_FILE"], encoding="utf-8") as catalog_file:
+            custom_catalog = json.load(catalog_file)
+        if not isinstance(custom_catalog, dict) or not all(isinstance(entry, dict) for entry in custom_catalog.values()):
+            raise ValueError("erwartet ein Objekt Modell-ID -> {quality, latency_s, input_cost, output_cost}")
+        MODEL_CATALOG = custom_catalog
+    except (OSError, ValueError) as catalog_error:  # json.JSONDecodeError ist ein ValueError
+        warnings.warn(f"MODEL_CATALOG_FILE '{os.environ['MODEL_CATALOG_FILE']}' nicht lesbar ({catalog_error}); verwende den eingebauten Modellkatalog.")
+# Routing-Policies ("model_policy"): Mindest-Qualitätsstufe und Ziel (latency = schnellstes, cost = günstigstes, quality = stärkstes Modell)
+MODEL_POLICIES: Dict[str, Dict[str, Any]] = {
+    "fast": {"min_quality": 1, "objective": "latency"},
+    "balanced": {"min_quality": 2, "objective": "cost"},
+    "quality": {"min_quality": 3, "objective": "quality"},
+}
+ROUTER_DEFAULT_OUTPUT_TOKENS = 500  # Angenommene Antwortlänge für die Kostenschätzung, solange ein Modell nicht beobachtet wurde
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")  # Optional: SQLite-Datei für einen prozessübergreifenden Rate-Limiter
+MAX_REMEMBERED_AGENT_RESULTS = 200
+ZIP_SPOOL_MAX_BYTES = 16 * 1024 * 1024  # Größere ZIP-Downloads werden in einer temporären Datei statt im RAM gebaut
+
+# --- RPM Funktionalität ---
+class TokenBucketLimiter:
+    """
+    Rate-Limiter nach dem Leaky-Bucket-Prinzip (GCRA) mit Budgets für Anfragen (RPM) und Tokens (TPM).
+    Jeder Aufruf reserviert unter einem Lock den nächsten freien Zeitpunkt. Wartende werden dadurch in
+    Ankunftsreihenfolge bedient (faire Warteschlange über alle parallel laufenden Agenten), und die
+    Wartezeit kann blockierend (acquire) oder per await (acquire_async) abgewartet werden.
+    Anfragen werden gleichmäßig im Abstand 60/RPM Sekunden verteilt, sodass auch über eine
+    Minutengrenze hinweg nie mehr als 'rpm' Anfragen pro 60 Sekunden gesendet werden.
+    Mit 'state_path' liegt der Zustand (inkl. Limits) in einer SQLite-Datei, die sich mehrere
+    Worker-Prozesse teilen; Reservierungen laufen dann in einer exklusiven Transaktion.
+    """
+    def __init__(self, rpm: int, tpm: int = 0, state_path: str | None = None):
+        self._lock = threading.Lock()
+        self._state_path = state_path
+        self._request_tat = 0.0  # "Theoretical Arrival Time" der nächsten Anfrage
+        self._token_tat = 0.0
+        self._waiting = 0
+        self._max_waiting = 0
+        self._call_count = 0
+        self._waited_count = 0
+        self._total_wait = 0.0
+        self._recent_waits: deque[float] = deque(maxlen=500)
+        if state_path:
+            with closing(self._connect()) as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS limiter_state (id INTEGER PRIMARY KEY, request_tat REAL, token_tat REAL, rpm INTEGER, tpm INTEGER)")
+                conn.execute("INSERT OR IGNORE INTO limiter_state VALUES (1, 0, 0, ?, ?)", (max(1, int(rpm)), max(0, int(tpm or 0))))
+        self.configure(rpm, tpm)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._state_path, timeout=30, isolation_level=None)
+
+    def configure(self, rpm: int, tpm: int = 0) -> None:
+        """Setzt neue Limits; tpm <= 0 deaktiviert das Token-Budget. Gilt für alle Nutzer des Limiters."""
+        with self._lock:
+            self.rpm = max(1, int(rpm))
+            self.tpm = max(0, int(tpm or 0))
+            if self._state_path:
+                with closing(self._connect()) as conn:
+                    conn.execute("UPDATE limiter_state SET rpm = ?, tpm = ? WHERE id = 1", (self.rpm, self.tpm))
+
+    def _advance(self, request_tat: float, token_tat: float, now: float, tokens: int) -> tuple[float, float, float]:
+        """Berechnet die neuen Ankunftszeiten und die Wartezeit für eine Anfrage (GCRA)."""
+        request_interval = 60.0 / self.rpm
+        request_tat = max(request_tat, now) + request_interval
+        wait_time = request_tat - now - request_interval
+        if self.tpm and tokens > 0:
+            token_tat = max(token_tat, now) + tokens * 60.0 / self.tpm
+            # Das Token-Budget darf sich bis zu einer Minute "ansparen" (Bucket-Kapazität = TPM).
+            wait_time = max(wait_time, token_tat - now - 60.0)
+        return request_tat, token_tat, max(0.0, wait_time)
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserviert einen Slot für eine Anfrage mit geschätzt 'tokens' Tokens und gibt die nötige Wartezeit zurück."""
+        with self._lock:
+            now = time.time()
+            if self._state_path:
+                with closing(self._connect()) as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    request_tat, token_tat, self.rpm, self.tpm = conn.execute("SELECT request_tat, token_tat, rpm, tpm FROM limiter_state WHERE id = 1").fetchone()
+                    request_tat, token_tat, wait_time = self._advance(request_tat, token_tat, now, tokens)
+                    conn.execute("UPDATE limiter_state SET request_tat = ?, token_tat = ? WHERE id = 1", (request_tat, token_tat))
+                    conn.execute("COMMIT")
+            else:
+                self._request_tat, self._token_tat, wait_time = self._advance(self._request_tat, self._token_tat, now, tokens)
+            self._call_count += 1
+            self._recent_waits.append(wait_time)
+            if wait_time > 0:
+                self._waited_count += 1
+                self._total_wait += wait_time
+            return wait_time
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int | None) -> None:
+        """Korrigiert das Token-Budget nachträglich um die Differenz zwischen Schätzung und tatsächlichem Verbrauch."""
+        if not self.tpm or actual_tokens is None:
+            return
+        correction = (actual_tokens - estimated_tokens) * 60.0 / self.tpm
+        with self._lock:
+            if self._state_path:
+                with closing(self._connect()) as conn:
+                    conn.execute("UPDATE limiter_state SET token_tat = token_tat + ? WHERE id = 1", (correction,))
+            else:
+                self._token_tat += correction
+
+    def _set_waiting(self, delta: int) -> None:
+        with self._lock:
+            self._waiting += delta
+            self._max_waiting = max(self._max_waiting, self._waiting)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Wartet blockierend auf den reservierten Slot und gibt die Wartezeit zurück."""
+        wait_time = self.reserve(tokens)
+        if wait_time > 0:
+            self._set_waiting(1)
+            try:
+                time.sleep(wait_time)
+            finally:
+                self._set_waiting(-1)
+        return wait_time
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """Wartet ohne den Event-Loop zu blockieren auf den reservierten Slot und gibt die Wartezeit zurück."""
+        wait_time = self.reserve(tokens)
+        if wait_time > 0:
+            self._set_waiting(1)
+            try:
+                await asyncio.sleep(wait_time)
+            finally:
+                self._set_waiting(-1)
+        return wait_time
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Kennzahlen zur Dimensionierung der Limits: aktuelle und maximale Warteschlangenlänge, Wartezeiten
+        (Summe, Durchschnitt, p95 der letzten 500 Aufrufe) dieses Prozesses sowie der bereits reservierte
+        Rückstau in Sekunden (bei SQLite-Backend über alle Prozesse).
+        """
+        with self._lock:
+            if self._state_path:
+                with closing(self._connect()) as conn:
+                    request_tat = conn.execute("SELECT request_tat FROM limiter_state WHERE id = 1").fetchone()[0]
+            else:
+                request_tat = self._request_tat
+            recent_waits = sorted(self._recent_waits)
+            return {
+                "backend": "sqlite" if self._state_path else "memory",
+                "calls": self._call_count,
+                "waiting": self._waiting,
+                "max_waiting": self._max_waiting,
+                "waited_calls": self._waited_count,
+                "total_wait_s": self._total_wait,
+                "avg_wait_s": self._total_wait / self._call_count if self._call_count else 0.0,
+                "p95_wait_s": recent_waits[int(len(recent_waits) * 0.95)] if recent_waits else 0.0,
+                "backlog_s": max(0.0, request_tat - time.time() - 60.0 / self.rpm),
+            }
+
+@functools.lru_cache(maxsize=None)
+def get_rate_limiter() -> TokenBucketLimiter:
+    """
+    Liefert den prozessweit geteilten Rate-Limiter: Alle Streamlit-Sessions und gleichzeitigen CLI-Läufe teilen sich ein Budget.
+    Ist RATE_LIMIT_DB gesetzt, teilen sich zusätzlich alle Worker-Prozesse den Zustand über SQLite.
+    """
+    return TokenBucketLimiter(DEFAULT_RPM_LIMIT, state_path=RATE_LIMIT_DB or None)
+
+def estimate_text_tokens(text: str) -> int:
+    """Grobe lokale Token-Schätzung für einen Text (ca. CHARS_PER_TOKEN Zeichen pro Token)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def estimate_token_count(contents: List[Union[Part, Content]]) -> int:
+    """Grobe lokale Token-Schätzung (ca. 4 Zeichen pro Token) für das TPM-Budget vor dem API-Aufruf."""
+    parts = [part for item in contents for part in (item.parts or [] if isinstance(item, Content) else [item])]
+    char_count = sum(len(part.text) for part in parts if getattr(part, "text", None))
+    char_count += sum(len(str(part.function_response.response)) for part in parts if getattr(part, "function_response", None))
+    return max(1, char_count // CHARS_PER_TOKEN)
+
+def _get_total_token_count(response: Any) -> int | None:
+    """Liest den tatsächlichen Tokenverbrauch aus den Usage-Metadaten einer API-Antwort."""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage else None
+
+def get_usage_token_counts(response: Any) -> tuple[int | None, int | None]:
+    """Liest (Eingabe-Tokens, Ausgabe-Tokens) aus den Usage-Metadaten einer API-Antwort."""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return None, None
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+def _notify_rate_limit_wait(wait_time: float) -> None:
+    if wait_time >= 1:
+        notify("toast", f"⏳ RPM/TPM-Limit: Anfrage wartet {wait_time:.1f} Sekunden.")
+
+def rpm_limiter(func: Callable) -> Callable:
+    """
+    Decorator, der sicherstellt, dass die dekorierte Funktion die RPM-/TPM-Budgets des Rate-Limiters einhält.
+    Funktioniert für synchrone Funktionen (blockierendes Warten) und Coroutinen (Warten per await); bei Coroutinen ist
+    der eigentliche Aufruf nach der Wartezeit auf MODEL_CALL_TIMEOUT Sekunden begrenzt. Die Dauer des Aufrufs (ohne
+    Wartezeit) geht in die Modell-Statistik für das Routing ein.
+    """
+    if inspect.iscoroutinefunction(func):
+        async def async_wrapper(*args, **kwargs):
+            limiter = get_rate_limiter()
+            estimated_tokens = estimate_token_count(kwargs.get("contents") or [])
+            with trace_span("Rate-Limiter", "limiter", estimated_tokens=estimated_tokens) as span:
+                wait_time = await limiter.acquire_async(estimated_tokens)
+                span.attributes["wait_s"] = round(wait_time, 3)
+            _notify_rate_limit_wait(wait_time)
+            started = time.perf_counter()
+            response = await asyncio.wait_for(func(*args, **kwargs), MODEL_CALL_TIMEOUT)
+            limiter.record_usage(estimated_tokens, _get_total_token_count(response))
+            record_model_call(kwargs["model"], time.perf_counter() - started, response)
+            return response
+        return async_wrapper
+
+    def wrapper(*args, **kwargs):
+        limiter = get_rate_limiter()
+        estimated_tokens = estimate_token_count(kwargs.get("contents") or [])
+        with trace_span("Rate-Limiter", "limiter", estimated_tokens=estimated_tokens) as span:
+            wait_time = limiter.acquire(estimated_tokens)
+            span.attributes["wait_s"] = round(wait_time, 3)
+        _notify_rate_limit_wait(wait_time)
+        started = time.perf_counter()
+        response = func(*args, **kwargs)
+        limiter.record_usage(estimated_tokens, _get_total_token_count(response))
+        record_model_call(kwargs["model"], time.perf_counter() - started, response)
+        return response
+    return wrapper
+
+# --- Wiederholungen, Circuit Breaker und Modell-Fallback ---
+class ModelUnavailableError(RuntimeError):
+    """Das Modell (und ggf. das Ausweichmodell) ist laut Circuit Breaker gestört und die Wiederholungen sind aufgebraucht."""
+
+class CircuitBreaker:
+    """
+    Prozessweiter Circuit Breaker pro Modell (gilt für alle Sitzungen und Läufe): Nach 'failure_threshold'
+    aufeinanderfolgenden wiederholbaren Fehlern ist das Modell für 'cooldown_s' gesperrt ('offen'). Danach darf ein
+    einzelner Probeaufruf durch ('halb offen'); sein Erfolg schließt den Breaker, ein Fehler öffnet ihn erneut.
+    """
+    def __init__(self, failure_threshold: int, cooldown_s: float):
+        self._lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self._models: Dict[str, Dict[str, Any]] = {}
+
+    def _model_state(self, model: str) -> Dict[str, Any]:
+        return self._models.setdefault(model, {"failures": 0, "opened_at": None, "probe_started": None, "opened_count": 0})
+
+    def allow(self, model: str) -> float:
+        """0, wenn ein Aufruf erlaubt ist (ggf. als Probeaufruf), sonst die Sekunden bis zum nächsten Probeaufruf."""
+        now = time.monotonic()
+        with self._lock:
+            model_state = self._model_state(model)
+            if model_state["opened_at"] is None:
+                return 0.0
+            remaining = model_state["opened_at"] + self.cooldown_s - now
+            if remaining > 0:
+                return remaining
+            # Ein abgebrochener Probeaufruf blockiert höchstens eine weitere Abklingzeit.
+            if model_state["probe_started"] is not None and now - model_state["probe_started"] < self.cooldown_s:
+                return self.cooldown_s - (now - model_state["probe_started"])
+            model_state["probe_started"] = now
+            return 0.0
+
+    def record_success(self, model: str) -> None:
+        with self._lock:
+            model_state = self._model_state(model)
+            model_state.update(failures=0, opened_at=None, probe_started=None)
+
+    def record_failure(self, model: str) -> bool:
+        """Zählt einen Fehler; gibt True zurück, wenn der Breaker dadurch (erneut) öffnet."""
+        with self._lock:
+            model_state = self._model_state(model)
+            model_state["failures"] += 1
+            if model_state["probe_started"] is not None or (model_state["opened_at"] is None and model_state["failures"] >= self.failure_threshold):
+                model_state.update(opened_at=time.monotonic(), probe_started=None)
+                model_state["opened_count"] += 1
+                return True
+            return False
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Zustand pro Modell für die Anzeige ('geschlossen', 'offen', 'halb offen')."""
+        now = time.monotonic()
+        with self._lock:
+            return {model: {
+                "state": "geschlossen" if model_state["opened_at"] is None else ("offen" if now - model_state["opened_at"] < self.cooldown_s else "halb offen"),
+                "failures": model_state["failures"],
+                "opened_count": model_state["opened_count"],
+            } for model, model_state in self._models.items()}
+
+@functools.lru_cache(maxsize=None)
+def get_circuit_breaker() -> CircuitBreaker:
+    """Liefert den prozessweit geteilten Circuit Breaker."""
+    return CircuitBreaker(CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_COOLDOWN_S)
+
+# Zähler des aktuellen Agenten (von run_agent pro Agent gesetzt): Wiederholungen, verlorene Zeit, Fallback-Aufrufe
+# und Verbrauch pro tatsächlich verwendetem Modell.
+_MODEL_CALL_STATS: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("model_call_stats", default=None)
+
+def new_model_call_stats() -> Dict[str, Any]:
+    """Setzt frische Zähler für Wiederholungen, Fallback und Modellverbrauch im aktuellen Kontext und liefert sie zurück."""
+    stats = {"retries": 0, "retry_wait_s": 0.0, "fallback_calls": 0, "fallback_model": None, "model_usage": {}}
+    _MODEL_CALL_STATS.set(stats)
+    return stats
+
+def retry_after_hint(exc: Exception) -> Optional[float]:
+    """Wartezeit aus dem Retry-After-Header oder der RetryInfo ('retryDelay': '17s') einer API-Fehlerantwort."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if headers and headers.get("retry-after"):
+        try:
+            return max(0.0, float(headers["retry-after"]))
+        except ValueError:
+            pass
+    details = getattr(exc, "details", None)
+    error_details = (details.get("error") or {}).get("details") if isinstance(details, dict) else None
+    for entry in error_details or []:
+        if isinstance(entry, dict) and str(entry.get("@type", "")).endswith("RetryInfo") and entry.get("retryDelay"):
+            try:
+                return max(0.0, float(str(entry["retryDelay"]).rstrip("s")))
+            except ValueError:
+                return None
+    return None
+
+def model_retry_delay(exc: Exception, attempt: int) -> Optional[float]:
+    """
+    Wartezeit vor dem nächsten Versuch oder None, wenn der Fehler nicht wiederholbar ist (z.B. 400/403/404) oder der
+    Retry-After-Hinweis über MODEL_RETRY_MAX_DELAY liegt. Ohne Hinweis: exponentieller Backoff mit Jitter.
+    """
+    if isinstance(exc, genai_errors.APIError):
+        if exc.code not in RETRYABLE_STATUS_CODES:
+            return None
+    elif not isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TimeoutException, httpx.NetworkError)):
+        return None
+    backoff = min(MODEL_RETRY_MAX_DELAY, MODEL_RETRY_BASE_DELAY * 2 ** attempt)
+    hint = retry_after_hint(exc)
+    if hint is None:
+        return random.uniform(backoff / 2, backoff)
+    if hint > MODEL_RETRY_MAX_DELAY:
+        return None
+    return hint + random.uniform(0, MODEL_RETRY_BASE_DELAY)
+
+def _fallback_model(requested_model: str) -> Optional[str]:
+    fallback_model_id = run_state().get("fallback_model_id") or FALLBACK_MODEL_ID
+    if not fallback_model_id:
+        return None
+    if requested_model.startswith("models/") and not fallback_model_id.startswith("models/"):
+        fallback_model_id = f"models/{fallback_model_id}"
+    return fallback_model_id if fallback_model_id != requested_model else None
+
+def _select_model(requested_model: str) -> Tuple[Optional[str], float]:
+    """Angefragtes Modell, bei offenem Breaker das Ausweichmodell; (None, Sekunden bis zum Probeaufruf), wenn beide gesperrt sind."""
+    breaker = get_circuit_breaker()
+    blocked_for = breaker.allow(requested_model)
+    if blocked_for == 0:
+        return requested_model, 0.0
+    fallback_model = _fallback_model(requested_model)
+    if fallback_model and breaker.allow(fallback_model) == 0:
+        return fallback_model, 0.0
+    return None, blocked_for
+
+def _record_retry(model: str, delay: float, reason: Any, attempt: int) -> None:
+    stats = _MODEL_CALL_STATS.get()
+    if stats is not None:
+        stats["retries"] += 1
+        stats["retry_wait_s"] += delay
+    span = current_span()
+    if span is not None and span.category == "model":
+        span.attributes["retries"] = span.attributes.get("retries", 0) + 1
+        span.attributes["retry_wait_s"] = round(span.attributes.get("retry_wait_s", 0.0) + delay, 3)
+    notify("toast", f"🔁 {model}: {str(reason)[:120]} – neuer Versuch in {delay:.1f} s ({attempt + 1}/{MODEL_MAX_RETRIES}).")
+
+def _record_model_result(requested_model: str, model: str) -> None:
+    get_circuit_breaker().record_success(model)
+    if model != requested_model:
+        stats = _MODEL_CALL_STATS.get()
+        if stats is not None:
+            stats["fallback_calls"] += 1
+            stats["fallback_model"] = model
+        set_span_attributes(model_used=model)
+
+def _record_model_failure(model: str) -> bool:
+    if get_circuit_breaker().record_failure(model):
+        notify("warning", f"⚡ Circuit Breaker für {model} geöffnet: {CIRCUIT_BREAKER_FAILURES} Fehler in Folge, Pause {CIRCUIT_BREAKER_COOLDOWN_S:.0f} s.")
+        return True
+    return False
+
+def _next_retry(requested_model: str, model: Optional[str], blocked_for: float, exc: Exception, attempt: int) -> Optional[Tuple[float, bool]]:
+    """
+    Entscheidet nach einem fehlgeschlagenen Versuch: None = aufgeben, sonst (Wartezeit, zählt als Versuch).
+    Öffnet der Fehler den Breaker des angefragten Modells, wird ohne Wartezeit auf das Ausweichmodell gewechselt.
+    """
+    if model is None:
+        delay = min(blocked_for, MODEL_RETRY_MAX_DELAY)
+    else:
+        delay = model_retry_delay(exc, attempt)
+        if delay is None:
+            return None
+        if _record_model_failure(model) and model == requested_model and _fallback_model(requested_model):
+            _record_retry(model, 0.0, exc, attempt)
+            return 0.0, False
+    if attempt >= MODEL_MAX_RETRIES:
+        return None
+    _record_retry(model or requested_model, delay, exc, attempt)
+    return delay, True
+
+def model_retry(func: Callable) -> Callable:
+    """
+    Decorator für Modellaufrufe zwischen Antwort-Cache und Rate-Limiter: Wiederholt 429/5xx/Timeouts bis zu
+    MODEL_MAX_RETRIES Mal mit exponentiellem Backoff und Jitter (Retry-After-Hinweise haben Vorrang), führt pro Modell
+    den Circuit Breaker und weicht bei offenem Breaker auf das Ausweichmodell aus (state.fallback_model_id bzw.
+    FALLBACK_MODEL_ID). Jeder Versuch durchläuft erneut den Rate-Limiter. Wiederholungen werden am Span 'model' und
+    in den Zählern des aktuellen Agenten vermerkt.
+    """
+    if inspect.iscoroutinefunction(func):
+        async def async_wrapper(*args, **kwargs):
+            requested_model = kwargs["model"]
+            attempt = 0
+            while True:
+                model, blocked_for = _select_model(requested_model)
+                try:
+                    if model is None:
+                        raise ModelUnavailableError(f"{requested_model} ist gestört (Circuit Breaker offen, kein Ausweichmodell verfügbar).")
+                    response = await func(*args, **{**kwargs, "model": model})
+                except Exception as e:
+                    retry = _next_retry(requested_model, model, blocked_for, e, attempt)
+                    if retry is None:
+                        raise
+                    delay, counts_as_attempt = retry
+                    attempt += counts_as_attempt
+                    await asyncio.sleep(delay)
+                    continue
+                _record_model_result(requested_model, model)
+                return response
+        return async_wrapper
+
+    def wrapper(*args, **kwargs):
+        requested_model = kwargs["model"]
+        attempt = 0
+        while True:
+            model, blocked_for = _select_model(requested_model)
+            try:
+                if model is None:
+                    raise ModelUnavailableError(f"{requested_model} ist gestört (Circuit Breaker offen, kein Ausweichmodell verfügbar).")
+                response = func(*args, **{**kwargs, "model": model})
+            except Exception as e:
+                retry = _next_retry(requested_model, model, blocked_for, e, attempt)
+                if retry is None:
+                    raise
+                delay, counts_as_attempt = retry
+                attempt += counts_as_attempt
+                time.sleep(delay)
+                continue
+            _record_model_result(requested_model, model)
+            return response
+    return wrapper
+
+# --- Modell-Routing pro Agent ---
+class ModelStats:
+    """
+    Prozessweite Beobachtungen pro Modell für das Routing (alle Sitzungen und Läufe): gleitender Mittelwert (EWMA)
+    der Aufrufdauer ohne Rate-Limiter-Wartezeit sowie Anzahl der Aufrufe und Tokens. Cache-Treffer zählen nicht.
+    """
+    def __init__(self, smoothing: float = 0.3):
+        self._lock = threading.Lock()
+        self.smoothing = smoothing
+        self._models: Dict[str, Dict[str, float]] = {}
+
+    def record(self, model: str, latency_s: float, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+        with self._lock:
+            entry = self._models.setdefault(model, {"calls": 0, "latency_s": latency_s, "input_tokens": 0, "output_tokens": 0})
+            entry["latency_s"] += self.smoothing * (latency_s - entry["latency_s"])
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens or 0
+            entry["output_tokens"] += output_tokens or 0
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {model: dict(entry) for model, entry in self._models.items()}
+
+@functools.lru_cache(maxsize=None)
+def get_model_stats() -> ModelStats:
+    """Liefert die prozessweit geteilte Modell-Statistik."""
+    return ModelStats()
+
+def record_model_call(model: str, latency_s: float, response: Any) -> None:
+    """Vermerkt einen beantworteten Modellaufruf in der Modell-Statistik und im Verbrauch des aktuellen Agenten."""
+    model = model.removeprefix("models/")
+    input_tokens, output_tokens = get_usage_token_counts(response)
+    get_model_stats().record(model, latency_s, input_tokens, output_tokens)
+    stats = _MODEL_CALL_STATS.get()
+    if stats is not None:
+        usage = stats["model_usage"].setdefault(model, {"calls": 0, "latency_s": 0.0, "input_tokens": 0, "output_tokens": 0})
+        usage["calls"] += 1
+        usage["latency_s"] += latency_s
+        usage["input_tokens"] += input_tokens or 0
+        usage["output_tokens"] += output_tokens or 0
+
+def expected_model_latencies(models: List[str], observed: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """
+    Erwartete Aufrufdauer pro Modell: die beobachtete, sonst der Startwert aus MODEL_CATALOG, skaliert mit dem mittleren
+    Verhältnis beobachtet/Startwert der bereits gemessenen Katalogmodelle (Netzwerk, Promptlängen). Unbekannt = unendlich.
+    """
+    ratios = [entry["latency_s"] / MODEL_CATALOG[model]["latency_s"] for model, entry in observed.items()
+              if entry.get("calls") and MODEL_CATALOG.get(model, {}).get("latency_s")]
+    scale = sum(ratios) / len(ratios) if ratios else 1.0
+    latencies = {}
+    for model in models:
+        if observed.get(model, {}).get("calls"):
+            latencies[model] = observed[model]["latency_s"]
+        else:
+            prior = MODEL_CATALOG.get(model, {}).get("latency_s")
+            latencies[model] = prior * scale if prior else float("inf")
+    return latencies
+
+def estimate_model_cost(model: str, input_tokens: float, output_tokens: float) -> Optional[float]:
+    """Geschätzte Kosten in USD laut MODEL_CATALOG; None für Modelle ohne Preisangabe."""
+    prices = MODEL_CATALOG.get(model)
+    if not prices or "input_cost" not in prices:
+        return None
+    return (input_tokens * prices["input_cost"] + output_tokens * prices.get("output_cost", prices["input_cost"])) / 1_000_000
+
+def route_agent_model(agent_conf: Dict[str, Any], default_model_id: str, prompt_tokens: int, default_policy: Optional[str] = None) -> Tuple[str, Optional[str], str]:
+    """
+    Wählt das Modell eines Agenten. 'model' in der Konfiguration gilt unverändert. Mit 'model_policy' (oder der
+    Standard-Policy des Laufs) kommen die Katalogmodelle mit ausreichender Qualitätsstufe und nicht offenem Circuit
+    Breaker in Frage, bei 'max_latency_s' nur die, deren erwartete Aufrufdauer darunter liegt. Davon gewinnt je nach
+    Ziel der Policy das schnellste, günstigste (geschätzte Kosten für Prompt und beobachtete Antwortlänge) oder
+    stärkste Modell. Ohne Policy bleibt es beim Modell des Laufs. Liefert (Modell-ID, Policy, Begründung).
+    """
+    if agent_conf.get("model"):
+        return str(agent_conf["model"]).removeprefix("models/"), None, "fest konfiguriert"
+    policy_name = agent_conf.get("model_policy") or default_policy
+    policy = MODEL_POLICIES.get(policy_name) if policy_name else None
+    if policy is None:
+        return default_model_id, None, "Modell des Laufs"
+    breaker_status = get_circuit_breaker().status()
+    candidates = [model for model, entry in MODEL_CATALOG.items()
+                  if entry.get("quality", 0) >= policy["min_quality"] and breaker_status.get(f"models/{model}", {}).get("state") != "offen"]
+    if not candidates:
+        return default_model_id, policy_name, "kein passendes Modell im Katalog, Modell des Laufs"
+    observed = get_model_stats().snapshot()
+    latency = expected_model_latencies(candidates, observed)
+    max_latency_s = agent_conf.get("max_latency_s")
+    if max_latency_s:
+        candidates = [model for model in candidates if latency[model] <= max_latency_s] or [min(candidates, key=latency.__getitem__)]
+    cost = {}
+    for model in candidates:
+        model_observed = observed.get(model, {})
+        output_tokens = model_observed["output_tokens"] / model_observed["calls"] if model_observed.get("calls") else ROUTER_DEFAULT_OUTPUT_TOKENS
+        cost[model] = estimate_model_cost(model, prompt_tokens, output_tokens) or 0.0
+    match policy["objective"]:
+        case "latency":
+            model = min(candidates, key=lambda model: (latency[model], cost[model]))
+        case "quality":
+            model = min(candidates, key=lambda model: (-MODEL_CATALOG[model]["quality"], cost[model], latency[model]))
+        case _:
+            model = min(candidates, key=lambda model: (cost[model], latency[model]))
+    return model, policy_name, f"erwartet ~{latency[model]:.2f} s, ~{cost[model]:.4f} USD"
+
+def summarize_model_usage(agent_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fasst den Verbrauch ('model_usage') der Agenten-Ergebnisse pro Modell zusammen: Agenten, Aufrufe, Dauer, Tokens, Kosten."""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for result in agent_results:
+        for model, usage in (result.get("model_usage") or {}).items():
+            entry = summary.setdefault(model, {"model": model, "agents": 0, "calls": 0, "latency_s": 0.0, "input_tokens": 0, "output_tokens": 0})
+            entry["agents"] += 1
+            for key in ("calls", "latency_s", "input_tokens", "output_tokens"):
+                entry[key] += usage.get(key, 0)
+    for entry in summary.values():
+        entry["avg_latency_s"] = entry["latency_s"] / entry["calls"] if entry["calls"] else 0.0
+        entry["cost_usd"] = estimate_model_cost(entry["model"], entry["input_tokens"], entry["output_tokens"])
+    return sorted(summary.values(), key=lambda entry: entry["latency_s"], reverse=True)
+
+# --- Antwort-Cache für Modellaufrufe (ResponseCache in workflow_storage.py) ---
+def _is_cacheable_response(response: Any) -> bool:
+    candidates = getattr(response, "candidates", None)
+    return bool(candidates and candidates[0].content and candidates[0].content.parts)
+
+def agent_uses_response_cache(agent_conf: Dict[str, Any]) -> bool:
+    """
+    Ob die Modellantworten eines Agenten aus dem Antwort-Cache bedient werden dürfen. Agenten mit temperature > 0
+    antworten bewusst nicht-deterministisch und werden standardmäßig nicht gecacht; "cache_responses" überschreibt das.
+    """
+    if agent_conf.get("cache_responses") is not None:
+        return agent_conf["cache_responses"] is not False
+    try:
+        return float(agent_conf.get("temperature") or 0) <= 0
+    except (TypeError, ValueError):
+        return True  # Ungültige Temperatur: Das Modell nutzt seinen Standard, wie ohne Angabe
+
+def response_cache(func: Callable) -> Callable:
+    """
+    Decorator, der Modellantworten über den Antwort-Cache bedient, bevor der Rate-Limiter greift.
+    Mit dem Keyword-Argument use_cache=False wird der Cache für einen Aufruf umgangen (z.B. pro Agent),
+    ebenso für Backends mit cacheable=False. Antworten des Ausweichmodells werden nicht unter dem Schlüssel des
+    angefragten Modells gespeichert. Jeder Aufruf wird als Span der Kategorie 'model' gemessen
+    (inklusive Cache-Zugriff, Wiederholungen und Wartezeit im Rate-Limiter). Bei einem Treffer erhält ein
+    übergebenes on_chunk (Streaming) die gecachte Antwort einmal vollständig nach 0 Sekunden.
+    """
+    if inspect.iscoroutinefunction(func):
+        async def async_wrapper(*args, use_cache: bool = True, **kwargs):
+            with trace_span(func.__name__, "model", model=kwargs["model"], cache_hit=False, retries=0) as span:
+                response = None
+                use_cache = use_cache and as_model_backend(kwargs["client"]).cacheable
+                if use_cache:
+                    key = ResponseCache.make_key(kwargs["model"], kwargs["contents"], kwargs.get("config"))
+                    response = await asyncio.to_thread(get_response_cache().get, key)
+                    span.attributes["cache_hit"] = response is not None
+                    if response is not None and kwargs.get("on_chunk"):
+                        parts = _get_response_parts(response)
+                        kwargs["on_chunk"]("".join(part.text for part in parts if part.text and not part.thought), 0.0,
+                                           [part.function_call.name for part in parts if part.function_call])
+                if response is None:
+                    response = await func(*args, **kwargs)
+                    if use_cache and _is_cacheable_response(response) and "model_used" not in span.attributes:
+                        await asyncio.to_thread(get_response_cache().put, key, response)
+                span.attributes["input_tokens"], span.attributes["output_tokens"] = get_usage_token_counts(response)
+                return response
+        return async_wrapper
+
+    def wrapper(*args, use_cache: bool = True, **kwargs):
+        with trace_span(func.__name__, "model", model=kwargs["model"], cache_hit=False, retries=0) as span:
+            response = None
+            use_cache = use_cache and as_model_backend(kwargs["client"]).cacheable
+            if use_cache:
+                key = ResponseCache.make_key(kwargs["model"], kwargs["contents"], kwargs.get("config"))
+                response = get_response_cache().get(key)
+                span.attributes["cache_hit"] = response is not None
+            if response is None:
+                response = func(*args, **kwargs)
+                if use_cache and _is_cacheable_response(response) and "model_used" not in span.attributes:
+                    get_response_cache().put(key, response)
+            span.attributes["input_tokens"], span.attributes["output_tokens"] = get_usage_token_counts(response)
+            return response
+    return wrapper
+
+# --- Modell-Backends ---
+class ModelBackend:
+    """
+    Schnittstelle der Engine zur Modell-API: limited_generate_content und seine async-/Streaming-Varianten rufen nur
+    diese Methoden auf. GenaiBackend leitet an google.genai weiter, mock_model_backend.MockModelBackend antwortet
+    lokal und offline. Antworten von Backends mit cacheable=False landen nicht im Antwort-Cache.
+    """
+    cacheable = True
+
+    def generate_content(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> GenerateContentResponse:
+        raise NotImplementedError
+
+    async def generate_content_async(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> GenerateContentResponse:
+        raise NotImplementedError
+
+    def generate_content_stream_async(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> AsyncIterator[GenerateContentResponse]:
+        raise NotImplementedError
+
+    async def count_tokens_async(self, model: str, contents: List[Union[Part, Content]]) -> int | None:
+        return None
+
+class GenaiBackend(ModelBackend):
+    """Standard-Backend über einen google.genai.Client."""
+    def __init__(self, client: genai.Client):
+        self.client = client
+
+    def generate_content(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> GenerateContentResponse:
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    async def generate_content_async(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> GenerateContentResponse:
+        return await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+    async def generate_content_stream_async(self, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> AsyncIterator[GenerateContentResponse]:
+        async for chunk in await self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config):
+            yield chunk
+
+    async def count_tokens_async(self, model: str, contents: List[Union[Part, Content]]) -> int | None:
+        result = await self.client.aio.models.count_tokens(model=model, contents=contents)
+        return getattr(result, "total_tokens", None)
+
+ModelClient = Union[genai.Client, ModelBackend]
+
+def as_model_backend(client: ModelClient) -> ModelBackend:
+    """Liefert das Backend zu einem Client; Aufrufer können weiterhin direkt einen genai.Client übergeben."""
+    return client if isinstance(client, ModelBackend) else GenaiBackend(client)
+
+# API Call Wrapper
+@response_cache
+@model_retry
+@rpm_limiter
+def limited_generate_content(client: ModelClient, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> Any:
+    """
+    Wrapper um den API-Aufruf an das Gemini Modell zu rate-limiten.
+    """
+    return as_model_backend(client).generate_content(model=model, contents=contents, config=config)
+
+@response_cache
+@model_retry
+@rpm_limiter
+async def limited_generate_content_async(client: ModelClient, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig) -> Any:
+    """
+    Asynchrones Gegenstück zu limited_generate_content über die async-API des Backends.
+    """
+    return await as_model_backend(client).generate_content_async(model=model, contents=contents, config=config)
+
+@response_cache
+@model_retry
+@rpm_limiter
+async def limited_generate_content_stream_async(client: ModelClient, model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig, on_chunk: Union[Callable[[str, float, List[str]], None], None] = None) -> Any:
+    """
+    Streaming-Variante von limited_generate_content_async. Für jeden eintreffenden Chunk wird
+    on_chunk(bisheriger Text, Sekunden seit Absenden der Anfrage, erkannte Function-Call-Namen) aufgerufen;
+    der erste Aufruf liefert damit die Time-to-first-Token. Zurückgegeben wird eine zusammengeführte Antwort,
+    die sich für den Tool-Loop wie eine Antwort von generate_content verhält.
+    """
+    request_start = time.perf_counter()
+    chunks: List[GenerateContentResponse] = []
+    streamed_text = ""
+    function_call_names: List[str] = []
+    async for chunk in as_model_backend(client).generate_content_stream_async(model=model, contents=contents, config=config):
+        chunks.append(chunk)
+        for part in _get_response_parts(chunk):
+            if part.function_call:
+                function_call_names.append(part.function_call.name)
+            elif part.text and not part.thought:
+                streamed_text += part.text
+        if on_chunk:
+            on_chunk(streamed_text, time.perf_counter() - request_start, function_call_names)
+    return merge_stream_chunks(chunks)
+
+def _get_response_parts(response: Any) -> List[Part]:
+    candidates = getattr(response, "candidates", None)
+    if candidates and candidates[0].content and candidates[0].content.parts:
+        return candidates[0].content.parts
+    return []
+
+def merge_stream_chunks(chunks: List[GenerateContentResponse]) -> GenerateContentResponse:
+    """
+    Führt gestreamte Chunks zu einer Antwort zusammen: aufeinanderfolgende Text-Parts werden verkettet,
+    Function Calls bleiben als eigene Parts erhalten; Metadaten stammen aus dem letzten Chunk.
+    """
+    merged_parts: List[Part] = []
+    last_candidate = None
+    prompt_feedback = None
+    for chunk in chunks:
+        prompt_feedback = prompt_feedback or chunk.prompt_feedback
+        if chunk.candidates:
+            last_candidate = chunk.candidates[0]
+        for part in _get_response_parts(chunk):
+            is_plain_text = part.text is not None and not part.thought and part.function_call is None
+            if is_plain_text and merged_parts and merged_parts[-1].text is not None and not merged_parts[-1].thought:
+                merged_parts[-1] = Part(text=merged_parts[-1].text + part.text)
+            else:
+                merged_parts.append(part)
+    candidates = []
+    if last_candidate is not None:
+        candidates = [last_candidate.model_copy(update={"content": Content(role="model", parts=merged_parts)})]
+    return GenerateContentResponse(
+        candidates=candidates,
+        prompt_feedback=prompt_feedback,
+        usage_metadata=chunks[-1].usage_metadata if chunks else None,
+    )
+
+# --- Konfigurations- und Hilfsfunktionen ---
+def _report(messages: Optional[List[Tuple[str, str]]], level: str, text: str) -> None:
+    """Meldet eine Nachricht über die Callbacks des Laufs oder sammelt sie, falls eine Liste übergeben wird."""
+    if messages is None:
+        notify(level, text)
+    else:
+        messages.append((level, text))
+
+def load_agent_config(file_path: str, is_generator_config: bool = False, messages: Optional[List[Tuple[str, str]]] = None) -> Union[List[Dict[str, Any]], None]:
+    """
+    Lädt eine Agentenkonfiguration aus einer JSON-Datei und sortiert diese nach 'round'.
+    """
+    if not file_path or not os.path.exists(file_path):
+        error_key = f"error_config_not_found_{file_path}"
+        state = run_state()
+        if error_key not in state:
+            notify("error", f"❌ Konfigurationsdatei '{file_path or 'Kein Pfad angegeben'}' nicht gefunden.")
+            state[error_key] = True
+        return None
+    error_key = f"error_config_not_found_{file_path}"
+    state = run_state()
+    if error_key in state:
+        del state[error_key]
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            config_data = json.load(f)
+        if not isinstance(config_data, list):
+            _report(messages, "error", f"❌ Fehler: Konfigurationsdatei '{file_path}' enthält keine Liste von Agenten.")
+            return None
+        if not is_generator_config:
+            try:
+                config_data.sort(key=lambda x: x.get('round', float('inf')))
+            except TypeError:
+                _report(messages, "error", f"❌ Fehler beim Sortieren der Agenten in '{file_path}'. Stellen Sie sicher, dass 'round' eine Zahl ist.")
+                return None
+        return config_data
+    except json.JSONDecodeError as e:
+        _report(messages, "error", f"❌ Fehler beim Parsen der JSON-Datei '{file_path}': {e}")
+        return None
+    except Exception as e:
+        _report(messages, "error", f"❌ Unbekannter Fehler beim Laden der Konfiguration '{file_path}': {e}")
+        _report(messages, "error", traceback.format_exc())
+        return None
+
+def validate_config_list(config_list: List[Dict[str, Any]], source_description: str = "Konfiguration", messages: Optional[List[Tuple[str, str]]] = None) -> Union[List[Dict[str, Any]], None]:
+    """
+    Validiert eine Liste von Agenten-Dictionaries mittels Pattern Matching.
+    """
+    if not config_list:
+        _report(messages, "error", f"❌ Fehler: Die übergebene {source_description} ist leer.")
+        return None
+    valid_config_found = False
+    validated_agents: List[Dict[str, Any]] = []
+    any_invalid = False
+    for agent_dict in config_list:
+        if not isinstance(agent_dict, dict):
+            _report(messages, "warning", f"Überspringe Eintrag in '{source_description}', da es kein Dictionary ist: {agent_dict}")
+            any_invalid = True
+            continue
+        match agent_dict:
+            case { "name": str(), "round": int(), "system_instruction": str(), **other_keys }:
+                validated_agents.append(agent_dict)
+                valid_config_found = True
+            case _:
+                _report(messages, "warning", f"Agent '{agent_dict.get('name', 'Unbekannt')}' in '{source_description}' hat eine ungültige Struktur. Agent wird ignoriert.")
+                any_invalid = True
+    if any_invalid:
+         _report(messages, "warning", f"⚠️ Mindestens ein Agent in '{source_description}' war ungültig und wurde ignoriert.")
+    if not valid_config_found:
+         _report(messages, "error", f"❌ Keine validen Agenten in '{source_description}' gefunden.")
+         return None
+    try:
+        validated_agents.sort(key=lambda x: x.get('round', float('inf')))
+    except TypeError:
+       _report(messages, "error", f"❌ Fehler beim Sortieren der validierten Agenten aus '{source_description}'.")
+       return None
+    return validated_agents
+
+def get_grounding_info(candidate: Any) -> Union[str, None]:
+    """
+    Extrahiert Grounding-Informationen (Websuche) aus einem API-Antwort-Kandidaten.
+    """
+    try:
+        grounding = getattr(candidate, "grounding_metadata", None)
+        if grounding:
+            search_entry_point = getattr(grounding, "search_entry_point", None)
+            if search_entry_point:
+                 uri = getattr(search_entry_point, "uri", None) or getattr(search_entry_point, "rendered_content", None)
+                 if uri: 
+                     return f"Quelle (URI): {uri}"
+            web_search_queries = getattr(grounding, "web_search_queries", None)
+            if web_search_queries:
+                 titles = [q.display_title for q in web_search_queries if hasattr(q, 'display_title') and q.display_title]
+                 if titles: 
+                     return f"Suchanfragen verwendet: {', '.join(titles)}"
+                 else: 
+                     return "Websuche wurde verwendet (keine spezifischen Titel)."
+    except AttributeError:
+        pass
+    except Exception as e:
+        notify("warning", f"⚠️ Fehler beim Extrahieren der Grounding-Infos: {e}")
+    return None
+
+def parse_generator_output(response_text: str) -> tuple[Union[List[Dict[str, Any]], None], Union[str, None]]:
+    """
+    Extrahiert eine JSON-Liste für Agentenkonfigurationen aus dem Antworttext des Generators.
+    """
+    try:
+        cleaned_text = response_text.strip()
+        if cleaned_text.startswith("```json"):
+            cleaned_text = cleaned_text[7:].strip()
+        elif cleaned_text.startswith("```"):
+             cleaned_text = cleaned_text[3:].strip()
+        if cleaned_text.endswith("```"):
+            cleaned_text = cleaned_text[:-3].strip()
+        config_list = json.loads(cleaned_text)
+        if not isinstance(config_list, list):
+            return None, "Generator-Antwort ist keine JSON-Liste."
+        if not all(isinstance(item, dict) for item in config_list):
+             first_bad_item = next((item for item in config_list if not isinstance(item, dict)), None)
+             return None, f"Generator-Liste enthält Elemente, die keine Dictionaries sind (z.B.: {str(first_bad_item)[:100]}...).'"
+        return config_list, None
+    except json.JSONDecodeError as e:
+        error_msg = f"Generator-Antwort ist kein valides JSON: {e}\n\nEmpfangener Text (Anfang):\n```\n{response_text[:500]}...\n```"
+        return None, error_msg
+    except Exception as e:
+         return None, f"Unerwarteter Fehler beim Parsen der Generator-Antwort: {e}"
+
+# --- Workflow-Generator (strukturierte Ausgabe, parallele Kandidaten) ---
+# Antwortschema des Generators: eine Liste von Agenten in der Struktur der Workflow-Konfigurationen.
+GENERATED_WORKFLOW_SCHEMA = Schema(
+    type=Type.ARRAY,
+    min_items=1,
+    items=Schema(
+        type=Type.OBJECT,
+        properties={
+            "name": Schema(type=Type.STRING, description="Eindeutiger Agentenname ohne Leerzeichen"),
+            "description": Schema(type=Type.STRING),
+            "round": Schema(type=Type.INTEGER, minimum=1),
+            "system_instruction": Schema(type=Type.STRING),
+            "receives_messages_from": Schema(type=Type.ARRAY, items=Schema(type=Type.STRING), description="Namen der Agenten, deren Ergebnis dieser Agent erhält"),
+            "callable_tools": Schema(type=Type.ARRAY, items=Schema(type=Type.STRING, enum=sorted(TOOL_REGISTRY))),
+            "accepts_files": Schema(type=Type.BOOLEAN),
+            "enable_web_search": Schema(type=Type.BOOLEAN),
+            "temperature": Schema(type=Type.NUMBER, minimum=0, maximum=1),
+            "model_policy": Schema(type=Type.STRING, enum=list(MODEL_POLICIES), description="fast für einfache Schritte (Planen, Verpacken), quality für anspruchsvolle"),
+        },
+        required=["name", "round", "system_instruction", "receives_messages_from", "callable_tools"],
+        property_ordering=["name", "description", "round", "system_instruction", "receives_messages_from", "callable_tools", "accepts_files", "enable_web_search", "temperature", "model_policy"],
+    ),
+)
+
+def check_generated_config(config_list: List[Dict[str, Any]]) -> tuple[Union[List[Dict[str, Any]], None], Union[str, None], List[Tuple[str, str]]]:
+    """
+    Prüft eine generierte Konfiguration wie eine geladene (validate_config_list) und zusätzlich ihren
+    Abhängigkeitsgraphen. Liefert (validierte Agenten, Fehler, Meldungen der Validierung).
+    """
+    messages: List[Tuple[str, str]] = []
+    validated_config = validate_config_list(config_list, "generierter Konfiguration", messages=messages)
+    if validated_config is None:
+        return None, " ".join(text for level, text in messages if level == "error") or "Keine validen Agenten.", messages
+    _, graph_error = build_dependency_graph(validated_config)
+    if graph_error:
+        return None, f"Ungültiger Abhängigkeitsgraph: {graph_error}", messages
+    return validated_config, None, messages
+
+async def generate_workflow_config_async(client: ModelClient, model_id: str, generator_agent_conf: Dict[str, Any], input_parts: List[Part], candidate_count: int = GENERATOR_CANDIDATES, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Erzeugt eine Workflow-Konfiguration im JSON-Modus mit GENERATED_WORKFLOW_SCHEMA. Es werden 'candidate_count'
+    Kandidaten gleichzeitig angefragt (je eigener Seed, daher auch einzeln cachebar); der erste, der validiert und einen
+    azyklischen Graphen bildet, gewinnt, die übrigen Anfragen werden abgebrochen. Das Ergebnis enthält 'config'
+    (None, wenn kein Kandidat gültig war), den Antworttext 'output', die Nummer des Kandidaten, die Fehler der
+    verworfenen Kandidaten, die Meldungen der Validierung und die summierten Tokens der beantworteten Anfragen.
+    Der Antwort-Cache gilt wie bei Agenten nur, wenn use_cache gesetzt ist und agent_uses_response_cache zustimmt
+    (bei temperature > 0 also nur mit "cache_responses": true), damit "erneut generieren" neue Workflows liefert.
+    """
+    generator_name = generator_agent_conf.get("name", "WorkflowGenerator")
+    base_config = GenerateContentConfig(
+        temperature=float(generator_agent_conf.get("temperature", 0.5)),
+        response_mime_type="application/json",
+        response_schema=GENERATED_WORKFLOW_SCHEMA,
+    )
+    use_cache = use_cache and agent_uses_response_cache({**generator_agent_conf, "temperature": base_config.temperature})
+
+    async def sample_candidate(candidate_index: int) -> Dict[str, Any]:
+        candidate = {"index": candidate_index, "output": "", "config": None, "error": None, "messages": [], "input_tokens": 0, "output_tokens": 0}
+        with trace_span(f"Kandidat {candidate_index + 1}", "generator", agent=generator_name, candidate=candidate_index + 1) as span:
+            try:
+                response = await limited_generate_content_async(client=client, model=f"models/{model_id}", contents=input_parts,
+                                                                config=base_config.model_copy(update={"seed": candidate_index}), use_cache=use_cache)
+            except Exception as e:
+                candidate["error"] = f"Anfrage fehlgeschlagen: {e}"
+                span.attributes["status"] = "Fehler"
+                return candidate
+            prompt_token_count, output_token_count = get_usage_token_counts(response)
+            candidate["input_tokens"] = prompt_token_count if prompt_token_count is not None else estimate_token_count(input_parts)
+            candidate["output_tokens"] = output_token_count or 0
+            candidate["output"] = "".join(part.text for part in _get_response_parts(response) if getattr(part, "text", None)).strip()
+            if not candidate["output"]:
+                feedback = getattr(response, "prompt_feedback", None)
+                candidate["error"] = f"Leere Antwort (Grund: {getattr(feedback, 'block_reason', None) or 'Unbekannt'})."
+            else:
+                config_list, parse_error = parse_generator_output(candidate["output"])
+                if parse_error:
+                    candidate["error"] = parse_error
+                else:
+                    candidate["config"], candidate["error"], candidate["messages"] = check_generated_config(config_list)
+            span.attributes["status"] = "OK" if candidate["config"] else "Verworfen"
+            return candidate
+
+    result = {"config": None, "output": "", "candidate": None, "candidate_count": candidate_count, "errors": [], "messages": [], "input_tokens": 0, "output_tokens": 0}
+    tasks = [asyncio.create_task(sample_candidate(candidate_index)) for candidate_index in range(max(1, candidate_count))]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            candidate = await finished
+            result["input_tokens"] += candidate["input_tokens"]
+            result["output_tokens"] += candidate["output_tokens"]
+            if candidate["config"] is not None:
+                result.update(config=candidate["config"], output=candidate["output"], candidate=candidate["index"] + 1, messages=candidate["messages"])
+                break
+            result["errors"].append(f"Kandidat {candidate['index'] + 1}: {candidate['error']}")
+            result["output"] = result["output"] or candidate["output"]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return result
+
+def generate_workflow_config(client: ModelClient, model_id: str, generator_agent_conf: Dict[str, Any], input_parts: List[Part], candidate_count: int = GENERATOR_CANDIDATES, use_cache: bool = True) -> Dict[str, Any]:
+    """Synchrone Variante von generate_workflow_config_async mit eigener Event-Loop."""
+    return asyncio.run(generate_workflow_config_async(client, model_id, generator_agent_conf, input_parts, candidate_count, use_cache))
+
+# --- Neue Funktion: Auto-Save der generierten Agenten-JSON ---
+def save_generated_config(config: List[dict], base_name: str = "generated_workflow") -> str:
+    """
+    Speichert die durch den Generator erstellte JSON-Konfiguration automatisch im Verzeichnis 'generated_configs'.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M")
+    directory = "generated_configs"
+    os.makedirs(directory, exist_ok=True)  # Erstelle das Verzeichnis, falls es nicht existiert
+    filename = f"{base_name}_{timestamp}.json"
+    full_path = os.path.join(directory, filename)
+    try:
+        with open(full_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        return f"✅ Workflow gespeichert unter: `{full_path}`"
+    except Exception as e:
+        return f"❌ Fehler beim Speichern: {e}"
+
+# --- Prompt-Zusammenstellung mit Token-Budget ---
+def trim_text_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Kürzt Text auf höchstens max_tokens Tokens (lokale Schätzung, inklusive Kürzungshinweis); Anfang (2/3) und
+    Ende (1/3) bleiben erhalten.
+    """
+    removed_tokens = estimate_text_tokens(text) - max_tokens
+    if removed_tokens <= 0:
+        return text
+    marker = f"\n[... ca. {removed_tokens} Tokens gekürzt ...]\n"
+    max_chars = max(max_tokens * CHARS_PER_TOKEN - len(marker), 0)
+    head_chars = max_chars * 2 // 3
+    tail_chars = max_chars - head_chars
+    tail = text[-tail_chars:] if tail_chars > 0 else ""
+    return f"{text[:head_chars]}{marker}{tail}"
+
+class PromptAssembler:
+    """
+    Sammelt die Eingabe eines Agenten als benannte Segmente und zählt deren Tokens. Systemanweisung, Nutzeranfrage
+    und Bilder sind fest; Dateien und Vorgänger-Ergebnisse sind kürzbar. Überschreitet die Eingabe das Token-Budget,
+    werden alle kürzbaren Segmente anteilig zu ihrer Größe gekürzt (Anfang und Ende bleiben erhalten).
+    """
+    def __init__(self, token_budget: int | None = None):
+        self.token_budget = token_budget if token_budget and token_budget > 0 else None
+        self.segments: List[Dict[str, Any]] = []
+        self.token_scale = 1.0  # Korrekturfaktor der lokalen Schätzung (siehe calibrate)
+
+    def add_text(self, label: str, text: str, trimmable: bool = False, header: str = "", footer: str = "", new_part: bool = True) -> None:
+        """Fügt Text hinzu; mit new_part=False wird er an den Text des vorherigen Parts angehängt."""
+        self.segments.append({"label": label, "header": header, "text": text, "footer": footer, "trimmable": trimmable, "new_part": new_part, "part": None})
+
+    def add_part(self, label: str, part: Part, tokens: int) -> None:
+        """Fügt einen nicht kürzbaren Nicht-Text-Part (z.B. ein Bild) mit pauschaler Token-Zahl hinzu."""
+        self.segments.append({"label": label, "part": part, "tokens": tokens, "trimmable": False, "new_part": True})
+
+    def segment_tokens(self, segment: Dict[str, Any], text: str | None = None) -> int:
+        if segment["part"] is not None:
+            return segment["tokens"]
+        text = segment["text"] if text is None else text
+        return int(estimate_text_tokens(segment["header"] + text + segment["footer"]) * self.token_scale)
+
+    def estimated_tokens(self) -> int:
+        return sum(self.segment_tokens(segment) for segment in self.segments)
+
+    def calibrate(self, counted_tokens: int | None) -> None:
+        """Gleicht die lokale Schätzung an eine exakte Zählung (count_tokens der API) des ungekürzten Prompts an."""
+        estimated = self.estimated_tokens()
+        if counted_tokens and estimated:
+            self.token_scale = counted_tokens / estimated
+
+    def _fit_to_budget(self) -> Dict[int, str]:
+        """Berechnet die gekürzten Texte der kürzbaren Segmente (Index -> Text), falls das Budget überschritten ist."""
+        tokens = [self.segment_tokens(segment) for segment in self.segments]
+        if self.token_budget is None or sum(tokens) <= self.token_budget:
+            return {}
+        # Segmente unterhalb der Mindestgröße werden nicht gekürzt und zählen wie feste Segmente
+        trimmable = [index for index, segment in enumerate(self.segments) if segment["trimmable"] and tokens[index] > MIN_TRIMMED_SEGMENT_TOKENS]
+        trimmable_tokens = sum(tokens[index] for index in trimmable)
+        available = self.token_budget - (sum(tokens) - trimmable_tokens)
+        ratio = max(available, 0) / trimmable_tokens if trimmable_tokens else 0.0
+        trimmed_texts = {}
+        for index in trimmable:
+            segment = self.segments[index]
+            overhead = self.segment_tokens(segment, "")
+            target = max(int(tokens[index] * ratio), MIN_TRIMMED_SEGMENT_TOKENS) - overhead
+            if target < tokens[index] - overhead:
+                trimmed_texts[index] = trim_text_to_tokens(segment["text"], max(int(target / self.token_scale), 1))
+        return trimmed_texts
+
+    def build(self, trim: bool = True) -> tuple[List[Part], Dict[str, Any]]:
+        """Gibt die Parts und einen Bericht (Tokens vorher/nachher, Budget, Tokens pro Segment) zurück."""
+        tokens_before = self.estimated_tokens()
+        trimmed_texts = self._fit_to_budget() if trim else {}
+        parts: List[Part] = []
+        pending_text: str | None = None
+        segment_report = []
+        for index, segment in enumerate(self.segments):
+            if segment["part"] is not None:
+                if pending_text is not None:
+                    parts.append(Part(text=pending_text))
+                    pending_text = None
+                parts.append(segment["part"])
+                segment_report.append({"label": segment["label"], "tokens": segment["tokens"], "trimmed": False})
+                continue
+            text = trimmed_texts.get(index, segment["text"])
+            full_text = segment["header"] + text + segment["footer"]
+            if segment["new_part"] or pending_text is None:
+                if pending_text is not None:
+                    parts.append(Part(text=pending_text))
+                pending_text = full_text
+            else:
+                pending_text += full_text
+            segment_report.append({"label": segment["label"], "tokens": self.segment_tokens(segment, text), "trimmed": index in trimmed_texts})
+        if pending_text is not None:
+            parts.append(Part(text=pending_text))
+        tokens_after = sum(entry["tokens"] for entry in segment_report)
+        return parts, {"budget": self.token_budget, "tokens_before": tokens_before, "tokens_after": tokens_after, "segments": segment_report}
+
+async def count_prompt_tokens(client: ModelClient, model: str, parts: List[Part]) -> int | None:
+    """
+    Zählt die Tokens eines Prompts exakt über die count_tokens-API; None, wenn die Zählung fehlschlägt (dann gilt
+    still die lokale Schätzung, der Fehler steht nur als Attribut 'count_tokens_error' am offenen Span).
+    """
+    try:
+        return await as_model_backend(client).count_tokens_async(model=model, contents=[Content(role="user", parts=parts)])
+    except Exception as e:
+        set_span_attributes(count_tokens_error=str(e) or type(e).__name__)
+        return None
+
+# --- Agenten-Ausführung (Abhängigkeitsgraph & paralleler Scheduler) ---
+def build_dependency_graph(agents: List[Dict[str, Any]]) -> tuple[Union[Dict[str, List[str]], None], Union[str, None]]:
+    """
+    Baut aus den 'receives_messages_from'-Feldern einen Abhängigkeitsgraphen (Agent -> Quell-Agenten)
+    und prüft ihn vor jedem API-Aufruf auf doppelte Namen, fehlende Quellen und Zyklen.
+    """
+    dependencies: Dict[str, List[str]] = {}
+    for agent_index, agent_conf in enumerate(agents):
+        agent_name = agent_conf.get("name", f"Agent_{agent_index+1}")
+        if agent_name in dependencies:
+            return None, f"Agentenname '{agent_name}' ist mehrfach vergeben."
+        receives_from = agent_conf.get("receives_messages_from") or []
+        if not isinstance(receives_from, list) or not all(isinstance(source, str) for source in receives_from):
+            return None, f"'receives_messages_from' von '{agent_name}' ist keine Liste von Agentennamen."
+        dependencies[agent_name] = list(dict.fromkeys(receives_from))
+    for agent_name, sources in dependencies.items():
+        missing_sources = [source for source in sources if source not in dependencies]
+        if missing_sources:
+            return None, f"Agent '{agent_name}' erwartet Input von unbekannten Agenten: {', '.join(missing_sources)}."
+    # Kahn-Algorithmus: Bleiben Agenten übrig, die nie abhängigkeitsfrei werden, liegt ein Zyklus vor.
+    remaining = {agent_name: len(sources) for agent_name, sources in dependencies.items()}
+    ready = [agent_name for agent_name, count in remaining.items() if count == 0]
+    resolved_count = 0
+    while ready:
+        current = ready.pop()
+        resolved_count += 1
+        for agent_name, sources in dependencies.items():
+            if current in sources:
+                remaining[agent_name] -= 1
+                if remaining[agent_name] == 0:
+                    ready.append(agent_name)
+    if resolved_count < len(dependencies):
+        cyclic_agents = [agent_name for agent_name, count in remaining.items() if count > 0]
+        return None, f"Zyklische Abhängigkeit zwischen den Agenten: {', '.join(cyclic_agents)}."
+    return dependencies, None
+
+def agent_tool_names(agent_conf: Dict[str, Any]) -> List[str]:
+    """Namen der Tools eines Agenten: 'callable_tools' plus custom_google_search bei 'enable_web_search'."""
+    tool_names = list(agent_conf.get("callable_tools") or [])
+    if agent_conf.get("enable_web_search", False):
+        tool_names.append("custom_google_search")
+    return tool_names
+
+def build_agent_generation_config(agent_conf: Dict[str, Any], messages: Optional[List[Tuple[str, str]]] = None) -> GenerateContentConfig:
+    """Erzeugt die GenerateContentConfig eines Agenten (Temperatur und gemerktes Tool-Bundle)."""
+    gen_config_args = {}
+    temperature = agent_conf.get("temperature")
+    if temperature is not None:
+         try:
+             gen_config_args["temperature"] = float(temperature)
+         except ValueError:
+             _report(messages, "warning", f"Ungültiger Temperaturwert '{temperature}' für Agent '{agent_conf.get('name')}'. Verwende Standard.")
+    agent_tool_bundle = get_tool_bundle(tuple(agent_tool_names(agent_conf)))
+    if agent_tool_bundle:
+        gen_config_args["tools"] = [agent_tool_bundle]
+    return GenerateContentConfig(**gen_config_args)
+
+def build_system_prompt(workflow_name: str, agent_name: str, agent_conf: Dict[str, Any]) -> str:
+    return f"System Anweisung ({workflow_name} - Rolle: {agent_name}):\n{agent_conf.get('system_instruction', '-')}\n---"
+
+class WorkflowPlan:
+    """
+    Vorbereiteter Workflow: validierte Agenten, geprüfter Abhängigkeitsgraph und je Agent Systemprompt,
+    GenerateContentConfig (inkl. Tool-Bundle) und unbekannte Tool-Namen. Meldungen aus Laden und Validierung
+    werden gespeichert, damit sie auch bei wiederverwendetem Plan angezeigt werden können.
+    """
+    def __init__(self, workflow_name: str, agents: Union[List[Dict[str, Any]], None], messages: List[Tuple[str, str]], content_hash: Optional[str] = None):
+        self.workflow_name = workflow_name
+        self.agents = agents or []
+        self.messages = messages
+        self.content_hash = content_hash
+        self.file_stat: Optional[Tuple[int, int]] = None
+        self.dependencies, self.graph_error = build_dependency_graph(self.agents) if self.agents else ({}, None)
+        self.system_prompts: Dict[str, str] = {}
+        self.generation_configs: Dict[str, GenerateContentConfig] = {}
+        self.unknown_tools: Dict[str, List[str]] = {}
+        for agent_index, agent_conf in enumerate(self.agents):
+            agent_name = agent_conf.get("name", f"Agent_{agent_index+1}")
+            self.system_prompts[agent_name] = build_system_prompt(workflow_name, agent_name, agent_conf)
+            self.generation_configs[agent_name] = build_agent_generation_config(agent_conf, messages)
+            self.unknown_tools[agent_name] = [tool_name for tool_name in agent_tool_names(agent_conf) if tool_name not in TOOL_REGISTRY]
+            if agent_conf.get("model_policy") and agent_conf["model_policy"] not in MODEL_POLICIES:
+                _report(messages, "warning", f"Unbekannte model_policy '{agent_conf['model_policy']}' für Agent '{agent_name}' (erlaubt: {', '.join(MODEL_POLICIES)}). Verwende das Modell des Laufs.")
+
+    def show_messages(self) -> None:
+        for level, text in self.messages:
+            notify(level, text)
+
+_WORKFLOW_PLAN_CACHE: Dict[Tuple[str, str, bool], WorkflowPlan] = {}
+_WORKFLOW_PLAN_LOCK = threading.Lock()
+
+def get_workflow_plan(file_path: str, workflow_name: str, is_generator_config: bool = False, show_messages: bool = True) -> Union[WorkflowPlan, None]:
+    """
+    Liefert den kompilierten Plan einer Konfigurationsdatei. Der Plan wird prozessweit pro Pfad gecacht und nur
+    neu erstellt, wenn sich Änderungszeit/Größe und zusätzlich der SHA-256 des Inhalts geändert haben.
+    Gibt None zurück, wenn die Datei fehlt oder keine validen Agenten enthält.
+    """
+    try:
+        file_stat = os.stat(file_path)
+    except (OSError, TypeError):
+        load_agent_config(file_path, is_generator_config)  # Zeigt die Meldung 'nicht gefunden' an
+        return None
+    stat_key = (file_stat.st_mtime_ns, file_stat.st_size)
+    cache_key = (os.path.abspath(file_path), workflow_name, is_generator_config)
+    with _WORKFLOW_PLAN_LOCK:
+        plan = _WORKFLOW_PLAN_CACHE.get(cache_key)
+        if plan is None or plan.file_stat != stat_key:
+            with open(file_path, 'rb') as f:
+                content_hash = hashlib.sha256(f.read()).hexdigest()
+            if plan is None or plan.content_hash != content_hash:
+                messages: List[Tuple[str, str]] = []
+                config_list = load_agent_config(file_path, is_generator_config, messages=messages)
+                agents = validate_config_list(config_list, f"'{file_path}'", messages=messages) if config_list else None
+                plan = WorkflowPlan(workflow_name, agents, messages, content_hash)
+                _WORKFLOW_PLAN_CACHE[cache_key] = plan
+            plan.file_stat = stat_key
+    if show_messages:
+        plan.show_messages()
+    return plan if plan.agents else None
+
+async def run_agents_dag(agents: List[Dict[str, Any]], dependencies: Dict[str, List[str]], run_agent_fn: Callable[[Dict[str, Any], int], Awaitable[bool]], max_parallel: int = 4, on_progress: Union[Callable[[List[str], int, int], None], None] = None) -> bool:
+    """
+    Führt die Agenten gemäß Abhängigkeitsgraph aus: Jeder Agent, dessen Quellen abgeschlossen sind, startet sofort,
+    wobei höchstens 'max_parallel' Agenten gleichzeitig laufen. Gibt zurück, ob alle Agenten erfolgreich waren.
+    Den Thread-Pool für Tool-Aufrufe legt der Aufrufer fest (siehe run_workflow).
+    """
+    agent_names = [agent_conf.get("name", f"Agent_{agent_index+1}") for agent_index, agent_conf in enumerate(agents)]
+    open_sources = {agent_name: set(dependencies.get(agent_name, [])) for agent_name in agent_names}
+    running: Dict[asyncio.Task, str] = {}
+    started: set[str] = set()
+    finished_count = 0
+    overall_success = True
+
+    def start_ready_agents() -> None:
+        for agent_index, agent_name in enumerate(agent_names):
+            if len(running) >= max_parallel:
+                break
+            if agent_name not in started and not open_sources[agent_name]:
+                started.add(agent_name)
+                running[asyncio.create_task(run_agent_fn(agents[agent_index], agent_index))] = agent_name
+
+    start_ready_agents()
+    while running:
+        if on_progress:
+            on_progress(list(running.values()), finished_count, len(agent_names))
+        done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            finished_name = running.pop(task)
+            finished_count += 1
+            try:
+                overall_success = task.result() and overall_success
+            except Exception as e:
+                notify("error", f"❌ Unerwarteter Fehler bei '{finished_name}': {e}")
+                notify("error", traceback.format_exc())
+                overall_success = False
+            for sources in open_sources.values():
+                sources.discard(finished_name)
+        start_ready_agents()
+    return overall_success
+
+def compute_agent_fingerprint(agent_conf: Dict[str, Any], source_fingerprints: Dict[str, Union[str, None]], question: str, model_id: str, workflow_name: str) -> str:
+    """
+    Bildet einen Fingerabdruck der effektiven Eingaben eines Agenten: Konfigurationseintrag, Nutzeranfrage,
+    Hashes der hochgeladenen Dateien, Modell sowie die Fingerabdrücke der Quell-Agenten (None = Quelle ohne Ergebnis).
+    Über die Quell-Fingerabdrücke pflanzt sich jede Änderung entlang von 'receives_messages_from' nach unten fort.
+    """
+    payload = {
+        "workflow": workflow_name,
+        "model": model_id,
+        "agent": agent_conf,
+        "question": question,
+        "files": [(file_data["name"], file_data.get("sha256")) for file_data in run_state().uploaded_files_data],
+        "sources": source_fingerprints,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def _remember_agent_result(fingerprint: str, result: Dict[str, Any]) -> None:
+    """Merkt sich ein erfolgreiches Agenten-Ergebnis für die inkrementelle Wiederausführung (begrenzt auf die letzten Einträge)."""
+    memo = run_state().agent_result_memo
+    memo.pop(fingerprint, None)
+    memo[fingerprint] = result
+    while len(memo) > MAX_REMEMBERED_AGENT_RESULTS:
+        memo.pop(next(iter(memo)))
+
+def summarize_tool_result(text: str, query: str, max_chars: int = TOOL_RESULT_SUMMARY_CHARS) -> str:
+    """
+    Extraktive Zusammenfassung eines langen Tool-Ergebnisses: Anfang plus die Sätze bzw. Zeilen mit den meisten
+    Suchbegriffen der Anfrage (in Originalreihenfolge), insgesamt höchstens etwa max_chars Zeichen.
+    """
+    if len(text) <= max_chars:
+        return text
+    sentences = [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+|\n+", text) if sentence.strip()]
+    head = sentences[0][:max_chars // 4]
+    query_tokens = set(tokenize_for_search(query))
+    scores = {index: len(query_tokens.intersection(tokenize_for_search(sentences[index]))) for index in range(1, len(sentences))}
+    selected = []
+    used = len(head)
+    for index in sorted(scores, key=lambda index: (-scores[index], index)):
+        if used + len(sentences[index]) + 3 <= max_chars:
+            selected.append(index)
+            used += len(sentences[index]) + 3
+    summary = " … ".join([head, *(sentences[index] for index in sorted(selected))])
+    return f"{summary}\n[Extraktiv gekürzt: {len(text)} → {len(summary)} Zeichen; ein erneuter Aufruf liefert das vollständige Ergebnis]"
+
+class ToolLoopCompactor:
+    """
+    Hält den Verlauf des Tool-Loops eines Agenten klein, damit nicht jeder Turn alle bisherigen Tool-Ergebnisse
+    erneut sendet: Ergebnisse, auf die das Modell bereits geantwortet hat, werden durch extraktive Zusammenfassungen
+    ersetzt (summarize_tool_result). Wiederholte Aufrufe (gleiches Tool, gleiche Argumente) werden nicht erneut
+    ausgeführt; sie erhalten das vollständige frühere Ergebnis, dessen älteres Vorkommen durch einen Verweis ersetzt wird.
+    """
+    def __init__(self, query: str, summary_chars: int = TOOL_RESULT_SUMMARY_CHARS):
+        self.query = query
+        self.summary_chars = summary_chars
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self.saved_tokens = 0
+        self.reused_calls = 0
+
+    @staticmethod
+    def call_key(function_call: Any) -> str:
+        return f"{function_call.name}:{json.dumps(dict(function_call.args or {}), sort_keys=True, default=str)}"
+
+    def reuse(self, function_call: Any, history: List[Content]) -> Optional[Part]:
+        """Antwort-Part für einen wiederholten Aufruf (älteres Vorkommen wird zum Verweis), sonst None."""
+        entry = self._results.get(self.call_key(function_call))
+        if entry is None:
+            return None
+        self._replace(history, entry, {"content": f"[Ergebnis siehe erneuten Aufruf von '{function_call.name}' weiter unten]"})
+        self.reused_calls += 1
+        return Part(function_response=FunctionResponse(id=function_call.id, name=function_call.name, response=entry["response"]))
+
+    def remember(self, function_calls: List[Any], response_parts: List[Part], history_index: int) -> None:
+        """Merkt sich die Ergebnisse eines Turns (Position im Verlauf) für Kompaktierung und Wiederverwendung."""
+        for part_index, (function_call, part) in enumerate(zip(function_calls, response_parts)):
+            response = part.function_response.response or {}
+            if "error" not in response:
+                self._results[self.call_key(function_call)] = {"history_index": history_index, "part_index": part_index, "response": response, "compacted": False}
+
+    def compact(self, history: List[Content]) -> int:
+        """Fasst alle bereits vom Modell gelesenen Ergebnisse zusammen; liefert die dadurch gesparten Tokens (geschätzt)."""
+        last_index = len(history) - 1
+        saved = 0
+        for entry in self._results.values():
+            content = str(entry["response"].get("content", ""))
+            if entry["compacted"] or entry["history_index"] >= last_index or len(content) <= self.summary_chars:
+                continue
+            summary = summarize_tool_result(content, self.query, self.summary_chars)
+            saved += estimate_text_tokens(content) - estimate_text_tokens(summary)
+            self._replace(history, entry, {**entry["response"], "content": summary})
+        self.saved_tokens += saved
+        return saved
+
+    @staticmethod
+    def _replace(history: List[Content], entry: Dict[str, Any], response: Dict[str, Any]) -> None:
+        entry["compacted"] = True
+        turn = history[entry["history_index"]]
+        parts = list(turn.parts)
+        old_response = parts[entry["part_index"]].function_response
+        parts[entry["part_index"]] = Part(function_response=FunctionResponse(id=old_response.id, name=old_response.name, response=response))
+        history[entry["history_index"]] = Content(role=turn.role, parts=parts)
+
+async def execute_function_calls(function_calls: List[Any], agent_name: str) -> List[Part]:
+    """
+    Führt alle Function Calls eines Modell-Turns gleichzeitig im Thread-Pool aus, jeweils mit dem Timeout und
+    Parallelitätslimit aus der Tool-Registry, und liefert die FunctionResponse-Parts in der Reihenfolge der Aufrufe für einen
+    gemeinsamen Folge-Turn zurück.
+    """
+    async def execute(function_call: Any) -> Part:
+        tool_name = function_call.name
+        tool_args = dict(function_call.args) if function_call.args else {}
+        if tool_name not in TOOL_REGISTRY:
+            notify("error", f"Unbekanntes Tool `{tool_name}` von Agent '{agent_name}' angefordert.")
+            return Part(function_response=FunctionResponse(id=function_call.id, name=tool_name, response={"error": f"Unbekanntes Tool: {tool_name}"}))
+        registered_tool = TOOL_REGISTRY[tool_name]
+        timeout = registered_tool.timeout
+        try:
+            # Bei Timeout läuft der Thread im Hintergrund zu Ende, das Ergebnis wird aber verworfen.
+            function_result = await asyncio.wait_for(asyncio.to_thread(registered_tool.call, **tool_args), timeout=timeout)
+            notify("success", f"Tool `{tool_name}` OK.")
+            return Part(function_response=FunctionResponse(id=function_call.id, name=tool_name, response={"content": str(function_result)}))
+        except asyncio.TimeoutError:
+            notify("error", f"Tool `{tool_name}` Timeout nach {timeout} Sekunden.")
+            return Part(function_response=FunctionResponse(id=function_call.id, name=tool_name, response={"error": f"Timeout nach {timeout} Sekunden"}))
+        except Exception as func_exc:
+            notify("error", f"Tool `{tool_name}` Fehler: {func_exc}")
+            return Part(function_response=FunctionResponse(id=function_call.id, name=tool_name, response={"error": f"Fehler bei Ausführung: {str(func_exc)}"}))
+
+    async def execute_traced(function_call: Any) -> Part:
+        with trace_span(function_call.name, "tool", tool=function_call.name) as span:
+            response_part = await execute(function_call)
+            span.attributes["status"] = "Fehler" if "error" in response_part.function_response.response else "OK"
+            return response_part
+
+    return list(await asyncio.gather(*(execute_traced(function_call) for function_call in function_calls)))
+
+async def run_agent(client: ModelClient, model_id: str, agent_conf: Dict[str, Any], agent_index: int, workflow_name: str, question: str, prompt_for_execution: str, plan: Optional[WorkflowPlan] = None) -> bool:
+    """
+    Führt einen einzelnen Agenten inklusive Tool-Loop aus und legt sein Ergebnis im message_store des Laufs ab.
+    Verlangen die Callbacks des Laufs 'stream_output', wird die Antwort gestreamt und laufend an sie übergeben.
+    Mit 'plan' werden Systemprompt, Tool-Bundle und Konfiguration aus dem kompilierten Workflow-Plan übernommen.
+    Gibt zurück, ob der Agent aus Sicht des Gesamt-Workflows erfolgreich war.
+    """
+    overall_success = True
+    state = run_state()
+    callbacks = run_callbacks()
+    agent_name = agent_conf.get("name", f"Agent_{agent_index+1}")
+    receives_from = agent_conf.get("receives_messages_from") or []
+    accepts_files = agent_conf.get("accepts_files", False)
+    if plan is not None and agent_name in plan.generation_configs:
+        system_prompt = plan.system_prompts[agent_name]
+        agent_specific_config = plan.generation_configs[agent_name]
+        unknown_tool_names = plan.unknown_tools[agent_name]
+    else:
+        system_prompt = build_system_prompt(workflow_name, agent_name, agent_conf)
+        agent_specific_config = build_agent_generation_config(agent_conf)
+        unknown_tool_names = [tool_name for tool_name in agent_tool_names(agent_conf) if tool_name not in TOOL_REGISTRY]
+    prompt = PromptAssembler(agent_conf.get("token_budget") or DEFAULT_AGENT_TOKEN_BUDGET)
+    prompt.add_text("Systemanweisung", system_prompt)
+    # Der Scheduler startet einen Agenten erst nach seinen Quellen; fehlt ein Quell-Ergebnis, ist die Quelle gescheitert
+    # oder wurde übersprungen, und der Agent wird ebenfalls übersprungen (statt ohne Input wie ein Start-Agent zu laufen).
+    is_first_relevant_agent = not receives_from
+    if is_first_relevant_agent:
+        if question.strip():
+            prompt.add_text("Nutzeranfrage", f"Nutzeranfrage:\n{prompt_for_execution}")
+        if accepts_files and state.uploaded_files_data:
+            files_added_count = 0
+            files_header_index = len(prompt.segments)
+            prompt.add_text("Dateien", "\n\n--- START KONTEXT DATEIEN ---")
+            for file_data in state.uploaded_files_data:
+                file_name, file_type = file_data["name"], file_data["type"]
+                if file_type.startswith("image/"):
+                    try:
+                        image_part = Part.from_data(mime_type=file_type, data=get_file_bytes(file_data))
+                        prompt.add_text(f"Bild {file_name}", f"\nBild: `{file_name}`")
+                        prompt.add_part(f"Bild {file_name}", image_part, IMAGE_TOKEN_ESTIMATE)
+                        files_added_count += 1
+                    except Exception as img_e:
+                        notify("warning", f"Bild '{file_name}' konnte nicht für Agent '{agent_name}' hinzugefügt werden: {img_e}")
+                else:
+                    try:
+                        file_content, truncated = get_file_text_view(file_data, MAX_CONTENT_LENGTH * 2)
+                        excerpt = retrieve_file_excerpt(file_data, question, MAX_CONTENT_LENGTH * 2) if truncated and question.strip() else None
+                        if excerpt is not None:
+                            file_content = excerpt + "\n... [Auszug: Dateianfang und zur Anfrage passende Abschnitte]"
+                        elif truncated:
+                            file_content += "\n... [Datei gekürzt]"
+                        prompt.add_text(f"Datei {file_name}", file_content, trimmable=True, header=f"\n--- START DATEI: `{file_name}` ---\n", footer=f"\n--- ENDE DATEI: `{file_name}` ---")
+                        files_added_count += 1
+                    except Exception as decode_e:
+                        notify("warning", f"Datei '{file_name}' ({file_type}) ignoriert für Agent '{agent_name}' (Decode-Fehler): {decode_e}")
+            if files_added_count > 0:
+                prompt.add_text("Dateien", "\n--- ENDE KONTEXT DATEIEN ---")
+            else:
+                del prompt.segments[files_header_index]
+    else:
+        for source_agent_name in receives_from:
+            if source_agent_name not in state.message_store:
+                error_msg = f"Input von '{source_agent_name}' fehlt. Überspringe '{agent_name}'."
+                notify("warning", error_msg)
+                state.agent_results_display.append({"agent": agent_name, "status": "Übersprungen", "details": error_msg, "output": "[Input fehlt]"})
+                return False
+        prompt.add_text("Vorherige Ergebnisse", "Vorherige Ergebnisse:\n")
+        for source_index, source_agent_name in enumerate(receives_from):
+            if source_index > 0:
+                prompt.add_text("Vorherige Ergebnisse", "\n\n", new_part=False)
+            prompt.add_text(f"Ergebnis {source_agent_name}", state.message_store[source_agent_name], trimmable=True, new_part=False,
+                            header=f"--- START ERGEBNIS VON '{source_agent_name}' ---\n", footer=f"\n--- ENDE ERGEBNIS VON '{source_agent_name}' ---")
+        prompt.add_text("Vorherige Ergebnisse", "\n---\nDeine Aufgabe basierend auf diesen Ergebnissen:", new_part=False)
+    agent_model_id, model_policy, model_reason = route_agent_model(agent_conf, model_id, prompt.estimated_tokens(), state.get("default_model_policy"))
+    source_fingerprints = {source: state.agent_fingerprints.get(source) if source in state.message_store else None for source in receives_from}
+    # Mit Policy hängt das Ergebnis von der Policy ab, nicht vom (messungsabhängig) gewählten Modell.
+    fingerprint = compute_agent_fingerprint(agent_conf, source_fingerprints, question, f"policy:{model_policy}" if model_policy else agent_model_id, workflow_name)
+    state.agent_fingerprints[agent_name] = fingerprint
+    previous_result = state.agent_result_memo.get(fingerprint)
+    resumed_from_checkpoint = previous_result is not None and previous_result.get("checkpoint_run") is not None and previous_result["checkpoint_run"] == state.get("run_id")
+    if previous_result and (state.get("incremental_execution", True) or resumed_from_checkpoint):
+        state.message_store[agent_name] = previous_result["output"]
+        details = f"Ergebnis aus dem Checkpoint von Lauf {previous_result['checkpoint_run']} übernommen." if previous_result.get("checkpoint_run") else "Eingaben unverändert – Ergebnis aus dem vorherigen Lauf übernommen."
+        state.agent_results_display.append({**previous_result, "input_tokens": 0, "output_tokens": 0, "model_usage": {}, "details": details})
+        return True
+    with trace_span("Prompt", "prompt") as prompt_span:
+        if prompt.token_budget and prompt.estimated_tokens() > prompt.token_budget * 0.8 and state.get("exact_token_count", False):
+            prompt.calibrate(await count_prompt_tokens(client, f"models/{agent_model_id}", prompt.build(trim=False)[0]))
+        current_input_parts, prompt_report = prompt.build()
+        prompt_span.attributes.update(tokens=prompt_report["tokens_after"], budget=prompt_report["budget"] or None)
+    if prompt_report["tokens_after"] < prompt_report["tokens_before"]:
+        notify("info", f"'{agent_name}': Eingabe auf Token-Budget {prompt_report['budget']} gekürzt (ca. {prompt_report['tokens_before']} → {prompt_report['tokens_after']} Tokens).")
+    for tool_name in unknown_tool_names:
+        notify("warning", f"Tool '{tool_name}' für '{agent_name}' nicht in AVAILABLE_TOOLS.")
+    tool_token_budget = agent_conf.get("tool_token_budget") or TOOL_LOOP_TOKEN_BUDGET
+    compactor = ToolLoopCompactor(question) if agent_conf.get("compact_tool_results", True) is not False else None
+    final_answer_config = agent_specific_config.model_copy(update={"tool_config": ToolConfig(function_calling_config=FunctionCallingConfig(mode="NONE"))})
+    turn_prompt_tokens: List[int] = []
+    tool_limit_reached = False
+    final_agent_output = ""
+    agent_success_flag = False
+    grounding_info = None
+    conversation_history: List[Content] = [Content(role="user", parts=current_input_parts)]
+    use_response_cache = agent_uses_response_cache(agent_conf) and state.get("use_response_cache", True)
+    should_skip = (agent_conf.get("name", "").startswith("Planner") and accepts_files and not state.uploaded_files_data and not question.strip())
+    time_to_first_token = None
+    input_tokens = 0
+    output_tokens = 0
+    call_stats = new_model_call_stats()
+
+    def show_stream_progress(streamed_text: str, elapsed: float, function_call_names: List[str]) -> None:
+        nonlocal time_to_first_token
+        if time_to_first_token is None:
+            time_to_first_token = elapsed
+        callbacks.stream(agent_name, streamed_text, time_to_first_token, function_call_names)
+
+    while True:
+        if should_skip:
+            notify("info", f"'{agent_name}' übersprungen (Planner ohne Input).")
+            state.agent_results_display.append({"agent": agent_name, "status": "Übersprungen", "output": "[Keine Frage/Dateien]"})
+            agent_success_flag = True
+            final_agent_output = "[Keine Frage/Dateien]"
+            break
+        try:
+            turn = len(turn_prompt_tokens)
+            if turn == 0:
+                turn_prompt_tokens.append(estimate_token_count(conversation_history))
+            else:
+                with trace_span(f"Prompt Turn {turn + 1}", "prompt", turn=turn + 1) as turn_span:
+                    compacted_tokens = compactor.compact(conversation_history) if compactor else 0
+                    turn_prompt_tokens.append(estimate_token_count(conversation_history))
+                    turn_span.attributes.update(tokens=turn_prompt_tokens[-1], compacted_tokens=compacted_tokens)
+            # Wird der Prompt dieses Turns (trotz Kompaktierung) größer als das Budget, muss das Modell ohne weitere Tool-Aufrufe antworten.
+            final_turn = turn > 0 and (turn >= MAX_TOOL_TURNS or turn_prompt_tokens[-1] > tool_token_budget)
+            if final_turn and not tool_limit_reached:
+                tool_limit_reached = True
+                notify("info", f"'{agent_name}': Grenze des Tool-Loops erreicht (Prompt {turn_prompt_tokens[-1]} von {tool_token_budget} Tokens, {turn} von höchstens {MAX_TOOL_TURNS} Turns) – letzte Antwort ohne Tools.")
+            turn_config = final_answer_config if final_turn else agent_specific_config
+            effective_model_for_call = f"models/{agent_model_id}"
+            if callbacks.stream_output:
+                response = await limited_generate_content_stream_async(
+                    client=client,
+                    model=effective_model_for_call,
+                    contents=conversation_history,
+                    config=turn_config,
+                    use_cache=use_response_cache,
+                    on_chunk=show_stream_progress,
+                )
+            else:
+                response = await limited_generate_content_async(
+                    client=client,
+                    model=effective_model_for_call,
+                    contents=conversation_history,
+                    config=turn_config,
+                    use_cache=use_response_cache,
+                )
+            prompt_token_count, output_token_count = get_usage_token_counts(response)
+            input_tokens += prompt_token_count if prompt_token_count is not None else estimate_token_count(conversation_history)
+            output_tokens += output_token_count or 0
+            candidate = response.candidates[0] if response.candidates else None
+            function_calls = []
+            if candidate and hasattr(candidate, 'content') and candidate.content and hasattr(candidate.content, 'parts') and candidate.content.parts:
+                function_calls = [part.function_call for part in candidate.content.parts if getattr(part, 'function_call', None)]
+            if function_calls and final_turn:
+                final_agent_output = "[Function Call Limit erreicht]"
+                break
+            if function_calls:
+                notify("info", f"'{agent_name}' -> Tool {', '.join(f'`{function_call.name}`' for function_call in function_calls)}...")
+                conversation_history.append(candidate.content)
+                reused_parts = [compactor.reuse(function_call, conversation_history) if compactor else None for function_call in function_calls]
+                executed_parts = iter(await execute_function_calls([function_call for function_call, part in zip(function_calls, reused_parts) if part is None], agent_name))
+                function_response_parts = [part or next(executed_parts) for part in reused_parts]
+                conversation_history.append(Content(role="user", parts=function_response_parts))
+                if compactor:
+                    compactor.remember(function_calls, function_response_parts, len(conversation_history) - 1)
+                continue
+            else:
+                if candidate and hasattr(candidate, 'content') and candidate.content and hasattr(candidate.content, 'parts') and candidate.content.parts:
+                    text_parts = [part.text for part in candidate.content.parts if hasattr(part, 'text')]
+                    if text_parts:
+                        final_agent_output = "\n".join(text_parts).strip()
+                        grounding_info = get_grounding_info(candidate)
+                        agent_success_flag = True
+                    else:
+                        feedback = getattr(response, 'prompt_feedback', None)
+                        finish_reason = getattr(candidate, 'finish_reason', 'UNKNOWN')
+                        safety_ratings = getattr(candidate, 'safety_ratings', [])
+                        block_reason = getattr(feedback, 'block_reason', "Kein Text") if feedback else "Kein Text"
+                        block_msg = getattr(feedback, 'block_reason_message', f"Finish Reason: {finish_reason}, Safety: {safety_ratings}") if feedback else f"Finish Reason: {finish_reason}, Safety: {safety_ratings}"
+                        final_agent_output = f"[Fehler: Keine gültige Antwort. Grund: {block_reason}. Nachricht: {block_msg}]"
+                        notify("error", f"'{agent_name}': {final_agent_output}")
+                        agent_success_flag = False
+                else:
+                    feedback = getattr(response, 'prompt_feedback', None)
+                    finish_reason = getattr(candidate, 'finish_reason', 'UNKNOWN') if candidate else 'NO_CANDIDATE'
+                    block_reason = getattr(feedback, 'block_reason', "Keine Antwortstruktur") if feedback else "Keine Antwortstruktur"
+                    block_msg = getattr(feedback, 'block_reason_message', f"Finish Reason: {finish_reason}") if feedback else f"Finish Reason: {finish_reason}"
+                    final_agent_output = f"[Fehler: Keine gültige Antwort. Grund: {block_reason}. Nachricht: {block_msg}]"
+                    notify("error", f"'{agent_name}': {final_agent_output}")
+                    agent_success_flag = False
+                break
+        except Exception as e:
+            notify("error", f"❌ Kritischer Fehler bei '{agent_name}': {e}")
+            notify("error", traceback.format_exc())
+            final_agent_output = f"[Kritischer Fehler: {e}]"
+            agent_success_flag = False
+            overall_success = False
+            break
+    if final_agent_output == "[Function Call Limit erreicht]":
+        notify("warning", f"Agent '{agent_name}' hat trotz erschöpftem Tool-Budget ({tool_token_budget} Tokens) weitere Tools angefordert.")
+        agent_success_flag = False
+    tool_loop_stats = {"turn_prompt_tokens": turn_prompt_tokens, "compacted_tokens": compactor.saved_tokens if compactor else 0,
+                       "reused_tool_calls": compactor.reused_calls if compactor else 0, "tool_budget_reached": tool_limit_reached}
+    if final_agent_output:
+        if agent_success_flag and "[Keine Frage/Dateien]" not in final_agent_output:
+            state.message_store[agent_name] = final_agent_output
+            _remember_agent_result(fingerprint, {"agent": agent_name, "status": "Erfolgreich", "output": final_agent_output, "sources": grounding_info, "details": None, "prompt_report": prompt_report,
+                                              "model": agent_model_id, "model_policy": model_policy})
+        already_skipped = any(r['agent'] == agent_name and r['status'] == 'Übersprungen' for r in state.agent_results_display)
+        if not already_skipped:
+            current_status = "Erfolgreich" if agent_success_flag else "Fehlgeschlagen"
+            if "[Übersprungen" in final_agent_output or "[Keine Frage/Dateien]" in final_agent_output or "[Input fehlt]" in final_agent_output:
+                current_status = "Übersprungen"
+            state.agent_results_display.append({
+                "agent": agent_name,
+                "status": current_status,
+                "output": final_agent_output,
+                "sources": grounding_info,
+                "details": None,
+                "ttft": time_to_first_token,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "prompt_report": prompt_report,
+                "model": agent_model_id,
+                "model_policy": model_policy,
+                "model_reason": model_reason,
+                **tool_loop_stats,
+                **call_stats
+            })
+    elif not should_skip:
+         notify("warning", f"Agent '{agent_name}' beendete ohne expliziten Output.")
+         state.agent_results_display.append({
+             "agent": agent_name, "status": "Unbekannt",
+             "output": "[Kein Output erhalten]", "sources": None, "details": "Agent lief, aber gab keinen Output.",
+             "input_tokens": input_tokens, "output_tokens": output_tokens, "prompt_report": prompt_report,
+             "model": agent_model_id, "model_policy": model_policy, "model_reason": model_reason, **tool_loop_stats, **call_stats
+         })
+         agent_success_flag = False
+    if not agent_success_flag and not (should_skip or "[Input fehlt]" in final_agent_output):
+        overall_success = False
+    return overall_success
+
+# --- Fortsetzen gespeicherter Läufe (RunStore in workflow_storage.py) ---
+def uploaded_file_hashes(uploaded_files_data: List[Dict[str, Any]]) -> List[Tuple[str, Optional[str]]]:
+    return [(file_data["name"], file_data.get("sha256")) for file_data in uploaded_files_data]
+
+def prepare_resume(state: Any, stored_run: Dict[str, Any]) -> None:
+    """
+    Bereitet die Fortsetzung eines gespeicherten Laufs vor: Erfolgreiche Checkpoints werden über ihren Fingerabdruck in
+    agent_result_memo eingetragen und von run_agent ohne Modellaufruf übernommen; alle übrigen Agenten laufen neu.
+    Weichen die hochgeladenen Dateien ab, ändern sich die Fingerabdrücke und die betroffenen Agenten laufen ebenfalls neu.
+    """
+    ensure_run_state(state)
+    state.run_id = stored_run["run_id"]
+    for result in stored_run["results"]:
+        fingerprint = stored_run["fingerprints"].get(result["agent"])
+        if fingerprint and result.get("status") == "Erfolgreich":
+            state.agent_result_memo[fingerprint] = {**result, "checkpoint_run": stored_run["run_id"]}
+    if uploaded_file_hashes(state.uploaded_files_data) != stored_run["files"]:
+        notify("warning", f"Die Dateien weichen von Lauf {stored_run['run_id']} ab; Agenten mit Dateikontext und ihre Nachfolger werden neu ausgeführt.")
+
+# --- Workflow-Lauf (UI-unabhängig) ---
+async def run_workflow_async(client: ModelClient, model_id: str, plan: WorkflowPlan, question: str, state: Any, callbacks: Optional[WorkflowCallbacks] = None, max_parallel: int = 4) -> bool:
+    """
+    Führt einen kompilierten Workflow-Plan für eine Anfrage aus; die Ergebnisse landen in state.message_store und
+    state.agent_results_display, die Zeitleiste in state.trace und die ## FILE:-Dateien jedes abgeschlossenen Agenten in
+    state.artifacts (beides wird angelegt, falls nicht vorhanden). Mehrere Läufe
+    mit je eigenem Zustand können gleichzeitig in einer Event-Loop laufen und teilen sich den prozessweiten Rate-Limiter.
+    Solange state.record_run nicht False ist, wird der Lauf in der Laufhistorie gespeichert (neuer Lauf, wenn
+    state.run_id fehlt, sonst Fortsetzung, siehe prepare_resume) und jedes Agenten-Ergebnis sofort als Checkpoint abgelegt.
+    """
+    if plan.graph_error:
+        raise ValueError(f"Ungültiger Abhängigkeitsgraph: {plan.graph_error}")
+    callbacks = callbacks or WorkflowCallbacks()
+    ensure_run_state(state)
+    if state.get("trace") is None:
+        state.trace = RunTrace(plan.workflow_name)
+    if state.get("artifacts") is None:
+        state.artifacts = ArtifactStore()
+    agent_ranks = {agent_conf.get("name", f"Agent_{agent_index+1}"): agent_index for agent_index, agent_conf in enumerate(plan.agents)}
+    run_store = get_run_store() if state.get("record_run", True) else None
+    if run_store is not None:
+        if state.get("run_id"):
+            await asyncio.to_thread(run_store.record_status, state.run_id, "Fortgesetzt")
+        else:
+            state.run_id = await asyncio.to_thread(run_store.start_run, plan, question, model_id, uploaded_file_hashes(state.uploaded_files_data), state.get("config_path"))
+
+    async def run_traced_agent(agent_conf: Dict[str, Any], agent_index: int) -> bool:
+        agent_name = agent_conf.get("name", f"Agent_{agent_index+1}")
+        with trace_span(agent_name, "agent", agent=agent_name, round=agent_conf.get("round")) as span:
+            success = await run_agent(client, model_id, agent_conf, agent_index, plan.workflow_name, question, question, plan)
+            result = next((entry for entry in reversed(state.agent_results_display) if entry.get("agent") == agent_name), {})
+            span.attributes.update(status=result.get("status"), input_tokens=result.get("input_tokens"), output_tokens=result.get("output_tokens"), retries=result.get("retries"), model=result.get("model"))
+            if result:
+                with trace_span("Dateien", "file") as file_span:
+                    file_span.attributes["files"] = len(state.artifacts.add_result(result, agent_ranks[agent_name]))
+        if run_store is not None and result and result.get("checkpoint_run") != state.run_id:
+            await asyncio.to_thread(run_store.record_agent, state.run_id, result, state.agent_fingerprints.get(agent_name))
+        return success
+
+    with run_context(state, callbacks):
+        try:
+            success = await run_agents_dag(plan.agents, plan.dependencies, run_traced_agent, max_parallel=max_parallel, on_progress=callbacks.progress)
+        except BaseException as e:
+            if run_store is not None:
+                run_store.record_status(state.run_id, "Abgebrochen", str(e) or type(e).__name__)
+            raise
+        if run_store is not None:
+            await asyncio.to_thread(run_store.record_status, state.run_id, "Erfolgreich" if success else "Fehlgeschlagen")
+        return success
+
+def run_workflow(client: ModelClient, model_id: str, plan: WorkflowPlan, question: str, state: Any, callbacks: Optional[WorkflowCallbacks] = None, max_parallel: int = 4, thread_initializer: Optional[Callable[[], None]] = None) -> bool:
+    """
+    Synchrone Variante von run_workflow_async mit eigener Event-Loop. Tools laufen in einem Thread-Pool mit
+    max(4, 2 * max_parallel) Threads; 'thread_initializer' wird einmal in jedem Worker-Thread aufgerufen.
+    """
+    async def run() -> bool:
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(4, max_parallel * 2), initializer=thread_initializer))
+        return await run_workflow_async(client, model_id, plan, question, state, callbacks, max_parallel)
+    return asyncio.run(run())
+
+# --- Generierte Dateien (## FILE:-Blöcke in den Agenten-Ausgaben) ---
+# Kopf eines Blocks: '## FILE: pfad/datei.ext', danach die öffnende Code-Fence (optional mit Sprache).
+FILE_BLOCK_HEADER_PATTERN = re.compile(r"## FILE: \s*([\w\.\-\/]+\.\w+)\s*\n```(?:[\w\+\#\-\.]*\n)?")
+
+def parse_file_blocks(text: str) -> Iterator[Tuple[str, str]]:
+    """
+    Liefert (Dateiname, Inhalt) aller ## FILE:-Blöcke eines Agenten-Outputs in linearer Zeit: Nach jedem Kopf wird
+    nur bis zur nächsten schließenden Fence gesucht, und die Suche setzt dahinter fort. Fehlt die schließende Fence,
+    kann auch kein späterer Block mehr vollständig sein.
+    """
+    position = 0
+    while (header := FILE_BLOCK_HEADER_PATTERN.search(text, position)) is not None:
+        end = text.find("```", header.end())
+        if end == -1:
+            return
+        yield header.group(1), text[header.end():end]
+        position = end + 3
+
+class ArtifactStore:
+    """
+    Die aus ## FILE:-Blöcken extrahierten Dateien eines Laufs, je Pfad einmal gespeichert. Jeder Agent wird bei
+    seinem Abschluss hinzugefügt (add_result). Liefern mehrere Agenten denselben Pfad, gewinnt der spätere in
+    Workflow-Reihenfolge ('rank': Runde, dann Position in der Konfiguration), unabhängig davon, welcher parallel
+    zuerst fertig war; innerhalb eines Agenten gewinnt der letzte Block. Das ZIP entsteht erst bei Bedarf (open_zip).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._artifacts: Dict[str, Dict[str, Any]] = {}
+        self.overridden: List[Tuple[str, str, str]] = []  # (Pfad, verdrängter Agent, gültiger Agent)
+
+    def add_result(self, result: Dict[str, Any], rank: int) -> List[str]:
+        """Übernimmt die Dateien eines erfolgreichen Agenten (außer dem Workflow-Generator); liefert die übernommenen Pfade."""
+        if result.get("status") != "Erfolgreich" or result.get("agent") == GENERATOR_WORKFLOW_NAME or not result.get("output"):
+            return []
+        agent_name = result["agent"]
+        added = []
+        for filename, content in parse_file_blocks(result["output"]):
+            clean_content = content.strip()
+            if not clean_content:
+                continue
+            path = filename.strip()
+            with self._lock:
+                existing = self._artifacts.get(path)
+                if existing is not None and existing["rank"] > rank:
+                    self.overridden.append((path, agent_name, existing["agent"]))
+                    continue
+                if existing is not None and existing["agent"] != agent_name:
+                    self.overridden.append((path, existing["agent"], agent_name))
+                self._artifacts[path] = {"agent": agent_name, "rank": rank, "content": clean_content + "\n"}
+            added.append(path)
+        return added
+
+    @classmethod
+    def from_results(cls, results: List[Dict[str, Any]], agent_order: Optional[List[str]] = None) -> "ArtifactStore":
+        """Baut den Store nachträglich aus Agenten-Ergebnissen (z.B. aus der Laufhistorie); ohne agent_order zählt die Listenreihenfolge."""
+        ranks = {agent_name: index for index, agent_name in enumerate(agent_order or [])}
+        store = cls()
+        for index, result in enumerate(results):
+            store.add_result(result, ranks.get(result.get("agent"), index))
+        return store
+
+    def __len__(self) -> int:
+        return len(self._artifacts)
+
+    def items(self) -> List[Tuple[str, str, str]]:
+        """(Pfad, Agent, Inhalt) aller Dateien, sortiert nach Pfad."""
+        with self._lock:
+            return sorted((path, entry["agent"], entry["content"]) for path, entry in self._artifacts.items())
+
+    def add_to_zip(self, zip_f: zipfile.ZipFile, prefix: str = "") -> None:
+        """Schreibt alle Dateien (optional unter 'prefix') in ein geöffnetes ZIP-Archiv."""
+        for path, _, content in self.items():
+            zip_f.writestr(f"{prefix}{path}", content.encode("utf-8"))
+
+    def open_zip(self) -> tempfile.SpooledTemporaryFile:
+        """
+        Baut das ZIP aller Dateien in einer SpooledTemporaryFile (bis ZIP_SPOOL_MAX_BYTES im RAM, darüber auf der
+        Platte) und liefert sie zurückgespult, z.B. zum Kopieren in eine Datei oder einen Response-Stream.
+        """
+        with trace_span("ZIP", "zip", files=len(self)) as span:
+            spooled_zip = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_BYTES)
+            with zipfile.ZipFile(spooled_zip, "w", zipfile.ZIP_DEFLATED) as zip_f:
+                self.add_to_zip(zip_f)
+            span.attributes["bytes"] = spooled_zip.tell()
+            spooled_zip.seek(0)
+            return spooled_zip
+
+    def zip_bytes(self) -> bytes:
+        """
+        Das ZIP aus open_zip als Bytes. Für st.download_button, das nur Bytes annimmt: Als Callable übergeben, läuft
+        zip_bytes erst beim Klick, das fertige Archiv liegt danach aber einmal vollständig im Speicher von Streamlit.
+        Die SpooledTemporaryFile begrenzt nur den Speicherbedarf beim Packen (kein wachsender Puffer im RAM).
+        """
+        with self.open_zip() as spooled_zip:
+            return spooled_zip.read()
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Persistenz der Workflow-Engine in SQLite-Dateien: Antwort-Cache für Modellantworten (ResponseCache),
+Tool-Ergebnis-Cache (ToolResultCache) und Laufhistorie mit Checkpoints pro Agent (RunStore).
+"""
+import os
+import json
+import time
+import datetime
+import threading
+import sqlite3
+import hashlib
+import functools
+import difflib
+import uuid
+from collections import OrderedDict
+from contextlib import closing
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+from google.genai.types import Part, Content, GenerateContentConfig, GenerateContentResponse
+
+if TYPE_CHECKING:
+    from workflow_engine import WorkflowPlan
+
+# --- Konstanten ---
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB") or os.path.join("cache", "response_cache.sqlite")
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+RUN_STORE_DB = os.getenv("RUN_STORE_DB") or os.path.join("runs", "run_history.sqlite")  # Laufhistorie mit Checkpoints pro Agent
+TOOL_CACHE_DB = os.getenv("TOOL_CACHE_DB") or os.path.join("cache", "tool_cache.sqlite")
+TOOL_CACHE_MEMORY_ENTRIES = 256
+TOOL_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+# --- Antwort-Cache ---
+class ResponseCache:
+    """
+    Persistenter, inhaltsadressierter Cache für Modellantworten in einer SQLite-Datei.
+    Der Schlüssel ist ein SHA-256-Hash über Modell-ID, serialisierte Inhalte (Parts) und die
+    GenerateContentConfig inklusive Tool-Deklarationen. Einträge verfallen nach 'ttl_seconds';
+    überschreitet der Cache 'max_bytes', werden die am längsten nicht genutzten Einträge verdrängt (LRU).
+    """
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int):
+        self._lock = threading.Lock()
+        self._path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, created REAL, last_access REAL, size INTEGER)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def make_key(model: str, contents: List[Union[Part, Content]], config: GenerateContentConfig | None) -> str:
+        """Bildet den stabilen Cache-Schlüssel aus Modell, Inhalten und Konfiguration."""
+        payload = {
+            "model": model,
+            "contents": [_to_json_data(part) for part in contents],
+            "config": _to_json_data(config) if config is not None else None,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> GenerateContentResponse | None:
+        """Liefert die gecachte Antwort oder None (abgelaufene Einträge zählen als Miss und werden entfernt)."""
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return GenerateContentResponse.model_validate(json.loads(row[0]))
+            if row:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, key: str, response: Any) -> None:
+        """Speichert eine Antwort und verdrängt bei Überschreitung von max_bytes die ältesten Einträge."""
+        serialized = json.dumps(_to_json_data(response), ensure_ascii=False)
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, serialized, now, now, len(serialized)))
+            _evict_least_recently_used(conn, "responses", self.max_bytes)
+
+    def clear(self) -> None:
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("DELETE FROM responses")
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock, closing(self._connect()) as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size_bytes": size}
+
+def _evict_least_recently_used(conn: sqlite3.Connection, table: str, max_bytes: int) -> None:
+    """Löscht die am längsten nicht genutzten Einträge einer Cache-Tabelle, bis sie höchstens max_bytes groß ist."""
+    total_size = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+    if total_size <= max_bytes:
+        return
+    for old_key, size in conn.execute(f"SELECT key, size FROM {table} ORDER BY last_access").fetchall():
+        if total_size <= max_bytes:
+            break
+        conn.execute(f"DELETE FROM {table} WHERE key = ?", (old_key,))
+        total_size -= size
+
+def _to_json_data(obj: Any) -> Any:
+    """Serialisiert SDK-Objekte (Pydantic-Modelle) deterministisch in JSON-kompatible Daten."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json", exclude_none=True, exclude={"sdk_http_response"})
+    return obj
+
+@functools.lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    """Liefert den prozessweit geteilten Antwort-Cache."""
+    return ResponseCache(RESPONSE_CACHE_DB, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_BYTES)
+
+# --- Cache für Tool-Ergebnisse ---
+class ToolResultCache:
+    """
+    Zweistufiger Cache für Tool-Ergebnisse: ein LRU-Cache im Speicher vor einer SQLite-Datei, die
+    Streamlit-Reruns und Neustarts überlebt. Die Gültigkeitsdauer wird pro Tool festgelegt (register_tool(cache_ttl=...)).
+    """
+    def __init__(self, path: str, max_memory_entries: int, max_bytes: int):
+        self._lock = threading.Lock()
+        self._path = path
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.max_memory_entries = max_memory_entries
+        self.max_bytes = max_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS tool_results (key TEXT PRIMARY KEY, tool TEXT, result TEXT, expires REAL, last_access REAL, size INTEGER)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=30, isolation_level=None)
+
+    def _remember(self, key: str, result: str, expires: float) -> None:
+        self._memory[key] = (result, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and cached[1] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return cached[0]
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT result, expires FROM tool_results WHERE key = ?", (key,)).fetchone()
+                if row and row[1] > now:
+                    conn.execute("UPDATE tool_results SET last_access = ? WHERE key = ?", (now, key))
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+                if row:
+                    conn.execute("DELETE FROM tool_results WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, tool_name: str, result: str, ttl_seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, result, now + ttl_seconds)
+            with closing(self._connect()) as conn:
+                conn.execute("INSERT OR REPLACE INTO tool_results VALUES (?, ?, ?, ?, ?, ?)", (key, tool_name, result, now + ttl_seconds, now, len(result)))
+                _evict_least_recently_used(conn, "tool_results", self.max_bytes)
+
+    def clear(self) -> None:
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("DELETE FROM tool_results")
+            self._memory.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock, closing(self._connect()) as conn:
+            per_tool = dict(conn.execute("SELECT tool, COUNT(*) FROM tool_results GROUP BY tool").fetchall())
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses, "memory_entries": len(self._memory), "entries_per_tool": per_tool}
+
+@functools.lru_cache(maxsize=None)
+def get_tool_cache() -> ToolResultCache:
+    """Liefert den prozessweit geteilten Tool-Ergebnis-Cache."""
+    return ToolResultCache(TOOL_CACHE_DB, TOOL_CACHE_MEMORY_ENTRIES, TOOL_CACHE_MAX_BYTES)
+
+# --- Laufhistorie (dauerhafter Run-Store mit Checkpoints) ---
+RUN_FINISHED_STATUSES = ("Erfolgreich", "Fehlgeschlagen", "Abgebrochen")
+
+class RunStore:
+    """
+    Append-only Laufhistorie in einer SQLite-Datei (WAL). Ein Lauf speichert beim Start Workflow, Agenten-Konfiguration,
+    Anfrage, Modell und Datei-Hashes; jedes Agenten-Ergebnis wird beim Abschluss mit seinem Fingerabdruck als Ereignis
+    angehängt, ebenso Statuswechsel. Bestehende Zeilen werden nie geändert: Der Status eines Laufs ist sein letztes
+    Statusereignis, das Ergebnis eines Agenten sein letztes Agentenereignis. Läufe ohne Abschlussereignis
+    (Absturz, Neustart, geschlossener Browser) gelten als 'Unvollständig' und können fortgesetzt werden.
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, workflow_name TEXT, config_path TEXT, agents TEXT, question TEXT, model_id TEXT, files TEXT, created REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS run_events (seq INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT, kind TEXT, agent TEXT, status TEXT, fingerprint TEXT, payload TEXT, created REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS run_events_run ON run_events (run_id, seq)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=30, isolation_level=None)
+
+    def _append_event(self, run_id: str, kind: str, agent: Optional[str], status: Optional[str], fingerprint: Optional[str], payload: Any) -> None:
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("INSERT INTO run_events (run_id, kind, agent, status, fingerprint, payload, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (run_id, kind, agent, status, fingerprint, json.dumps(payload, ensure_ascii=False, default=str), time.time()))
+
+    def start_run(self, plan: "WorkflowPlan", question: str, model_id: str, files: List[Tuple[str, Optional[str]]], config_path: Optional[str] = None) -> str:
+        """Legt einen neuen Lauf an und liefert seine ID (Zeitstempel plus Zufallsanteil)."""
+        run_id = f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (run_id, plan.workflow_name, config_path, json.dumps(plan.agents, ensure_ascii=False), question, model_id, json.dumps(files), time.time()))
+        self.record_status(run_id, "Gestartet")
+        return run_id
+
+    def record_status(self, run_id: str, status: str, error: Optional[str] = None) -> None:
+        self._append_event(run_id, "status", None, status, None, {"error": error} if error else {})
+
+    def record_agent(self, run_id: str, result: Dict[str, Any], fingerprint: Optional[str]) -> None:
+        """Checkpoint eines abgeschlossenen Agenten (Eintrag aus agent_results_display)."""
+        self._append_event(run_id, "agent", result.get("agent"), result.get("status"), fingerprint, result)
+
+    def list_runs(self, limit: int = 50, workflow_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Die letzten Läufe (neueste zuerst) mit abgeleitetem Status und Anzahl erfolgreicher Agenten."""
+        query = ("SELECT r.run_id, r.workflow_name, r.question, r.model_id, r.agents, r.created, "
+                 "(SELECT status FROM run_events e WHERE e.run_id = r.run_id AND e.kind = 'status' ORDER BY e.seq DESC LIMIT 1), "
+                 "(SELECT COUNT(DISTINCT agent) FROM run_events e WHERE e.run_id = r.run_id AND e.kind = 'agent' AND e.status = 'Erfolgreich') "
+                 "FROM runs r" + (" WHERE r.workflow_name = ?" if workflow_name else "") + " ORDER BY r.created DESC LIMIT ?")
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(query, (workflow_name, limit) if workflow_name else (limit,)).fetchall()
+        return [{
+            "run_id": run_id, "workflow_name": name, "question": question, "model_id": model_id, "created": created,
+            "status": status if status in RUN_FINISHED_STATUSES else "Unvollständig",
+            "agents_done": agents_done, "agents_total": len(json.loads(agents)),
+        } for run_id, name, question, model_id, agents, created, status, agents_done in rows]
+
+    def load_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Lädt einen Lauf mit Metadaten, Status und dem jeweils letzten Ergebnis pro Agent (in Abschlussreihenfolge)
+        samt Fingerabdruck ('fingerprints'); None, wenn die ID unbekannt ist.
+        """
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute("SELECT workflow_name, config_path, agents, question, model_id, files, created FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            events = conn.execute("SELECT kind, agent, status, fingerprint, payload FROM run_events WHERE run_id = ? ORDER BY seq", (run_id,)).fetchall() if row else []
+        if row is None:
+            return None
+        workflow_name, config_path, agents, question, model_id, files, created = row
+        status = "Unvollständig"
+        error = None
+        results: Dict[str, Dict[str, Any]] = {}
+        fingerprints: Dict[str, Optional[str]] = {}
+        for kind, agent, event_status, fingerprint, payload in events:
+            if kind == "status":
+                status = event_status if event_status in RUN_FINISHED_STATUSES else "Unvollständig"
+                error = json.loads(payload).get("error")
+            else:
+                results.pop(agent, None)
+                results[agent] = json.loads(payload)
+                fingerprints[agent] = fingerprint
+        return {
+            "run_id": run_id, "workflow_name": workflow_name, "config_path": config_path, "agents": json.loads(agents),
+            "question": question, "model_id": model_id, "files": [tuple(entry) for entry in json.loads(files)], "created": created,
+            "status": status, "error": error, "results": list(results.values()), "fingerprints": fingerprints,
+        }
+
+    def latest_run(self, workflow_name: str, question: str) -> Optional[Dict[str, Any]]:
+        """Der jüngste gespeicherte Lauf eines Workflows für genau diese Anfrage (z.B. zum Fortsetzen eines Batches)."""
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute("SELECT run_id FROM runs WHERE workflow_name = ? AND question = ? ORDER BY created DESC LIMIT 1", (workflow_name, question)).fetchone()
+        return self.load_run(row[0]) if row else None
+
+    def diff_runs(self, run_id_a: str, run_id_b: str) -> List[Dict[str, Any]]:
+        """Vergleicht zwei Läufe pro Agent: Status, ob sich der Output geändert hat, und ein Unified-Diff der Outputs."""
+        run_a, run_b = self.load_run(run_id_a), self.load_run(run_id_b)
+        if run_a is None or run_b is None:
+            raise KeyError(run_id_b if run_a else run_id_a)
+        results_a = {result["agent"]: result for result in run_a["results"]}
+        results_b = {result["agent"]: result for result in run_b["results"]}
+        agent_names = list(results_a) + [agent_name for agent_name in results_b if agent_name not in results_a]
+        rows = []
+        for agent_name in agent_names:
+            output_a = (results_a.get(agent_name) or {}).get("output") or ""
+            output_b = (results_b.get(agent_name) or {}).get("output") or ""
+            rows.append({
+                "agent": agent_name,
+                "status_a": (results_a.get(agent_name) or {}).get("status"),
+                "status_b": (results_b.get(agent_name) or {}).get("status"),
+                "changed": output_a != output_b,
+                "diff": "".join(difflib.unified_diff(output_a.splitlines(keepends=True), output_b.splitlines(keepends=True), fromfile=run_id_a, tofile=run_id_b)),
+            })
+        return rows
+
+@functools.lru_cache(maxsize=None)
+def get_run_store() -> RunStore:
+    """Liefert die prozessweit geteilte Laufhistorie."""
+    return RunStore(RUN_STORE_DB)
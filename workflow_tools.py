@@ -0,0 +1,1021 @@
+# -*- coding: utf-8 -*-
+"""
+Tools der Agenten und ihre Infrastruktur: geteilter HTTP-Client, Tool-Registry (register_tool) mit Tool-Cache,
+Streaming-Extraktion von Webseiten-Text, Upload-Speicher mit BM25-Suchindex und die eingebauten Tools.
+Neue Tools werden hier per @register_tool registriert und stehen damit in AVAILABLE_TOOLS.
+"""
+import os
+import json
+import re
+import datetime
+import threading
+import hashlib
+import functools
+import inspect
+import urllib.parse
+import mmap
+import shutil
+import tempfile
+import weakref
+import mimetypes
+import codecs
+import copy
+from collections import OrderedDict
+from html.parser import HTMLParser  # Fallback-Parser für die Text-Extraktion aus HTML
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, get_args, get_origin, get_type_hints
+
+from google.genai.types import FunctionDeclaration, Tool
+from dotenv import load_dotenv
+from asteval import Interpreter  # Sicherer Ersatz für eval
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from lxml import etree as lxml_etree  # Optional: schnellerer Parser für die Text-Extraktion aus HTML
+except ImportError:
+    lxml_etree = None
+import wikipedia
+import numpy as np  # Vektorisierte BM25-Bewertung
+
+from workflow_context import run_state, set_span_attributes, trace_span
+from workflow_storage import get_tool_cache
+
+# --- Konstanten ---
+load_dotenv()
+GOOGLE_CSE_API_KEY = os.getenv("GOOGLE_CSE_API_KEY")
+GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
+MAX_RESULTS = 5
+REQUESTS_TIMEOUT = 10  # Sekunden
+MAX_CONTENT_LENGTH = 5000  # Zeichen
+DEFAULT_TOOL_CACHE_TTL = 3600
+DEFAULT_TOOL_TIMEOUT = 30  # Maximale Laufzeit pro Tool-Aufruf in Sekunden
+TOOL_ERROR_PREFIXES = ("ERROR_FETCHING_URL", "Fehler", "Google-Suche Fehler", "Unerw.")
+MAX_HTML_BYTES = 2 * 1024 * 1024  # Höchstens so viele Bytes einer Webseite werden gelesen
+HTTP_CHUNK_SIZE = 64 * 1024
+HTML_TEXT_OVERSCAN_FACTOR = 3  # Ohne <main>/<article> wird bis zum Dreifachen von MAX_CONTENT_LENGTH gelesen
+# Elemente, deren Inhalt bei der Text-Extraktion übersprungen wird
+HTML_SKIP_TAGS = {'head', 'script', 'style', 'nav', 'header', 'footer', 'aside', 'form',
+                  'button', 'select', 'textarea', 'label', 'svg', 'noscript', 'iframe',
+                  'figure', 'figcaption', 'template'}
+TEXT_FILE_EXTENSIONS = ('.txt', '.py', '.md', '.csv', '.json', '.html', '.css', '.js', '.yaml', '.sh', '.java', '.cpp', '.h', '.cs', '.go', '.rb', '.php')
+UPLOAD_SPILL_THRESHOLD_BYTES = int(os.getenv("UPLOAD_SPILL_THRESHOLD_BYTES") or 2 * 1024 * 1024)  # Größere Uploads werden auf die Platte ausgelagert
+UPLOAD_SESSION_MEMORY_QUOTA_BYTES = int(os.getenv("UPLOAD_SESSION_MEMORY_QUOTA_BYTES") or 64 * 1024 * 1024)  # Upload-Daten im Speicher pro Sitzung
+UPLOAD_SPILL_DIR = os.getenv("UPLOAD_SPILL_DIR") or None  # None = System-Temp-Verzeichnis
+SEARCH_CHUNK_CHARS = 1200  # Zielgröße eines Abschnitts im Suchindex der hochgeladenen Dateien
+SEARCH_DEFAULT_TOP_K = 5
+SEARCH_MAX_TOP_K = 20
+BM25_K1 = 1.5
+BM25_B = 0.75
+TEXT_FILE_ENCODINGS = ('utf-8', 'windows-1252', 'latin-1')  # latin-1 dekodiert jede Bytefolge und ist daher der letzte Versuch
+HTML_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+# --- Geteilter HTTP-Client für Web-Tools ---
+class PooledHttpClient:
+    """
+    Thread-sicherer HTTP-Client auf Basis einer geteilten requests.Session: Verbindungen werden pro Host
+    wiederverwendet (höchstens 'max_connections_per_host' gleichzeitig), 429/5xx-Antworten werden mit
+    exponentiellem Backoff (unter Beachtung von Retry-After) wiederholt, und Antworten mit ETag bzw.
+    Last-Modified werden gemerkt, sodass Folgeabrufe als Conditional GET (304 Not Modified) laufen. Gemerkt wird pro
+    URL und Request-Headern (z.B. Accept-Language); jeder Aufrufer erhält ein eigenes Response-Objekt.
+    """
+    def __init__(self, max_connections_per_host: int = 4, max_retries: int = 3, backoff_factor: float = 0.5, max_cached_responses: int = 256):
+        self._session = requests.Session()
+        retry_policy = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=max_connections_per_host, pool_block=True, max_retries=retry_policy)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._validated_responses: OrderedDict[str, requests.Response] = OrderedDict()
+        self._max_cached_responses = max_cached_responses
+        self.not_modified_count = 0
+
+    def get(self, url: str, params: Dict[str, Any] | None = None, headers: Dict[str, str] | None = None, timeout: float = REQUESTS_TIMEOUT, max_bytes: int | None = None, on_chunk: Callable[[bytes], bool] | None = None,
+            accept_response: Callable[[requests.Response], bool] | None = None) -> requests.Response:
+        """
+        GET mit Verbindungs-Pooling, Retries und Conditional-GET-Cache; Signatur wie requests.get.
+        Mit 'max_bytes' bzw. 'on_chunk' wird der Body gestreamt: Es werden höchstens max_bytes gelesen, und
+        on_chunk erhält jeden Block (auch aus dem Cache); gibt on_chunk True zurück, endet das Lesen vorzeitig.
+        Vorzeitig beendete (gekürzte) Antworten werden nicht für Conditional GETs gemerkt. 'accept_response' prüft
+        Status und Header, bevor der Body gelesen wird; bei False wird die Antwort ohne Body zurückgegeben.
+        """
+        request_headers = dict(headers or {})
+        cache_key = json.dumps([requests.Request("GET", url, params=params).prepare().url, sorted((name.lower(), value) for name, value in request_headers.items())])
+        with self._lock:
+            cached_response = self._validated_responses.get(cache_key)
+        if cached_response is not None:
+            if cached_response.headers.get("ETag"):
+                request_headers["If-None-Match"] = cached_response.headers["ETag"]
+            if cached_response.headers.get("Last-Modified"):
+                request_headers["If-Modified-Since"] = cached_response.headers["Last-Modified"]
+        streaming = max_bytes is not None or on_chunk is not None or accept_response is not None
+        response = self._session.get(url, params=params, headers=request_headers, timeout=timeout, stream=streaming)
+        if response.status_code == 304 and cached_response is not None:
+            response.close()
+            with self._lock:
+                self._validated_responses.move_to_end(cache_key)
+                self.not_modified_count += 1
+            if on_chunk and (accept_response is None or accept_response(cached_response)):
+                for chunk in requests.utils.iter_slices(cached_response.content, HTTP_CHUNK_SIZE):
+                    if on_chunk(chunk):
+                        break
+            return self._copy_response(cached_response)
+        if accept_response is not None and not accept_response(response):
+            response.close()
+            response._content = b""
+            response._content_consumed = True
+            return response
+        complete = True
+        if streaming:
+            chunks: List[bytes] = []
+            received_bytes = 0
+            complete = False
+            try:
+                for chunk in response.iter_content(chunk_size=HTTP_CHUNK_SIZE):
+                    if max_bytes is not None and received_bytes + len(chunk) > max_bytes:
+                        chunk = chunk[:max_bytes - received_bytes]
+                    chunks.append(chunk)
+                    received_bytes += len(chunk)
+                    if (on_chunk and on_chunk(chunk)) or (max_bytes is not None and received_bytes >= max_bytes):
+                        break
+                else:
+                    complete = True
+            finally:
+                response.close()
+            # Gelesenen (ggf. gekürzten) Body wie bei stream=False ablegen; iter_content() liefert danach diese Bytes statt des geschlossenen Streams.
+            response._content = b"".join(chunks)
+            response._content_consumed = True
+        if complete and response.ok and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            with self._lock:
+                self._validated_responses[cache_key] = self._copy_response(response)
+                self._validated_responses.move_to_end(cache_key)
+                while len(self._validated_responses) > self._max_cached_responses:
+                    self._validated_responses.popitem(last=False)
+        return response
+
+    @staticmethod
+    def _copy_response(response: requests.Response) -> requests.Response:
+        """Eigenes Response-Objekt mit eigenen Headern; der (unveränderliche) Body wird geteilt."""
+        copied = copy.copy(response)
+        copied.headers = requests.structures.CaseInsensitiveDict(response.headers)
+        return copied
+
+@functools.lru_cache(maxsize=None)
+def get_http_client() -> PooledHttpClient:
+    """Liefert den prozessweit geteilten HTTP-Client (ein Verbindungs-Pool für alle Sessions und Agenten)."""
+    return PooledHttpClient()
+
+# --- Tool-Cache (normalisierte Argumente als Schlüssel) ---
+def normalize_url(url: str) -> str:
+    """Normalisiert eine URL für den Cache-Schlüssel (Schema/Host klein, ohne Fragment, Standard-Port und sortierte Query)."""
+    parsed = urllib.parse.urlsplit(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = (parsed.hostname or "").lower()
+    if parsed.port and (scheme, parsed.port) not in (("http", 80), ("https", 443)):
+        netloc += f":{parsed.port}"
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((scheme, netloc, parsed.path or "/", query, ""))
+
+def normalize_query(query: str) -> str:
+    """Normalisiert Suchanfragen/Begriffe (Whitespace zusammenfassen, Groß-/Kleinschreibung ignorieren)."""
+    return " ".join(query.split()).casefold()
+
+def cached_tool(normalize: Callable[[str], str], ttl: float = DEFAULT_TOOL_CACHE_TTL) -> Callable[[Callable[..., str]], Callable[..., str]]:
+    """
+    Decorator für Tools, deren Ergebnis über den Tool-Cache wiederverwendet werden darf. Der Schlüssel besteht
+    aus Tool-Name und den normalisierten Argumenten; Fehlermeldungen der Tools werden nicht gecacht.
+    """
+    def decorator(func: Callable[..., str]) -> Callable[..., str]:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> str:
+            bound_args = signature.bind(*args, **kwargs)
+            normalized_args = {name: normalize(value) if isinstance(value, str) else value for name, value in bound_args.arguments.items()}
+            key = hashlib.sha256(json.dumps([func.__name__, normalized_args], sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+            cache = get_tool_cache()
+            cached_result = cache.get(key)
+            set_span_attributes(cache_hit=cached_result is not None)
+            if cached_result is not None:
+                return cached_result
+            result = func(*args, **kwargs)
+            if not result.startswith(TOOL_ERROR_PREFIXES):
+                cache.put(key, func.__name__, result, ttl)
+            return result
+        return wrapper
+    return decorator
+
+# --- Tool-Registry ---
+TOOL_SCHEMA_TYPES: Dict[Any, str] = {str: "STRING", int: "INTEGER", float: "NUMBER", bool: "BOOLEAN"}
+
+def parse_tool_docstring(func: Callable) -> Tuple[str, Dict[str, str]]:
+    """
+    Liest Beschreibung und Parameterbeschreibungen aus dem Docstring eines Tools. Die Beschreibung ist der erste
+    Absatz; Parameter stehen in einem Block 'Parameter:' mit Zeilen der Form 'name: Beschreibung'.
+    """
+    description_block, _, params_block = (inspect.getdoc(func) or "").partition("Parameter:")
+    description = " ".join(description_block.strip().split("\n\n")[0].split())
+    param_descriptions: Dict[str, str] = {}
+    for line in params_block.splitlines():
+        if ":" in line:
+            param_name, param_description = line.split(":", 1)
+            param_descriptions[param_name.strip()] = param_description.strip()
+    return description, param_descriptions
+
+def _annotation_schema(annotation: Any, tool_name: str, param_name: str) -> Dict[str, Any]:
+    if annotation in TOOL_SCHEMA_TYPES:
+        return {"type": TOOL_SCHEMA_TYPES[annotation]}
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin is Union and len(args) == 2 and type(None) in args:
+        return {**_annotation_schema(next(arg for arg in args if arg is not type(None)), tool_name, param_name), "nullable": True}
+    if origin is list:
+        return {"type": "ARRAY", "items": _annotation_schema(args[0] if args else str, tool_name, param_name)}
+    raise TypeError(f"Tool '{tool_name}': Parameter '{param_name}' hat keinen unterstützten Typ ({annotation}).")
+
+def build_function_declaration(name: str, func: Callable) -> FunctionDeclaration:
+    """Erzeugt die FunctionDeclaration eines Tools aus Signatur, Typ-Annotationen und Docstring."""
+    description, param_descriptions = parse_tool_docstring(func)
+    type_hints = get_type_hints(func)
+    properties: Dict[str, Any] = {}
+    required: List[str] = []
+    for param_name, param in inspect.signature(func).parameters.items():
+        if param_name not in type_hints:
+            raise TypeError(f"Tool '{name}': Parameter '{param_name}' hat keine Typ-Annotation.")
+        properties[param_name] = _annotation_schema(type_hints[param_name], name, param_name)
+        if param_name in param_descriptions:
+            properties[param_name]["description"] = param_descriptions[param_name]
+        if param.default is inspect.Parameter.empty:
+            required.append(param_name)
+    parameters: Dict[str, Any] = {"type": "OBJECT", "properties": properties}
+    if required:
+        parameters["required"] = required
+    return FunctionDeclaration(name=name, description=description or f"Führt die Aktion '{name}' aus.", parameters=parameters)
+
+class RegisteredTool:
+    """Ein für Agenten aufrufbares Tool mit Laufzeitgrenze, Parallelitätslimit und vorab erzeugter FunctionDeclaration."""
+    def __init__(self, name: str, func: Callable[..., str], timeout: float, max_concurrency: Optional[int], cache_ttl: Optional[float]):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.cache_ttl = cache_ttl  # None = Ergebnisse werden nicht gecacht
+        self.declaration = build_function_declaration(name, func)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def call(self, **kwargs) -> str:
+        """Führt das Tool aus; bei gesetztem max_concurrency warten überzählige Aufrufe (prozessweit) auf einen freien Platz."""
+        if self._semaphore is None:
+            return self.func(**kwargs)
+        with self._semaphore:
+            return self.func(**kwargs)
+
+TOOL_REGISTRY: Dict[str, RegisteredTool] = {}
+
+def register_tool(name: Optional[str] = None, timeout: float = DEFAULT_TOOL_TIMEOUT, max_concurrency: Optional[int] = None, cache_ttl: Optional[float] = None, normalize: Callable[[str], str] = str.strip) -> Callable[[Callable[..., str]], Callable[..., str]]:
+    """
+    Decorator: Registriert eine Funktion als Agenten-Tool. Das Parameter-Schema wird einmalig beim Import aus
+    Typ-Annotationen und Docstring erzeugt; fehlt eine Annotation, schlägt bereits der Import fehl.
+    Mit cache_ttl (Sekunden) werden die Ergebnisse über den Tool-Cache wiederverwendet (Argumente per normalize).
+    """
+    def decorator(func: Callable[..., str]) -> Callable[..., str]:
+        tool_func = cached_tool(normalize, cache_ttl)(func) if cache_ttl is not None else func
+        tool_name = name or func.__name__
+        TOOL_REGISTRY[tool_name] = RegisteredTool(tool_name, tool_func, timeout, max_concurrency, cache_ttl)
+        return tool_func
+    return decorator
+
+@functools.lru_cache(maxsize=None)
+def get_tool_bundle(tool_names: Tuple[str, ...]) -> Optional[Tool]:
+    """Gibt das (gemerkte) Tool-Objekt mit den Deklarationen der genannten, registrierten Tools zurück."""
+    declarations = [TOOL_REGISTRY[tool_name].declaration for tool_name in dict.fromkeys(tool_names) if tool_name in TOOL_REGISTRY]
+    return Tool(function_declarations=declarations) if declarations else None
+
+# --- Streaming-Extraktion von Webseiten-Text ---
+class StreamingTextExtractor:
+    """
+    Extrahiert den sichtbaren Text einer HTML-Seite in einem einzigen Durchlauf, während die Bytes eintreffen.
+    Elemente aus HTML_SKIP_TAGS werden samt Inhalt übersprungen, Text innerhalb von <main>/<article> wird
+    separat gesammelt und bevorzugt (wie zuvor soup.find('main') / soup.find('article')). feed() meldet True,
+    sobald genug Text vorliegt, damit der Download abgebrochen werden kann. Als Parser dient lxml, falls
+    installiert, sonst das inkrementelle html.parser-Modul der Standardbibliothek. 'encoding' ist der Zeichensatz
+    aus dem HTTP-Header (Content-Type); ohne Angabe wird er aus dem Dokument (<meta charset>) bestimmt.
+    """
+    def __init__(self, max_chars: int, encoding: Optional[str] = None):
+        self.max_chars = max_chars
+        self._skip_stack: List[str] = []
+        self._content_depth = 0
+        self._pending_text: List[str] = []
+        self._content_parts: List[str] = []
+        self._content_chars = 0
+        self._all_parts: List[str] = []
+        self._all_chars = 0
+        self.done = False
+        self.encoding = encoding  # Kann bis zum ersten feed() gesetzt werden, z.B. sobald die Antwort-Header vorliegen
+        self._decoder = None
+        self._parser = None
+
+    # Target-Schnittstelle (lxml) bzw. Callbacks von _StdlibHtmlParser
+    def start(self, tag: str, attrib: Any = None) -> None:
+        self._flush_text()
+        tag = tag.lower()
+        if tag == "body":
+            self._skip_stack.clear()  # Nicht geschlossene Elemente aus <head> beenden
+        if tag in HTML_SKIP_TAGS:
+            self._skip_stack.append(tag)
+        elif tag in ("main", "article") and not self._skip_stack:
+            self._content_depth += 1
+
+    def end(self, tag: str) -> None:
+        self._flush_text()
+        tag = tag.lower()
+        if tag in self._skip_stack:
+            # Bis zum passenden Start-Tag zurückspringen, damit nicht geschlossene Elemente den Rest nicht verschlucken.
+            while self._skip_stack and self._skip_stack.pop() != tag:
+                pass
+        elif tag in ("main", "article") and not self._skip_stack and self._content_depth:
+            self._content_depth -= 1
+
+    def data(self, text: str) -> None:
+        if not self._skip_stack:
+            self._pending_text.append(text)
+
+    def close(self) -> None:
+        self._flush_text()
+
+    def _flush_text(self) -> None:
+        # Zusammenhängende Textstücke zwischen zwei Tags bilden einen Textknoten (wie bei BeautifulSoup).
+        if not self._pending_text:
+            return
+        text = "".join(self._pending_text).strip()
+        self._pending_text = []
+        if not text:
+            return
+        self._all_parts.append(text)
+        self._all_chars += len(text)
+        if self._content_depth:
+            self._content_parts.append(text)
+            self._content_chars += len(text)
+        if self._content_chars >= self.max_chars or self._all_chars >= self.max_chars * HTML_TEXT_OVERSCAN_FACTOR:
+            self.done = True
+
+    def feed(self, chunk: bytes) -> bool:
+        """Verarbeitet den nächsten Byte-Block und gibt zurück, ob bereits genug Text gesammelt wurde."""
+        if self.done:
+            return True
+        if self._parser is None:
+            self._parser = self._create_parser(chunk)
+        self._parser.feed(self._decoder.decode(chunk) if self._decoder is not None else chunk)
+        return self.done
+
+    def _create_parser(self, first_chunk: bytes) -> Any:
+        """Legt den Parser beim ersten Block an; der Zeichensatz kommt aus self.encoding oder dem <meta>-Tag des Dokuments."""
+        if lxml_etree is not None:
+            try:
+                return lxml_etree.HTMLParser(target=self, encoding=self.encoding)
+            except LookupError:
+                return lxml_etree.HTMLParser(target=self)
+        encoding = self.encoding
+        if not encoding:
+            charset_match = re.search(rb"""<meta[^>]+charset=["']?([\w\-]+)""", first_chunk[:4096], re.IGNORECASE)
+            encoding = charset_match.group(1).decode("ascii") if charset_match else "utf-8"
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        return _StdlibHtmlParser(self)
+
+    def get_text(self) -> str:
+        """Schließt den Parser ab und liefert den bereinigten Text (bevorzugt aus <main>/<article>)."""
+        try:
+            if self._parser is not None:
+                self._parser.close()
+        except Exception:
+            pass  # lxml meldet bei abgebrochenen Dokumenten ggf. Fehler; der gesammelte Text bleibt gültig.
+        self._flush_text()
+        text = "\n".join(self._content_parts if self._content_parts else self._all_parts)
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        return '\n'.join(chunk for chunk in chunks if chunk)
+
+class _StdlibHtmlParser(HTMLParser):
+    """Fallback-Parser ohne externe Abhängigkeit, der die Events an einen StreamingTextExtractor weiterreicht."""
+    def __init__(self, target: StreamingTextExtractor):
+        super().__init__(convert_charrefs=True)
+        self._target = target
+
+    def handle_starttag(self, tag: str, attrs: Any) -> None:
+        if tag not in HTML_VOID_TAGS:
+            self._target.start(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        self._target.end(tag)
+
+    def handle_data(self, data: str) -> None:
+        self._target.data(data)
+
+    def close(self) -> None:
+        super().close()
+        self._target.close()
+
+# --- Neue Funktion: Custom Google Search (Websuche) ---
+@register_tool(timeout=REQUESTS_TIMEOUT * 2, max_concurrency=4, cache_ttl=24 * 3600, normalize=normalize_query)
+def custom_google_search(query: str) -> str:
+    """
+    Führt eine Google Custom Search durch unter Verwendung der in der .env definierten API-Key und ID.
+
+    Parameter:
+        query: Die Suchanfrage oder URL, die durchsucht werden soll.
+    """
+    if not GOOGLE_CSE_API_KEY or not GOOGLE_CSE_ID:
+        return "Fehler: Google Custom Search API Key oder ID nicht konfiguriert in .env."
+    url_match = re.match(r"^\s*https?://([\w\-\.]+)", query.strip())
+    search_query = f"site:{url_match.group(1)}" if url_match else query.strip()
+    if not search_query:
+        return "Fehler: Leere Suchanfrage erhalten."
+    api_url = "https://www.googleapis.com/customsearch/v1"
+    params = {
+        "key": GOOGLE_CSE_API_KEY,
+        "cx": GOOGLE_CSE_ID,
+        "q": search_query,
+        "num": MAX_RESULTS,
+        "hl": "de",
+        "gl": "de"
+    }
+    try:
+        response = get_http_client().get(api_url, params=params, timeout=REQUESTS_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        items = data.get("items", [])
+        if not items:
+            spelling = data.get("spelling", {}).get("correctedQuery")
+            return f"Keine direkten Ergebnisse für '{search_query}'. Meinten Sie: '{spelling}'?" if spelling else f"Keine Ergebnisse für '{search_query}'."
+        results = f"Suchergebnisse '{search_query}' ({len(items)}):\n\n" + "\n\n".join(
+            f"{i+1}. Title: {item.get('title','?')}\n   Link: {item.get('link','?')}\n   Beschreibung: {item.get('snippet','?').replace(chr(10),' ').strip()}"
+            for i, item in enumerate(items)
+        )
+        return results.strip()
+    except requests.exceptions.RequestException as e:
+        status = e.response.status_code if e.response else '?'
+        return f"Google-Suche Fehler '{search_query}' (Status: {status}): {e}"
+    except Exception as e:
+        return f"Unerw. Google-Suche Fehler '{search_query}': {type(e).__name__} - {e}"
+
+# --- Upload-Speicher (Dateien werden einmal beim Hochladen dekodiert) ---
+class UploadSpillDirectory:
+    """
+    Temporäres Verzeichnis einer Sitzung für ausgelagerte Uploads. Streamlit kennt kein Ereignis für das Sitzungsende;
+    das Verzeichnis wird daher gelöscht, sobald der Session-State (und damit dieses Objekt) freigegeben wird,
+    spätestens beim Beenden des Prozesses.
+    """
+    def __init__(self):
+        self.path = tempfile.mkdtemp(prefix="workflow_uploads_", dir=UPLOAD_SPILL_DIR)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+
+    def write(self, source: Any, sha256_hash: Any) -> Tuple[str, int]:
+        """Kopiert einen dateiartigen Upload blockweise in das Verzeichnis und gibt (Pfad, Größe) zurück."""
+        file_descriptor, path = tempfile.mkstemp(dir=self.path, suffix=".upload")
+        size = 0
+        source.seek(0)
+        with os.fdopen(file_descriptor, "wb") as target:
+            while chunk := source.read(HTTP_CHUNK_SIZE):
+                sha256_hash.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+        return path, size
+
+    def remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup(self) -> None:
+        self._finalizer()
+
+_UPLOAD_MMAP_LOCK = threading.Lock()
+
+def get_upload_spill_directory() -> UploadSpillDirectory:
+    """Gibt das Auslagerungsverzeichnis der aktuellen Sitzung zurück (wird bei Bedarf angelegt)."""
+    state = run_state()
+    if "upload_spill_dir" not in state:
+        state.upload_spill_dir = UploadSpillDirectory()
+    return state.upload_spill_dir
+
+def _bom_encodings(head: bytes) -> Tuple[str, ...]:
+    if head.startswith(codecs.BOM_UTF8):
+        return ('utf-8-sig',)
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return ('utf-16',)
+    return ()
+
+def detect_text_encoding(file_bytes: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """Dekodiert Dateibytes (BOM, sonst TEXT_FILE_ENCODINGS der Reihe nach) und gibt (Text, Encoding) zurück."""
+    for encoding in _bom_encodings(file_bytes[:4]) + TEXT_FILE_ENCODINGS:
+        try:
+            return file_bytes.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    return None, None
+
+def detect_buffer_encoding(buffer: memoryview) -> Optional[str]:
+    """Wie detect_text_encoding, prüft aber blockweise, ohne den dekodierten Text zu behalten (für ausgelagerte Dateien)."""
+    for encoding in _bom_encodings(bytes(buffer[:4])) + TEXT_FILE_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for offset in range(0, len(buffer), HTTP_CHUNK_SIZE):
+                decoder.decode(buffer[offset:offset + HTTP_CHUNK_SIZE])
+            decoder.decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+def get_file_buffer(file_data: Dict[str, Any]) -> Union[bytes, memoryview]:
+    """
+    Gibt den Inhalt einer hochgeladenen Datei zurück: kleine Dateien direkt als bytes, ausgelagerte Dateien als
+    memoryview auf eine (einmal geöffnete) mmap – ohne den Inhalt in den Speicher zu kopieren.
+    """
+    if file_data.get("bytes") is not None:
+        return file_data["bytes"]
+    if file_data["size"] == 0:
+        return b""
+    with _UPLOAD_MMAP_LOCK:  # Tools paralleler Agenten können gleichzeitig zugreifen
+        if file_data.get("mmap") is None:
+            with open(file_data["path"], "rb") as f:
+                file_data["mmap"] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(file_data["mmap"])
+
+def get_file_bytes(file_data: Dict[str, Any]) -> bytes:
+    """Gibt den Inhalt als bytes zurück (kopiert bei ausgelagerten Dateien – nur nutzen, wo bytes verlangt werden)."""
+    buffer = get_file_buffer(file_data)
+    return buffer if isinstance(buffer, bytes) else bytes(buffer)
+
+def release_upload_entry(file_data: Dict[str, Any]) -> None:
+    """Schließt die mmap einer ausgelagerten Datei und löscht ihre Datei im Auslagerungsverzeichnis."""
+    if file_data.get("mmap") is not None:
+        try:
+            file_data["mmap"].close()
+        except BufferError:
+            return  # Noch in Benutzung; das Verzeichnis wird spätestens mit der Sitzung gelöscht
+        file_data["mmap"] = None
+    state = run_state()
+    if file_data.get("path") and "upload_spill_dir" in state:
+        state.upload_spill_dir.remove(file_data["path"])
+
+def build_upload_entry(name: str, mime_type: str, file_bytes: bytes) -> Dict[str, Any]:
+    """
+    Legt den Eintrag einer hochgeladenen Datei an: Rohbytes, SHA-256 und – außer bei Bildern – den einmalig
+    dekodierten Text samt erkanntem Encoding. Gekürzte Ansichten werden später in 'views' gemerkt.
+    """
+    mime_type = mime_type or "application/octet-stream"
+    is_image = mime_type.startswith("image/")
+    text, encoding = None, None
+    if not is_image:
+        with trace_span(f"Dekodieren {name}", "file", file=name, bytes=len(file_bytes)) as span:
+            text, encoding = detect_text_encoding(file_bytes)
+            span.attributes["encoding"] = encoding
+    return {
+        "name": name,
+        "type": mime_type,
+        "size": len(file_bytes),
+        "bytes": file_bytes,
+        "path": None,
+        "mmap": None,
+        "sha256": hashlib.sha256(file_bytes).hexdigest(),
+        "is_image": is_image,
+        "is_text": not is_image and (mime_type.startswith("text/") or name.endswith(TEXT_FILE_EXTENSIONS)),
+        "text": text,
+        "encoding": encoding,
+        "views": {},
+    }
+
+def build_spilled_upload_entry(name: str, mime_type: str, source: Any) -> Dict[str, Any]:
+    """
+    Wie build_upload_entry, lagert die Datei aber in das Auslagerungsverzeichnis der Sitzung aus. Es bleiben nur
+    Metadaten im Speicher; Text wird bei Bedarf aus der mmap dekodiert.
+    """
+    mime_type = mime_type or "application/octet-stream"
+    is_image = mime_type.startswith("image/")
+    sha256_hash = hashlib.sha256()
+    with trace_span(f"Auslagern {name}", "file", file=name, spilled=True) as span:
+        path, size = get_upload_spill_directory().write(source, sha256_hash)
+        span.attributes["bytes"] = size
+    file_data = {
+        "name": name,
+        "type": mime_type,
+        "size": size,
+        "bytes": None,
+        "path": path,
+        "mmap": None,
+        "sha256": sha256_hash.hexdigest(),
+        "is_image": is_image,
+        "is_text": not is_image and (mime_type.startswith("text/") or name.endswith(TEXT_FILE_EXTENSIONS)),
+        "text": None,
+        "encoding": None,
+        "views": {},
+    }
+    if not is_image:
+        file_data["encoding"] = detect_buffer_encoding(get_file_buffer(file_data))
+    return file_data
+
+def upload_memory_usage(file_data: Dict[str, Any]) -> int:
+    """Ungefährer Speicherbedarf eines Eintrags (Rohbytes plus dekodierter Text)."""
+    if file_data.get("bytes") is None:
+        return 0
+    return file_data["size"] + len(file_data.get("text") or "")
+
+def get_file_text(file_data: Dict[str, Any]) -> Optional[str]:
+    """Gibt den vollständigen Text einer Datei zurück (bei ausgelagerten Dateien frisch aus der mmap dekodiert)."""
+    if file_data.get("bytes") is not None or file_data.get("encoding") is None:
+        return file_data.get("text")
+    with trace_span(f"Dekodieren {file_data['name']}", "file", file=file_data["name"], bytes=file_data["size"], spilled=True):
+        return codecs.decode(get_file_buffer(file_data), file_data["encoding"])
+
+def get_file_text_view(file_data: Dict[str, Any], max_chars: Optional[int] = None) -> Tuple[str, bool]:
+    """Gibt den (ggf. auf max_chars gekürzten) Text einer Datei und ob gekürzt wurde zurück; Ansichten werden gemerkt."""
+    views = file_data.setdefault("views", {})
+    view = views.get(max_chars)
+    if view is not None:
+        return view
+    if file_data.get("bytes") is None and file_data.get("encoding") is not None and max_chars is not None:
+        # Ausgelagerte Datei: nur den benötigten Anfang dekodieren (höchstens 4 Bytes pro Zeichen).
+        buffer = get_file_buffer(file_data)
+        prefix_length = min(len(buffer), max_chars * 4)
+        with trace_span(f"Dekodieren {file_data['name']}", "file", file=file_data["name"], bytes=prefix_length, spilled=True):
+            decoder = codecs.getincrementaldecoder(file_data["encoding"])()
+            text = decoder.decode(buffer[:prefix_length], final=prefix_length == len(buffer))
+        view = (text[:max_chars], len(text) > max_chars or prefix_length < len(buffer))
+    else:
+        text = get_file_text(file_data)
+        if text is None:
+            return ("[Dekodierungsfehler]", False)
+        elif max_chars is not None and len(text) > max_chars:
+            view = (text[:max_chars], True)
+        else:
+            view = (text, False)
+        if file_data.get("bytes") is None:
+            return view  # Vollständigen Text ausgelagerter Dateien nicht im Speicher halten
+    views[max_chars] = view
+    return view
+
+def sync_upload_store(uploaded_files: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Übernimmt die Dateien des File-Uploaders in den Upload-Speicher. Bei jedem Streamlit-Rerun liefert der Uploader
+    dieselben Dateien erneut; bereits bekannte Dateien (gleiche file_id bzw. gleicher Name und Größe) werden
+    wiederverwendet statt erneut gehasht und dekodiert.
+    Dateien über UPLOAD_SPILL_THRESHOLD_BYTES oder über dem Speicherkontingent der Sitzung werden auf die Platte ausgelagert.
+    """
+    state = run_state()
+    previous_store = state.get("upload_store", {})
+    new_store: Dict[Any, Dict[str, Any]] = {}
+    entries = []
+    memory_used = 0
+    for uploaded_file in uploaded_files:
+        store_key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+        entry = previous_store.get(store_key)
+        if entry is None or entry["name"] != uploaded_file.name:
+            estimated_memory = uploaded_file.size * (1 if (uploaded_file.type or "").startswith("image/") else 2)
+            if uploaded_file.size > UPLOAD_SPILL_THRESHOLD_BYTES or memory_used + estimated_memory > UPLOAD_SESSION_MEMORY_QUOTA_BYTES:
+                entry = build_spilled_upload_entry(uploaded_file.name, uploaded_file.type, uploaded_file)
+            else:
+                entry = build_upload_entry(uploaded_file.name, uploaded_file.type, uploaded_file.getvalue())
+        memory_used += upload_memory_usage(entry)
+        new_store[store_key] = entry
+        entries.append(entry)
+    for store_key, entry in previous_store.items():
+        if store_key not in new_store:
+            release_upload_entry(entry)
+    state.upload_store = new_store
+    return entries
+
+def load_upload_file(path: str) -> Dict[str, Any]:
+    """Liest eine Datei von der Platte als Upload-Eintrag ein (für Läufe ohne Streamlit-Uploader)."""
+    name = os.path.basename(path)
+    mime_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    with open(path, "rb") as source:
+        if os.fstat(source.fileno()).st_size > UPLOAD_SPILL_THRESHOLD_BYTES:
+            return build_spilled_upload_entry(name, mime_type, source)
+        return build_upload_entry(name, mime_type, source.read())
+
+def get_uploaded_file(filename: str) -> Optional[Dict[str, Any]]:
+    """Sucht eine hochgeladene Datei im Upload-Speicher nach ihrem Namen."""
+    for file_data in run_state().get("uploaded_files_data", []):
+        if file_data["name"] == filename:
+            return file_data
+    return None
+
+# --- Suchindex über hochgeladene Dateien (BM25) ---
+SEARCH_TOKEN_PATTERN = re.compile(r"[^\W_]{2,}")
+
+def tokenize_for_search(text: str) -> List[str]:
+    """Zerlegt Text in klein geschriebene Wörter; snake_case- und camelCase-Bezeichner werden zusätzlich in Teile zerlegt."""
+    tokens = []
+    for word in re.findall(r"\w+", text):
+        parts = [part for piece in word.split("_") for part in re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])|[^\W_\d]+", piece)]
+        if len(parts) > 1:
+            tokens.append(word.lower())
+        tokens.extend(part.lower() for part in parts if SEARCH_TOKEN_PATTERN.fullmatch(part))
+    return tokens
+
+def chunk_text(text: str, chunk_chars: int = SEARCH_CHUNK_CHARS) -> List[Tuple[int, int, int]]:
+    """
+    Teilt Text zeilenweise in Abschnitte von etwa chunk_chars Zeichen. Gibt (Start, Ende, erste Zeilennummer) zurück;
+    einzelne überlange Zeilen werden hart geteilt.
+    """
+    chunks = []
+    start = 0
+    first_line = 1
+    line_number = 1
+    position = 0
+    length = len(text)
+    while position < length:
+        line_end = text.find("\n", position)
+        line_end = length if line_end == -1 else line_end + 1
+        if line_end - start > chunk_chars and position > start:
+            chunks.append((start, position, first_line))
+            start, first_line = position, line_number
+        while line_end - start > chunk_chars:
+            chunks.append((start, start + chunk_chars, first_line))
+            start += chunk_chars
+        position = line_end
+        line_number += 1
+    if start < length:
+        chunks.append((start, length, first_line))
+    return chunks
+
+class UploadSearchIndex:
+    """
+    Invertierter Index über die Abschnitte aller hochgeladenen Textdateien mit BM25-Bewertung.
+    Die Postings eines Terms liegen als NumPy-Arrays vor, sodass eine Anfrage pro Suchbegriff nur eine
+    vektorisierte Rechnung über dessen Postings braucht.
+    """
+    def __init__(self, files: List[Dict[str, Any]]):
+        self.files = files
+        self.chunks: List[Tuple[int, int, int, int]] = []  # (Dateiindex, Start, Ende, erste Zeile)
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        lengths = []
+        for file_index, file_data in enumerate(files):
+            text = get_file_text(file_data) if file_data.get("is_text") else None
+            if not text:
+                continue
+            for start, end, first_line in chunk_text(text):
+                chunk_id = len(self.chunks)
+                self.chunks.append((file_index, start, end, first_line))
+                tokens = tokenize_for_search(text[start:end])
+                lengths.append(len(tokens))
+                term_counts: Dict[str, int] = {}
+                for token in tokens:
+                    term_counts[token] = term_counts.get(token, 0) + 1
+                for term, count in term_counts.items():
+                    chunk_ids, counts = postings.setdefault(term, ([], []))
+                    chunk_ids.append(chunk_id)
+                    counts.append(count)
+        self.chunk_lengths = np.asarray(lengths, dtype=np.float32)
+        average_length = float(self.chunk_lengths.mean()) if lengths else 0.0
+        self.length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.chunk_lengths / max(average_length, 1.0))
+        chunk_count = len(self.chunks)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, (chunk_ids, counts) in postings.items():
+            idf = float(np.log(1 + (chunk_count - len(chunk_ids) + 0.5) / (len(chunk_ids) + 0.5)))
+            self.postings[term] = (np.asarray(chunk_ids, dtype=np.int32), np.asarray(counts, dtype=np.float32), idf)
+
+    def search(self, query: str, top_k: int = SEARCH_DEFAULT_TOP_K, filename: Optional[str] = None) -> List[Tuple[float, int]]:
+        """Gibt die top_k Abschnitte als (Score, Abschnittsindex) zurück, optional auf eine Datei beschränkt."""
+        if not self.chunks:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize_for_search(query)):
+            if term not in self.postings:
+                continue
+            chunk_ids, counts, idf = self.postings[term]
+            scores[chunk_ids] += idf * counts * (BM25_K1 + 1) / (counts + self.length_norm[chunk_ids])
+        if filename is not None:
+            file_indices = np.fromiter((chunk[0] for chunk in self.chunks), dtype=np.int32, count=len(self.chunks))
+            allowed = [index for index, file_data in enumerate(self.files) if file_data["name"] == filename]
+            scores[~np.isin(file_indices, allowed)] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ranked = sorted(candidates.tolist(), key=lambda chunk_id: -scores[chunk_id])
+        return [(float(scores[chunk_id]), chunk_id) for chunk_id in ranked]
+
+    def chunk_text(self, chunk_id: int, texts: Dict[int, str]) -> Tuple[Dict[str, Any], int, str]:
+        """Gibt (Datei, erste Zeile, Text) eines Abschnitts zurück; texts merkt dekodierte Dateitexte für eine Anfrage."""
+        file_index, start, end, first_line = self.chunks[chunk_id]
+        file_data = self.files[file_index]
+        if file_index not in texts:
+            texts[file_index] = get_file_text(file_data) or ""
+        return file_data, first_line, texts[file_index][start:end]
+
+_UPLOAD_INDEX_LOCK = threading.Lock()
+
+def get_upload_search_index() -> UploadSearchIndex:
+    """Gibt den Suchindex der aktuellen Uploads zurück; er wird nur neu gebaut, wenn sich die Dateien ändern."""
+    state = run_state()
+    files = list(state.get("uploaded_files_data", []))
+    index_key = tuple((file_data["name"], file_data["sha256"]) for file_data in files)
+    with _UPLOAD_INDEX_LOCK:
+        cached = state.get("upload_search_index")
+        if cached is None or cached[0] != index_key:
+            cached = (index_key, UploadSearchIndex(files))
+            state.upload_search_index = cached
+    return cached[1]
+
+def retrieve_file_excerpt(file_data: Dict[str, Any], query: str, max_chars: int) -> Optional[str]:
+    """
+    Stellt für eine zu große Datei einen Auszug aus Dateianfang und den zur Anfrage passendsten Abschnitten
+    zusammen (höchstens max_chars Zeichen, in Dateireihenfolge). None, wenn nichts Passendes gefunden wurde.
+    """
+    index = get_upload_search_index()
+    hits = index.search(query, top_k=max(1, max_chars // SEARCH_CHUNK_CHARS), filename=file_data["name"])
+    if not hits:
+        return None
+    head, _ = get_file_text_view(file_data, min(SEARCH_CHUNK_CHARS, max_chars // 4))
+    selected = []
+    used = len(head)
+    texts: Dict[int, str] = {}
+    for _, chunk_id in hits:
+        _, first_line, text = index.chunk_text(chunk_id, texts)
+        if used + len(text) > max_chars:
+            break
+        selected.append((chunk_id, first_line, text))
+        used += len(text)
+    if not selected:
+        return None
+    parts = [head]
+    for _, first_line, text in sorted(selected):
+        parts.append(f"\n[... Abschnitt ab Zeile {first_line} ...]\n{text}")
+    return "".join(parts)
+
+# --- Hilfsfunktionen (Tools für Agenten) ---
+@register_tool(timeout=5)
+def get_current_datetime() -> str:
+    """Gibt das aktuelle Datum und die Uhrzeit im ISO-Format zurück."""
+    return datetime.datetime.now().isoformat()
+
+@register_tool(name="calculator", timeout=10)
+def safe_calculator(expression: str) -> str:
+    """
+    Berechnet sicher einen mathematischen Ausdruck mithilfe von asteval.
+
+    Parameter:
+        expression: Der mathematische Ausdruck, z.B. '5 * (2 + 3)'
+    """
+    try:
+        aeval = Interpreter()
+        result = aeval(expression)
+        if aeval.error:
+            error_msg = ", ".join(err.msg for err in aeval.error)
+            return f"Fehler bei der Berechnung von '{expression}': {error_msg}"
+        if isinstance(result, (int, float, complex)):
+            return f"Das Ergebnis von '{expression}' ist {result}"
+        else:
+            return f"Berechnung von '{expression}' ergab unerwarteten Typ: {type(result).__name__}"
+    except Exception as e:
+        return f"Fehler bei der Berechnung von '{expression}': {e}"
+
+@register_tool(timeout=REQUESTS_TIMEOUT * 2, max_concurrency=8, cache_ttl=6 * 3600, normalize=normalize_url)
+def fetch_url_content(url: str) -> str:
+    """
+    Holt bereinigten Textinhalt einer Webseite.
+
+    Parameter:
+        url: Die vollständige URL der Webseite, die abgerufen werden soll.
+    """
+    try:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'de-DE,de;q=0.9',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'DNT': '1'
+        }
+        extractor = StreamingTextExtractor(MAX_CONTENT_LENGTH)
+
+        def accept_html(response: requests.Response) -> bool:
+            # Status und Inhaltstyp prüfen, bevor der Body geladen wird; ein Zeichensatz im Header hat Vorrang vor <meta>.
+            if not response.ok or 'text/html' not in response.headers.get('Content-Type', '').lower():
+                return False
+            if 'charset=' in response.headers['Content-Type'].lower():
+                extractor.encoding = response.encoding
+            return True
+
+        response = get_http_client().get(url, headers=headers, timeout=REQUESTS_TIMEOUT, max_bytes=MAX_HTML_BYTES, on_chunk=extractor.feed, accept_response=accept_html)
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').lower()
+        if 'text/html' not in content_type:
+            return f"ERROR_FETCHING_URL:{url}\n---\nInhaltstyp ist nicht HTML ({content_type}), Verarbeitung abgebrochen."
+        cleaned_text = extractor.get_text()
+        if not cleaned_text:
+            return f"ERROR_FETCHING_URL:{url}\n---\nKein relevanter Textinhalt nach Bereinigung gefunden."
+        output_prefix = f"CONTENT_FROM_URL:{url}\n---\n"
+        if len(cleaned_text) > MAX_CONTENT_LENGTH:
+            return f"{output_prefix}(Gekürzt)\n{cleaned_text[:MAX_CONTENT_LENGTH]}..."
+        else:
+            return f"{output_prefix}{cleaned_text}"
+    except requests.exceptions.Timeout:
+        return f"ERROR_FETCHING_URL:{url}\n---\nTimeout beim Abrufen der URL nach {REQUESTS_TIMEOUT} Sekunden."
+    except requests.exceptions.RequestException as e:
+        status_code = e.response.status_code if e.response is not None else 'N/A'
+        return f"ERROR_FETCHING_URL:{url}\n---\nNetzwerk-/HTTP-Fehler (Status: {status_code}): {e}"
+    except Exception as e:
+        return f"ERROR_FETCHING_URL:{url}\n---\nUnerwarteter Fehler während der Verarbeitung: {e}"
+
+@register_tool(timeout=REQUESTS_TIMEOUT * 2, max_concurrency=4, cache_ttl=7 * 24 * 3600, normalize=normalize_query)
+def wikipedia_lookup(term: str) -> str:
+    """
+    Sucht einen Begriff auf Wikipedia (Deutsch) und gibt die Zusammenfassung zurück.
+
+    Parameter:
+        term: Der Suchbegriff für Wikipedia.
+    """
+    try:
+        wikipedia.set_lang("de")
+        page = wikipedia.page(term, auto_suggest=True, redirect=True)
+        summary = page.summary
+        if len(summary) > MAX_CONTENT_LENGTH:
+            summary = summary[:MAX_CONTENT_LENGTH] + "..."
+        return f"Wikipedia Zusammenfassung für '{term}':\n{summary}\n(Quelle: {page.url})"
+    except wikipedia.exceptions.PageError:
+        return f"Fehler: Seite für '{term}' nicht auf Wikipedia gefunden."
+    except wikipedia.exceptions.DisambiguationError as e:
+        options = ", ".join(e.options[:5])
+        return f"Fehler: Begriff '{term}' ist mehrdeutig. Mögliche Optionen: {options}..."
+    except Exception as e:
+        return f"Fehler bei der Wikipedia-Suche nach '{term}': {e}"
+
+@register_tool()
+def list_uploaded_files() -> str:
+    """Gibt eine Liste der Namen der aktuell hochgeladenen Dateien zurück."""
+    uploaded_files_data = run_state().get("uploaded_files_data")
+    if uploaded_files_data:
+        filenames = [f["name"] for f in uploaded_files_data]
+        return f"Verfügbare hochgeladene Dateien: {', '.join(filenames)}"
+    else:
+        return "Keine Dateien wurden hochgeladen."
+
+@register_tool()
+def read_specific_file(filename: str) -> str:
+    """
+    Liest den Inhalt einer spezifischen, bereits hochgeladenen Datei.
+
+    Parameter:
+        filename: Der genaue Name der hochgeladenen Datei, die gelesen werden soll.
+    """
+    if not run_state().get("uploaded_files_data"):
+        return f"Fehler: Keine Dateien vorhanden, kann '{filename}' nicht lesen."
+    file_data = get_uploaded_file(filename)
+    if file_data is None:
+        return f"Fehler: Datei '{filename}' wurde nicht unter den hochgeladenen Dateien gefunden."
+    file_type = file_data["type"]
+    if file_data["is_image"]:
+        return f"Datei '{filename}' ist ein Bild ({file_type}) und kann nicht als Text gelesen werden."
+    if not file_data["is_text"]:
+        return f"Datei '{filename}' hat einen unbekannten/nicht-textuellen Typ ({file_type}). Inhalt kann nicht direkt angezeigt werden."
+    if file_data["encoding"] is None:
+        return f"Fehler: Konnte Datei '{filename}' mit gängigen Encodings nicht dekodieren."
+    encoding = file_data["encoding"]
+    content, truncated = get_file_text_view(file_data, MAX_CONTENT_LENGTH * 2)
+    if truncated:
+        return f"Inhalt von '{filename}' (gekürzt, {encoding}):\n{content}...\n[Hinweis: Für gezielte Stellen search_uploaded_files verwenden.]"
+    return f"Inhalt von '{filename}' ({encoding}):\n{content}"
+
+@register_tool()
+def search_uploaded_files(query: str, top_k: int = SEARCH_DEFAULT_TOP_K) -> str:
+    """
+    Durchsucht alle hochgeladenen Textdateien und gibt die zur Anfrage passendsten Abschnitte zurück.
+    Geeignet für große Dateien, die über read_specific_file nur gekürzt lesbar sind.
+
+    Parameter:
+        query: Suchbegriffe, z.B. Funktions-, Klassen- oder Fachbegriffe.
+        top_k: Anzahl der zurückgegebenen Abschnitte (1-20, Standard 5).
+    """
+    if not run_state().get("uploaded_files_data"):
+        return "Keine Dateien wurden hochgeladen."
+    try:
+        top_k = max(1, min(int(top_k), SEARCH_MAX_TOP_K))
+    except (TypeError, ValueError):
+        top_k = SEARCH_DEFAULT_TOP_K
+    index = get_upload_search_index()
+    hits = index.search(query, top_k=top_k)
+    if not hits:
+        return f"Keine passenden Abschnitte für '{query}' in den hochgeladenen Dateien gefunden."
+    results = [f"Top {len(hits)} Abschnitte für '{query}':"]
+    texts: Dict[int, str] = {}
+    for rank, (score, chunk_id) in enumerate(hits, 1):
+        file_data, first_line, text = index.chunk_text(chunk_id, texts)
+        results.append(f"\n--- {rank}. `{file_data['name']}` ab Zeile {first_line} (Score {score:.2f}) ---\n{text.strip()}")
+    return "\n".join(results)
+
+# --- ENDE NEUE TOOLS ---
+
+# --- Tool Registry (Verzeichnis der verfügbaren Tools) - AKTUALISIERT ---
+# Wird aus den per @register_tool registrierten Funktionen gebildet.
+AVAILABLE_TOOLS: Dict[str, Callable] = {tool_name: tool.func for tool_name, tool in TOOL_REGISTRY.items()}